@@ -0,0 +1,249 @@
+import argparse
+import contextlib
+import glob
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from importlib import import_module
+
+import benchmark_model_analysis
+import filter_language
+import json_to_model_analysis
+import model_json_analysis
+import outputs
+import pgn_evals_analysis
+from chart_render import render_jobs, use_headless_backend
+from intervals import add_interval_arguments, interval_settings_from_args
+from profiling import StageProfiler
+
+# File extensions picked up when an input is a directory.
+INPUT_EXTENSIONS = (".json", ".jsonl", ".ndjson")
+
+# Analyses in the order they run for each file. Charts are drawn from the pgn outputs.
+ANALYSES = ("filter", "benchmark", "falcon", "pgn", "model-json", "charts")
+DEPENDENCIES = {"charts": ("pgn",)}
+
+# Heavy modules each analysis loads on first use. They are imported once in the
+# parent before the pool starts, so forked workers inherit them instead of paying
+# the import cost per file.
+TABLE_MODULES = {"benchmark": ("pandas",), "falcon": ("pandas",), "model-json": ("pandas",)}
+CHART_MODULES = ("matplotlib.pyplot", "probability_bar_charts", "evals_pie_charts")
+
+LOG_FILE_NAME = "batch.log"
+
+# Settings shared by every analysis of a batch: whether charts are drawn at all,
+# how many processes each file's charts are rendered across, and whether
+# per-category pies are drawn as one small-multiples grid, the
+# outputs.OutputSettings every output is written with, whether each analysis
+# writes a profile report next to its outputs, the intervals.IntervalSettings
+# of the confidence intervals (None for none), whether the falcon analysis
+# compares every model of each conversation, and whether the benchmark analysis
+# saves a count cube.
+BatchOptions = namedtuple("BatchOptions", ["charts", "chart_workers", "pie_grid", "output_settings", "profile", "intervals", "all_models", "cube"])
+
+
+def run_filter(file_path, output_dir, pgn_dir, options):
+    filter_language.filter_conversations(file_path, output_dir=output_dir, profiler=StageProfiler(options.profile))
+
+
+def run_benchmark(file_path, output_dir, pgn_dir, options):
+    benchmark_model_analysis.run_analysis(
+        file_path, output_dir, charts=options.charts, profiler=StageProfiler(options.profile), intervals=options.intervals, cube=options.cube
+    )
+
+
+def run_falcon(file_path, output_dir, pgn_dir, options):
+    json_to_model_analysis.run_analysis(
+        file_path, output_dir, profiler=StageProfiler(options.profile), intervals=options.intervals, all_models=options.all_models
+    )
+
+
+def run_pgn(file_path, output_dir, pgn_dir, options):
+    pgn_evals_analysis.run_analysis(file_path, output_dir, profiler=StageProfiler(options.profile))
+
+
+def run_model_json(file_path, output_dir, pgn_dir, options):
+    model_json_analysis.run_analysis(file_path, output_dir, charts=options.charts, chart_workers=options.chart_workers, pie_grid=options.pie_grid, profiler=StageProfiler(options.profile))
+
+
+def run_charts(file_path, output_dir, pgn_dir, options):
+    import evals_pie_charts
+    import probability_bar_charts
+
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [
+        probability_bar_charts.prompt_type_chart_job(os.path.join(pgn_dir, "model_break_scenario_by_prompt_type.json"), output_dir),
+        probability_bar_charts.complexity_chart_job(os.path.join(pgn_dir, "probability_complexity_vs_model_break.json"), output_dir),
+    ]
+    error_types = outputs.read_json(os.path.join(pgn_dir, "probability_error_type_vs_prompt_type.json"))
+    jobs.extend(evals_pie_charts.error_type_pie_jobs(error_types, output_dir, options.chart_workers, options.pie_grid))
+    render_jobs(jobs, options.chart_workers)
+
+
+RUNNERS = {
+    "filter": run_filter,
+    "benchmark": run_benchmark,
+    "falcon": run_falcon,
+    "pgn": run_pgn,
+    "model-json": run_model_json,
+    "charts": run_charts,
+}
+
+
+def collect_inputs(patterns):
+    """
+    Expand directories (their JSON/JSONL files, non-recursively), plain paths and
+    glob patterns into a sorted list of input files without duplicates.
+    """
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in os.listdir(pattern) if name.lower().endswith(INPUT_EXTENSIONS)]
+        else:
+            matches = glob.glob(pattern)
+        files.extend(path for path in sorted(matches) if os.path.isfile(path))
+    return list(dict.fromkeys(os.path.abspath(path) for path in files))
+
+
+def output_names(files):
+    """
+    Name each file's output tree after its stem, adding a numeric suffix when
+    files from different directories share one.
+    """
+    names = {}
+    used = set()
+    for path in files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = stem
+        suffix = 2
+        while name in used:
+            name = f"{stem}_{suffix}"
+            suffix += 1
+        used.add(name)
+        names[path] = name
+    return names
+
+
+def resolve_analyses(selected, charts=True):
+    """
+    Add the analyses the selected ones depend on and return them in run order.
+    Without charts, the charts analysis is dropped (its dependencies still run).
+    """
+    wanted = set(selected)
+    for analysis in selected:
+        wanted.update(DEPENDENCIES.get(analysis, ()))
+    if not charts:
+        wanted.discard("charts")
+    return [analysis for analysis in ANALYSES if analysis in wanted]
+
+
+def preload(analyses, charts=True):
+    """
+    Import the heavy modules the analyses will need, once, in this process.
+    With charts, matplotlib is switched to the non-interactive Agg backend first
+    so no chart ever opens a window in batch mode.
+    """
+    modules = [module for analysis in analyses for module in TABLE_MODULES.get(analysis, ())]
+    if charts and any(analysis in ("benchmark", "model-json", "charts") for analysis in analyses):
+        use_headless_backend()
+        modules.extend(CHART_MODULES)
+    for module in dict.fromkeys(modules):
+        import_module(module)
+
+
+def analyze_input(file_path, output_root, analyses, options):
+    """
+    Run the analyses for one file into output_root/<analysis>/.
+    Output of the analyses goes to a log file in output_root so parallel files do
+    not interleave on the console. Returns [(analysis, error message or None)].
+    """
+    os.makedirs(output_root, exist_ok=True)
+    outputs.configure(*options.output_settings)
+    pgn_dir = os.path.join(output_root, "pgn")
+    results = []
+    with open(os.path.join(output_root, LOG_FILE_NAME), "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        for analysis in analyses:
+            print(f"== {analysis}: {file_path}")
+            try:
+                RUNNERS[analysis](file_path, os.path.join(output_root, analysis), pgn_dir, options)
+                results.append((analysis, None))
+            except Exception as e:
+                print(f"Error: {e}")
+                results.append((analysis, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def run_batch(files, output_dir, analyses, options, workers=1):
+    """
+    Run the analyses over every file, one file per worker process.
+    Returns {file_path: [(analysis, error message or None)]}.
+    """
+    names = output_names(files)
+    roots = {path: os.path.join(output_dir, names[path]) for path in files}
+    outcomes = {}
+    if workers <= 1:
+        for path in files:
+            outcomes[path] = analyze_input(path, roots[path], analyses, options)
+            report(path, outcomes[path])
+        return outcomes
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(analyze_input, path, roots[path], analyses, options): path for path in files}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                outcomes[path] = future.result()
+            except Exception as e:
+                # A crashed worker fails every analysis of its file.
+                outcomes[path] = [(analysis, f"{type(e).__name__}: {e}") for analysis in analyses]
+            report(path, outcomes[path])
+    return outcomes
+
+
+def report(file_path, results):
+    failed = [f"{analysis} ({error})" for analysis, error in results if error]
+    status = "failed: " + "; ".join(failed) if failed else "ok"
+    print(f"{file_path}: {status}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the analyses over every JSON/JSONL file in directories or glob patterns, without prompting.")
+    parser.add_argument("inputs", nargs="+", help="Directories, files or glob patterns to process.")
+    parser.add_argument("--analyses", nargs="+", choices=ANALYSES, default=["pgn"], help="Analyses to run on each file (charts also runs pgn).")
+    parser.add_argument("--output-dir", default="batch_output", help="Root of the per-file output trees.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of files processed in parallel.")
+    parser.add_argument("--no-charts", dest="charts", action="store_false", help="Skip every chart and never load matplotlib.")
+    parser.add_argument("--chart-workers", type=int, default=1, help="Number of processes rendering each file's charts.")
+    parser.add_argument("--pie-grid", action="store_true", help="Draw per-category pies as one small-multiples image per file.")
+    parser.add_argument("--all-models", action="store_true", help="Compare every model of each conversation in the falcon analysis.")
+    parser.add_argument("--cube", action="store_true", help="Save a count cube next to each file's benchmark outputs.")
+    parser.add_argument("--profile", action="store_true", help="Write a profile report next to each analysis's outputs.")
+    outputs.add_output_arguments(parser)
+    add_interval_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("No input files found.")
+        return 1
+
+    intervals = interval_settings_from_args(args)
+    analyses = resolve_analyses(args.analyses, args.charts)
+    preload(analyses, args.charts)
+    start_time = time.perf_counter()
+    options = BatchOptions(args.charts, args.chart_workers, args.pie_grid, outputs.OutputSettings(args.compact_json, args.compress, args.columnar), args.profile, intervals, args.all_models, args.cube)
+    outcomes = run_batch(files, args.output_dir, analyses, options, workers=min(args.workers, len(files)))
+    elapsed = time.perf_counter() - start_time
+
+    failed_files = sum(1 for results in outcomes.values() if any(error for _, error in results))
+    print(f"\nProcessed {len(files)} files ({', '.join(analyses)}) in {elapsed:.2f}s; {failed_files} with errors.")
+    print(f"Outputs are saved in: {os.path.abspath(args.output_dir)}")
+    return 1 if failed_files else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,10 +1,31 @@
+import argparse
+import hashlib
 import json
-import pandas as pd
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import os
+from functools import lru_cache
 from pathlib import Path
-import matplotlib.pyplot as plt
 import numpy as np
 
+from categorical import CategoricalColumn, CodedColumn, count_table, first_seen_cells
+from count_cube import CountCube
+from input_cache import cached
+from intervals import add_interval_arguments, failure_intervals, interval_settings_from_args, write_interval_table
+from json_stream import (
+    JSONL_CHUNK_BYTES,
+    is_jsonl,
+    iter_json_element_ranges,
+    iter_json_range_records,
+    iter_json_records,
+    iter_jsonl_records,
+    iter_records,
+    jsonl_byte_ranges,
+)
+from outputs import add_output_arguments, configure_from_args, write_frame_csv, write_json
+from profiling import StageProfiler, add_profile_arguments, profiler_from_args
+
 
 def load_json(file_path):
     """
@@ -21,53 +42,444 @@ def normalize_label(label):
     """
     if not isinstance(label, str):
         return label
+    return _normalize_string(label)
+
+
+@lru_cache(maxsize=4096)
+def _normalize_string(label):
+    # Subject and complexity labels repeat across millions of prompts, so cache them.
     norm = label.lower().strip()
     norm = norm.replace(" ", "_")
     return norm
 
 
-def calculate_failure_percentage(data):
+def subject_key(prompt):
     """
-    For every model in the data, compute the failure percentage as the proportion of evaluations
-    that returned 'yes' (indicating failure). Returns a dict keyed by model ID.
+    Grouping key for the subject distribution.
     """
-    evaluations_by_model = {}
-    
+    return normalize_label(prompt.get("subject", "Unknown"))
+
+
+def complexity_key(prompt):
+    """
+    Grouping key for the complexity distribution.
+    """
+    return normalize_label(prompt.get("complexity", prompt.get("promptEvaluations.complexity", "Unknown")))
+
+
+def prompt_type_key(prompt):
+    """
+    Grouping key for the prompt type axis of the count cube.
+    """
+    return normalize_label(prompt.get("prompt type", "Unknown"))
+
+
+# Group-by specs filled by aggregate_failure_counts. Each spec maps a distribution
+# name to a function that extracts its grouping label from a prompt evaluation;
+# add an entry here to get another {model_id: {label: {'yes': n, 'no': n}}} table.
+GROUP_BY_SPECS = {
+    "subject": subject_key,
+    "complexity": complexity_key,
+}
+
+
+# Axes of the count cube besides model and failure: every distribution's labels
+# plus prompt type, so interactions between them are kept.
+CUBE_SPECS = {**GROUP_BY_SPECS, "prompt_type": prompt_type_key}
+CUBE_FILE_NAME = "count_cube.npz"
+
+
+# Sharding used by aggregate_file when running with several worker processes.
+SHARDS_PER_WORKER = 4
+MIN_SHARD_BYTES = 1 << 20
+
+# Persisted aggregate state used by --incremental runs.
+STATE_FILE_NAME = "aggregate_state.json"
+STATE_VERSION = 1
+
+# Codes of the failure flag column; any other "model failure" value is rejected.
+FAILURE_CODES = {"no": 0, "yes": 1}
+
+
+def encode_evaluations(data, group_by_specs=GROUP_BY_SPECS):
+    """
+    Ingest the evaluation data in one scan into integer-coded categorical columns.
+    Returns (model_counts, columns) where model_counts is
+    {model_id: {'yes': count, 'total': count}} for the overall failure percentage and
+    columns maps 'model', 'failure' and each spec name to a CodedColumn with one row
+    per (model evaluation, prompt evaluation) pair.
+    """
+    model_counts = {}
+    model_column = CategoricalColumn()
+    failure_column = CategoricalColumn(FAILURE_CODES)
+    label_columns = [(CategoricalColumn(), key_func) for key_func in group_by_specs.values()]
+    # The scan stores one row per evaluation, pointing at its entry's run of prompt
+    # rows; the evaluation x prompt product is expanded with NumPy afterwards.
+    prompt_offsets = array("q")
+    prompt_counts = array("i")
+    prompt_offset = 0
+
     for entry in data:
         model_configs = entry.get("modelConfigs", [])
-        model_evaluations = entry.get("modelEvaluations", [])
-        
+        raw_model_evaluations = entry.get("modelEvaluations", [])
+        prompt_evaluations = entry.get("promptEvaluations", [])
+
+        # Ensure both evaluations are lists.
+        if not isinstance(prompt_evaluations, list):
+            prompt_evaluations = [prompt_evaluations]
+        model_evaluations = raw_model_evaluations
+        if not isinstance(model_evaluations, list):
+            model_evaluations = [model_evaluations]
+
+        # Encode each prompt's labels once per entry rather than once per evaluation.
+        n_prompts = 0
+        if label_columns:
+            prompts = [prompt for prompt in prompt_evaluations if isinstance(prompt, dict)]
+            for column, key_func in label_columns:
+                for prompt in prompts:
+                    column.append(key_func(prompt))
+            n_prompts = len(prompts)
+
+        # Index this entry's evaluations by modelId as we go, so matching them to
+        # model configs below is a dict lookup instead of a rescan per config.
+        evaluation_index = {}
+        index_evaluations = isinstance(raw_model_evaluations, list)
+
+        for eval_entry in model_evaluations:
+            if not isinstance(eval_entry, dict):
+                continue
+            failure_value = eval_entry.get("model failure", "No").strip().lower()
+            model_id = eval_entry.get("modelId", "Unknown")
+
+            if index_evaluations:
+                # [yes, total] for this modelId within the entry.
+                indexed = evaluation_index.get(eval_entry.get("modelId"))
+                if indexed is None:
+                    indexed = evaluation_index[eval_entry.get("modelId")] = [0, 0]
+                indexed[1] += 1
+                if failure_value == "yes":
+                    indexed[0] += 1
+
+            if n_prompts:
+                failure_column.append_code(FAILURE_CODES[failure_value])
+                model_column.append(model_id)
+                prompt_offsets.append(prompt_offset)
+                prompt_counts.append(n_prompts)
+        prompt_offset += n_prompts
+
+        # Overall failure percentage: join model configs to the evaluation index.
         for model in model_configs:
             model_id = model.get("modelId")
             if model_id is None:
                 continue
-            if model_id not in evaluations_by_model:
-                evaluations_by_model[model_id] = []
-            for eval_entry in model_evaluations:
-                if not isinstance(eval_entry, dict):
-                    continue
-                # Use the modelId to match evaluations to model config.
-                eval_model_id = eval_entry.get("modelId")
-                if eval_model_id == model_id:
-                    failure_value = eval_entry.get("model failure", "No")
-                    evaluations_by_model[model_id].append(failure_value.strip().lower())
-    
+            if model_id not in model_counts:
+                model_counts[model_id] = {"yes": 0, "total": 0}
+            indexed = evaluation_index.get(model_id)
+            if indexed:
+                counts = model_counts[model_id]
+                counts["yes"] += indexed[0]
+                counts["total"] += indexed[1]
+
+    # Expand to one row per (evaluation, prompt) pair.
+    repeats = np.frombuffer(prompt_counts, dtype=np.intc).astype(np.intp)
+    eval_rows = np.repeat(np.arange(len(repeats)), repeats)
+    row_starts = np.cumsum(repeats) - repeats
+    prompt_rows = np.frombuffer(prompt_offsets, dtype=np.int64)[eval_rows] + (np.arange(len(eval_rows)) - row_starts[eval_rows])
+
+    columns = {
+        "model": CodedColumn(model_column.codes()[eval_rows], model_column.vocabulary),
+        "failure": CodedColumn(failure_column.codes()[eval_rows], failure_column.vocabulary),
+    }
+    for name, (column, _) in zip(group_by_specs, label_columns):
+        columns[name] = CodedColumn(column.codes()[prompt_rows], column.vocabulary)
+    return model_counts, columns
+
+
+def distribution_from_columns(model_column, label_column, failure_column):
+    """
+    Crosstab coded model, label and failure columns into
+    {model_id: {label: {'yes': count, 'no': count}}}, with models and labels in
+    first-seen order.
+    """
+    sizes = (len(model_column.vocabulary), len(label_column.vocabulary))
+    counts = count_table(
+        (model_column.codes, label_column.codes, failure_column.codes), sizes + (len(FAILURE_CODES),)
+    )
+
+    distribution = {}
+    for model_code, label_code in zip(*first_seen_cells((model_column.codes, label_column.codes), sizes)):
+        cell = counts[model_code, label_code]
+        model_id = model_column.vocabulary[model_code]
+        distribution.setdefault(model_id, {})[label_column.vocabulary[label_code]] = {
+            "yes": int(cell[FAILURE_CODES["yes"]]),
+            "no": int(cell[FAILURE_CODES["no"]]),
+        }
+    return distribution
+
+
+def aggregate_failure_counts(data, group_by_specs=GROUP_BY_SPECS):
+    """
+    Scan the evaluation data once and fill every count table from the same ingest.
+    Returns (model_counts, distributions) where model_counts is
+    {model_id: {'yes': count, 'total': count}} for the overall failure percentage and
+    distributions is {spec_name: {model_id: {label: {'yes': count, 'no': count}}}}.
+    """
+    model_counts, columns = encode_evaluations(data, group_by_specs)
+    return model_counts, distributions_from_columns(columns, group_by_specs)
+
+
+def distributions_from_columns(columns, group_by_specs=GROUP_BY_SPECS):
+    """
+    Build every spec's {model_id: {label: {'yes': count, 'no': count}}} table from coded columns.
+    """
+    return {
+        name: distribution_from_columns(columns["model"], columns[name], columns["failure"])
+        for name in group_by_specs
+    }
+
+
+def load_evaluation_columns(file_path, group_by_specs=GROUP_BY_SPECS, use_cache=False):
+    """
+    Return encode_evaluations(...) for an export file. With use_cache, the coded
+    columns are read (memory-mapped) from the input cache when the file's fingerprint
+    matches, and parsed then cached otherwise.
+    """
+    if not use_cache:
+        return encode_evaluations(iter_records(file_path), group_by_specs)
+
+    def build(path):
+        model_counts, columns = encode_evaluations(iter_records(path), group_by_specs)
+        arrays = {name: column.codes.astype(np.int32) for name, column in columns.items()}
+        meta = {
+            "model_counts": [[model_id, c["yes"], c["total"]] for model_id, c in model_counts.items()],
+            "vocabularies": {name: column.vocabulary for name, column in columns.items()},
+        }
+        return arrays, meta
+
+    arrays, meta = cached(file_path, "benchmark-" + "-".join(group_by_specs), build)
+    model_counts = {model_id: {"yes": yes, "total": total} for model_id, yes, total in meta["model_counts"]}
+    columns = {name: CodedColumn(codes, meta["vocabularies"][name]) for name, codes in arrays.items()}
+    return model_counts, columns
+
+
+def cube_from_columns(model_counts, columns, inputs=()):
+    """
+    Build the (model, subject, complexity, prompt type, failure) CountCube from
+    columns encoded with CUBE_SPECS.
+    """
+    axes = ("model", *CUBE_SPECS, "failure")
+    return CountCube.from_columns({axis: columns[axis] for axis in axes}, model_counts, inputs)
+
+
+def build_count_cube(file_paths, use_cache=False):
+    """
+    Ingest one or more exports into a single CountCube, merging them in the order given.
+    """
+    cubes = []
+    for file_path in file_paths:
+        model_counts, columns = load_evaluation_columns(file_path, CUBE_SPECS, use_cache=use_cache)
+        cubes.append(cube_from_columns(model_counts, columns, [str(file_path)]))
+    return CountCube.merge(cubes)
+
+
+def merge_failure_counts(total, partial):
+    """
+    Add the (model_counts, distributions) result of one aggregate_failure_counts call
+    into another, in place. Models and labels keep first-seen order, so merging
+    chunks in file order gives the same tables as a single scan.
+    """
+    total_model_counts, total_distributions = total
+    partial_model_counts, partial_distributions = partial
+
+    for model_id, counts in partial_model_counts.items():
+        merged = total_model_counts.setdefault(model_id, {"yes": 0, "total": 0})
+        merged["yes"] += counts["yes"]
+        merged["total"] += counts["total"]
+
+    for name, distribution in partial_distributions.items():
+        total_distribution = total_distributions.setdefault(name, {})
+        for model_id, label_counts in distribution.items():
+            model_distribution = total_distribution.setdefault(model_id, {})
+            for label, counts in label_counts.items():
+                merged = model_distribution.setdefault(label, {"yes": 0, "no": 0})
+                for failure_value, count in counts.items():
+                    merged[failure_value] = merged.get(failure_value, 0) + count
+    return total
+
+
+def aggregate_jsonl_range(file_path, start, end, group_by_specs=GROUP_BY_SPECS):
+    """
+    Aggregate the lines of a JSONL file that begin inside the byte range [start, end).
+    """
+    return aggregate_failure_counts(iter_jsonl_records(file_path, start, end), group_by_specs)
+
+
+def aggregate_json_range(file_path, start, end, group_by_specs=GROUP_BY_SPECS):
+    """
+    Aggregate the records of a JSON array or object range from iter_json_element_ranges.
+    """
+    return aggregate_failure_counts(iter_json_range_records(file_path, start, end), group_by_specs)
+
+
+def iter_shard_results(file_path, group_by_specs, pool, workers):
+    """
+    Submit byte-range shards of an export to a process pool and yield their
+    partial count tables in file order. Each worker parses its own range: JSONL
+    files are split at line breaks, JSON arrays and objects between elements.
+    """
+    size = os.path.getsize(file_path)
+    chunk_bytes = min(JSONL_CHUNK_BYTES, max(MIN_SHARD_BYTES, -(-size // (workers * SHARDS_PER_WORKER))))
+    if is_jsonl(file_path):
+        aggregate_range, ranges = aggregate_jsonl_range, jsonl_byte_ranges(file_path, chunk_bytes)
+    else:
+        aggregate_range, ranges = aggregate_json_range, iter_json_element_ranges(file_path, chunk_bytes)
+    futures = [pool.submit(aggregate_range, file_path, start, end, group_by_specs) for start, end in ranges]
+    for future in futures:
+        yield future.result()
+
+
+def aggregate_records(records, group_by_specs=GROUP_BY_SPECS):
+    """
+    Aggregate a stream of records in one process. Records that are already
+    parsed cost about as much to send to a worker as to count, so streams are
+    never handed to a process pool; see aggregate_file for parallel runs.
+    """
+    return aggregate_failure_counts(records, group_by_specs)
+
+
+def aggregate_file(file_path, group_by_specs=GROUP_BY_SPECS, workers=1):
+    """
+    Aggregate an export file with aggregate_failure_counts.
+    JSON files are streamed in one scan; JSONL files are split into byte-range
+    chunks that are parsed and aggregated independently, then merged.
+    With workers > 1 both are split into byte-range shards that the workers
+    parse and aggregate themselves (a JSON array or object is cut between its
+    elements), and the partial count tables are merged in file order, giving
+    the same result as one scan.
+    """
+    total = ({}, {name: {} for name in group_by_specs})
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for partial in iter_shard_results(file_path, group_by_specs, pool, workers):
+                merge_failure_counts(total, partial)
+        return total
+
+    if not is_jsonl(file_path):
+        return aggregate_failure_counts(iter_json_records(file_path), group_by_specs)
+    for start, end in jsonl_byte_ranges(file_path):
+        merge_failure_counts(total, aggregate_jsonl_range(file_path, start, end, group_by_specs))
+    return total
+
+
+def record_key(entry):
+    """
+    Key used to recognise a conversation across deliveries: its conversationId,
+    or a hash of its content when it has none.
+    """
+    conversation_id = entry.get("conversationId")
+    if conversation_id is not None:
+        return str(conversation_id)
+    canonical = json.dumps(entry, sort_keys=True, ensure_ascii=False)
+    return "sha1:" + hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def iter_new_records(records, seen_keys, counted=frozenset()):
+    """
+    Yield only records whose key is not in seen_keys (or in counted), adding each
+    new key to seen_keys as it is yielded so duplicates within the stream are
+    skipped too. counted is only read, so keys of an earlier delivery can be
+    kept apart from those of the current one.
+    """
+    for entry in records:
+        key = record_key(entry)
+        if key in seen_keys or key in counted:
+            continue
+        seen_keys.add(key)
+        yield entry
+
+
+def load_aggregate_state(state_file, group_by_specs=GROUP_BY_SPECS):
+    """
+    Load the count tables and conversation keys persisted by save_aggregate_state.
+    Returns ((model_counts, distributions), seen_keys); empty if the file does not exist.
+    Raises ValueError if the state was built with different group-by specs.
+    """
+    if not os.path.isfile(state_file):
+        return ({}, {name: {} for name in group_by_specs}), set()
+
+    state = load_json(state_file)
+    if state.get("version") != STATE_VERSION or sorted(state.get("distributions", {})) != sorted(group_by_specs):
+        raise ValueError(
+            f"Aggregate state {state_file} does not match the current group-by specs; delete it to rebuild from scratch."
+        )
+
+    # Rows are stored as lists so model ids and labels keep their JSON types.
+    model_counts = {}
+    for model_id, yes, total in state["model_counts"]:
+        model_counts[model_id] = {"yes": yes, "total": total}
+    distributions = {name: {} for name in group_by_specs}
+    for name, rows in state["distributions"].items():
+        for model_id, label, yes, no in rows:
+            distributions[name].setdefault(model_id, {})[label] = {"yes": yes, "no": no}
+    return (model_counts, distributions), set(state["conversation_keys"])
+
+
+def save_aggregate_state(state_file, counts, seen_keys):
+    """
+    Persist raw yes/no count tables and the keys of every conversation counted,
+    so a later run can fold in new records without rereading old ones.
+    """
+    model_counts, distributions = counts
+    state = {
+        "version": STATE_VERSION,
+        "model_counts": [[model_id, c["yes"], c["total"]] for model_id, c in model_counts.items()],
+        "distributions": {
+            name: [
+                [model_id, label, c.get("yes", 0), c.get("no", 0)]
+                for model_id, labels in distribution.items()
+                for label, c in labels.items()
+            ]
+            for name, distribution in distributions.items()
+        },
+        "conversation_keys": sorted(seen_keys),
+    }
+    # Write to a temporary file first so an interrupted run never leaves a truncated state.
+    temp_file = f"{state_file}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(temp_file, state_file)
+    print(f"Aggregate state saved at: {state_file}")
+
+
+def failure_percentages_from_counts(model_counts):
+    """
+    Turn {model_id: {'yes': count, 'total': count}} into rounded failure percentages.
+    Models with a config but no matching evaluations report 0.
+    """
     model_failures = {}
-    for model_id, failures in evaluations_by_model.items():
-        if failures:
-            percent = (failures.count("yes") / len(failures)) * 100
+    for model_id, counts in model_counts.items():
+        if counts["total"]:
+            percent = (counts["yes"] / counts["total"]) * 100
             model_failures[model_id] = round(percent, 2)
         else:
             model_failures[model_id] = 0
     return model_failures
 
 
+def calculate_failure_percentage(data):
+    """
+    For every model in the data, compute the failure percentage as the proportion of evaluations
+    that returned 'yes' (indicating failure). Returns a dict keyed by model ID.
+    """
+    model_counts, _ = aggregate_failure_counts(data, group_by_specs={})
+    return failure_percentages_from_counts(model_counts)
+
+
 def save_failure_percentages_to_json(failure_percentages, output_file):
     """
     Write the overall model failure percentages to a JSON file.
     """
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(failure_percentages, f, indent=4)
+    output_file = write_json(failure_percentages, output_file)
     print(f"Failure percentages JSON saved at: {output_file}")
 
 
@@ -77,35 +489,8 @@ def create_failure_distribution(data):
     Normalize subject labels so that minor variations are combined.
     Returns a dictionary like: {model_id: {subject: {'yes': count, 'no': count}}}.
     """
-    distribution = {}
-    
-    for entry in data:
-        prompt_evaluations = entry.get("promptEvaluations", [])
-        model_evaluations = entry.get("modelEvaluations", [])
-        
-        # Ensure both evaluations are lists.
-        if not isinstance(prompt_evaluations, list):
-            prompt_evaluations = [prompt_evaluations]
-        if not isinstance(model_evaluations, list):
-            model_evaluations = [model_evaluations]
-        
-        for eval_entry in model_evaluations:
-            if not isinstance(eval_entry, dict):
-                continue
-            failure_value = eval_entry.get("model failure", "No").strip().lower()
-            model_id = eval_entry.get("modelId", "Unknown")
-            
-            for prompt in prompt_evaluations:
-                if not isinstance(prompt, dict):
-                    continue
-                # Normalize subject names.
-                subject = normalize_label(prompt.get("subject", "Unknown"))
-                if model_id not in distribution:
-                    distribution[model_id] = {}
-                if subject not in distribution[model_id]:
-                    distribution[model_id][subject] = {"yes": 0, "no": 0}
-                distribution[model_id][subject][failure_value] += 1
-    return distribution
+    _, distributions = aggregate_failure_counts(data, group_by_specs={"subject": subject_key})
+    return distributions["subject"]
 
 
 def create_failure_distribution_by_complexity(data):
@@ -114,34 +499,8 @@ def create_failure_distribution_by_complexity(data):
     Normalize complexity labels.
     Returns: {model_id: {complexity: {'yes': count, 'no': count}}}.
     """
-    distribution = {}
-    
-    for entry in data:
-        prompt_evaluations = entry.get("promptEvaluations", [])
-        model_evaluations = entry.get("modelEvaluations", [])
-        
-        if not isinstance(prompt_evaluations, list):
-            prompt_evaluations = [prompt_evaluations]
-        if not isinstance(model_evaluations, list):
-            model_evaluations = [model_evaluations]
-        
-        for eval_entry in model_evaluations:
-            if not isinstance(eval_entry, dict):
-                continue
-            failure_value = eval_entry.get("model failure", "No").strip().lower()
-            model_id = eval_entry.get("modelId", "Unknown")
-            
-            for prompt in prompt_evaluations:
-                if not isinstance(prompt, dict):
-                    continue
-                complexity = normalize_label(prompt.get("complexity", prompt.get("promptEvaluations.complexity", "Unknown")))
-                if model_id not in distribution:
-                    distribution[model_id] = {}
-                if complexity not in distribution[model_id]:
-                    distribution[model_id][complexity] = {"yes": 0, "no": 0}
-                distribution[model_id][complexity][failure_value] += 1
-                
-    return distribution
+    _, distributions = aggregate_failure_counts(data, group_by_specs={"complexity": complexity_key})
+    return distributions["complexity"]
 
 
 def save_failure_distribution_to_json(distribution, output_file):
@@ -157,8 +516,7 @@ def save_failure_distribution_to_json(distribution, output_file):
             nested_json[model_id]["model failure"][subject] = counts.get("yes", 0)
             nested_json[model_id]["model success"][subject] = counts.get("no", 0)
             
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(nested_json, f, indent=4)
+    output_file = write_json(nested_json, output_file)
     print(f"Nested JSON saved at: {output_file}")
 
 
@@ -198,18 +556,19 @@ def save_failure_distribution_to_csv_subject(distribution, output_csv, output_js
         data_rows[subject] = row
 
     # Create DataFrame with subjects as index in desired order.
+    import pandas as pd
+    
     df = pd.DataFrame.from_dict(data_rows, orient="index")
     model_columns = sorted(models)
     df = df[["Count", "Probability of Model Failure"] + model_columns]
     df.index.name = "Subject"
     
-    df.to_csv(output_csv)
+    output_csv = write_frame_csv(df, output_csv)
     print(f"CSV file (by subject) saved at: {output_csv}")
     
     # Create JSON with subject as key.
     result_json = df.to_dict(orient="index")
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(result_json, f, indent=4)
+    output_json = write_json(result_json, output_json)
     print(f"JSON file (by subject) saved at: {output_json}")
 
 
@@ -240,26 +599,27 @@ def save_failure_distribution_to_csv_complexity(distribution, output_csv, output
         row["Count"] = int(adjusted_count)
         data_rows[comp] = row
 
+    import pandas as pd
+    
     df = pd.DataFrame.from_dict(data_rows, orient="index")
     model_columns = sorted(models)
     df = df[["Count"] + model_columns]
     df.index.name = "Complexity"
     
-    df.to_csv(output_csv)
+    output_csv = write_frame_csv(df, output_csv)
     print(f"CSV file (by complexity) saved at: {output_csv}")
     
     # Create JSON with complexity as key.
     result_json = df.to_dict(orient="index")
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(result_json, f, indent=4)
+    output_json = write_json(result_json, output_json)
     print(f"JSON file (by complexity) saved at: {output_json}")
 
 
-def save_conditional_failure_distribution(distribution, output_csv, output_json, output_chart):
+def conditional_failure_percentages(distribution):
     """
     For each model, calculate the conditional probability of failure for each complexity level
     given that the model failed. Express probabilities as percentages.
-    Create a CSV, JSON, and a stacked bar chart for this data.
+    Returns {model_id: {complexity: percent}} with complexity levels sorted.
     """
     models = list(distribution.keys())
     complexities = set()
@@ -279,18 +639,41 @@ def save_conditional_failure_distribution(distribution, output_csv, output_json,
             counts = distribution.get(model_id, {}).get(comp, {"yes": 0})
             cond_prob = (counts.get("yes", 0) / total_failures * 100) if total_failures > 0 else 0
             conditional_data[model_id][comp] = round(cond_prob, 2)
+    return conditional_data
+
+
+def save_conditional_failure_distribution(distribution, output_csv, output_json, output_chart=None):
+    """
+    Save the conditional failure distribution by complexity (see conditional_failure_percentages)
+    as a CSV, JSON, and (when output_chart is given) a stacked bar chart.
+    Returns the conditional distribution as a DataFrame.
+    """
+    conditional_data = conditional_failure_percentages(distribution)
+
+    import pandas as pd
     
     df = pd.DataFrame.from_dict(conditional_data, orient="index")
     df.index.name = "ModelID"
     
-    df.to_csv(output_csv)
+    output_csv = write_frame_csv(df, output_csv)
     print(f"CSV file (conditional failure by complexity) saved at: {output_csv}")
     
     result_json = df.to_dict(orient="index")
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(result_json, f, indent=4)
+    output_json = write_json(result_json, output_json)
     print(f"JSON file (conditional failure by complexity) saved at: {output_json}")
     
+    if output_chart is not None:
+        save_conditional_failure_chart(df, output_chart)
+    return df
+
+
+def save_conditional_failure_chart(df, output_chart):
+    """
+    Draw the conditional failure distribution DataFrame as a stacked bar chart per model.
+    """
+    # matplotlib is only loaded when a chart is actually drawn.
+    import matplotlib.pyplot as plt
+    
     ax = df.plot(kind="bar", stacked=True, figsize=(10, 6))
     ax.set_xlabel("ModelID")
     ax.set_ylabel("Conditional Probability of Failure (given failure) [%]")
@@ -302,21 +685,95 @@ def save_conditional_failure_distribution(distribution, output_csv, output_json,
     print(f"Bar chart saved at: {output_chart}")
 
 
-def main():
-    # Ask for input file path
-    file_path = input("Enter the full path of the input JSON file: ").strip()
-    
-    # Ensure the file exists
-    if not os.path.isfile(file_path):
-        print("Error: The specified file does not exist.")
-        return
-    
-    # Define the output directory (same location as input file)
-    input_directory = Path(file_path).parent
-    output_directory = input_directory / "benchmarking_data"
+def save_failure_intervals(model_counts, distributions, settings, output_directory):
+    """
+    Write Wilson and bootstrap confidence intervals for every failure percentage:
+    each model overall, and each model within every subject and complexity level.
+    All cells are resampled together in one vectorized batch.
+    """
+    cells = {("overall", model_id, None): (counts["yes"], counts["total"]) for model_id, counts in model_counts.items()}
+    for group_by, distribution in distributions.items():
+        for model_id, groups in distribution.items():
+            for group, counts in groups.items():
+                cells[(group_by, model_id, group)] = (counts.get("yes", 0), counts.get("yes", 0) + counts.get("no", 0))
+    entries = failure_intervals(cells, settings)
+
+    nested = defaultdict(lambda: defaultdict(dict))
+    for (table, model_id, group), entry in entries.items():
+        nested[table][model_id][group] = entry
+    output_file = write_json({model_id: groups[None] for model_id, groups in nested["overall"].items()}, output_directory / "failure_percentages_intervals.json")
+    print(f"Failure percentage intervals saved at: {output_file}")
+    for group_by in distributions:
+        output_json, output_csv = write_interval_table(
+            nested[group_by],
+            output_directory / f"model_failure_intervals_by_{group_by}.json",
+            output_directory / f"model_failure_intervals_by_{group_by}.csv",
+            "ModelID",
+            group_by.capitalize(),
+        )
+        print(f"Failure intervals (by {group_by}) saved at: {output_csv} and {output_json}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compute model failure distributions from a benchmark export.")
+    parser.add_argument("file_path", nargs="?", help="Input JSON or JSONL export (prompted for if omitted).")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes used to aggregate the export.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"Fold only conversations not already counted into the {STATE_FILE_NAME} state kept in benchmarking_data/.",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Read the parsed, coded form of the input from the on-disk input cache (building it on a miss).",
+    )
+    parser.add_argument(
+        "--cube",
+        action="store_true",
+        help=f"Also save a model x subject x complexity x prompt type x failure count cube as {CUBE_FILE_NAME}, from the same scan.",
+    )
+    parser.add_argument(
+        "--no-charts",
+        dest="charts",
+        action="store_false",
+        help="Write the JSON/CSV outputs only, without loading matplotlib.",
+    )
+    add_output_arguments(parser)
+    add_interval_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    # These options pick different ingest paths; reject combinations where one would be silently ignored.
+    if args.incremental and args.cache:
+        parser.error("--cache cannot be combined with --incremental, which only reads conversations not counted before")
+    if args.incremental and args.cube:
+        parser.error("--cube cannot be combined with --incremental; the count cube is built from a full scan")
+    if args.workers > 1 and (args.cache or args.cube):
+        parser.error("--workers cannot be combined with --cache or --cube, which encode the input in one process")
+    return args
+
+
+def run_analysis(file_path, output_directory, workers=1, incremental=False, use_cache=False, charts=True, profiler=None, intervals=None, cube=False):
+    """
+    Run the full benchmark analysis for one export and write every output into
+    output_directory; charts=False skips the chart and never imports matplotlib.
+    With intervals (an IntervalSettings), confidence intervals for every failure
+    percentage are written too. With cube, the count cube is built from the same
+    scan and saved next to the outputs. With an enabled StageProfiler, each stage
+    is timed and a profile report is written next to the outputs. Raises
+    ValueError if an incremental state does not match, or if cube or use_cache is
+    combined with incremental.
+    """
+    if cube and incremental:
+        raise ValueError("The count cube is built from a full scan and cannot be combined with --incremental.")
+    if use_cache and incremental:
+        raise ValueError("The input cache cannot be combined with --incremental, which only reads conversations not counted before.")
+    output_directory = Path(output_directory)
+    profiler = profiler or StageProfiler(enabled=False)
+    input_bytes = os.path.getsize(file_path)
 
     # Create the directory if it doesn't exist
-    output_directory.mkdir(exist_ok=True)
+    output_directory.mkdir(parents=True, exist_ok=True)
 
     # Define output file paths within the new directory
     output_failure_json = output_directory / "failure_percentages.json"
@@ -329,28 +786,92 @@ def main():
     output_json_conditional = output_directory / "conditional_failure_distribution.json"
     output_chart = output_directory / "conditional_failure_distribution_chart.png"
 
-    # Load the input JSON
-    data = load_json(file_path)
+    # Records are counted as model evaluations, the unit the count tables are built from.
+    with profiler.stage("parse and aggregate", unit="evaluations") as stage:
+        stage["bytes"] = input_bytes
+        if incremental:
+            # Merge counts for conversations not seen by earlier runs into the saved state
+            state_file = output_directory / STATE_FILE_NAME
+            counts, seen_keys = load_aggregate_state(state_file)
+            previously_counted = len(seen_keys)
+            if workers > 1:
+                print("Warning: --incremental skips conversations counted before as it reads them, in one process; --workers is ignored.")
+            new_records = iter_new_records(iter_records(file_path), seen_keys)
+            merge_failure_counts(counts, aggregate_records(new_records))
+            print(f"Added {len(seen_keys) - previously_counted} new conversations to {previously_counted} already counted.")
+            save_aggregate_state(state_file, counts, seen_keys)
+            model_counts, distributions = counts
+        elif use_cache or cube:
+            # Reuse the cached coded columns of this exact input instead of reparsing it;
+            # the cube's extra prompt type column comes from the same scan
+            specs = CUBE_SPECS if cube else GROUP_BY_SPECS
+            model_counts, columns = load_evaluation_columns(file_path, specs, use_cache=use_cache)
+            distributions = distributions_from_columns(columns)
+        else:
+            # Stream the input JSON (or JSONL) one conversation at a time and fill the
+            # overall, subject and complexity count tables in a single scan
+            model_counts, distributions = aggregate_file(file_path, workers=workers)
+        evaluations = sum(counts["total"] for counts in model_counts.values())
+        stage["records"] = evaluations
+    distribution_subject = distributions["subject"]
+    distribution_complexity = distributions["complexity"]
 
     # Calculate and save overall failure percentages
-    failure_percentages = calculate_failure_percentage(data)
-    print("Failure Percentages by Model ID:")
-    print(json.dumps(failure_percentages, indent=4))
-    save_failure_percentages_to_json(failure_percentages, output_failure_json)
+    with profiler.stage("failure percentages", evaluations, "evaluations"):
+        failure_percentages = failure_percentages_from_counts(model_counts)
+        print("Failure Percentages by Model ID:")
+        print(json.dumps(failure_percentages, indent=4))
+        save_failure_percentages_to_json(failure_percentages, output_failure_json)
 
-    # Create and save distribution data (by subject)
-    distribution_subject = create_failure_distribution(data)
-    save_failure_distribution_to_json(distribution_subject, output_nested_json)
-    save_failure_distribution_to_csv_subject(distribution_subject, output_csv_subject, output_json_subject)
+    # Save distribution data (by subject)
+    with profiler.stage("subject distribution", evaluations, "evaluations"):
+        save_failure_distribution_to_json(distribution_subject, output_nested_json)
+        save_failure_distribution_to_csv_subject(distribution_subject, output_csv_subject, output_json_subject)
 
-    # Create and save distribution data (by complexity)
-    distribution_complexity = create_failure_distribution_by_complexity(data)
-    save_failure_distribution_to_csv_complexity(distribution_complexity, output_csv_complexity, output_json_complexity)
+    # Save distribution data (by complexity)
+    with profiler.stage("complexity distribution", evaluations, "evaluations"):
+        save_failure_distribution_to_csv_complexity(distribution_complexity, output_csv_complexity, output_json_complexity)
 
     # Create and save conditional failure distribution (given failure) by complexity
-    save_conditional_failure_distribution(distribution_complexity, output_csv_conditional, output_json_conditional, output_chart)
+    with profiler.stage("conditional distribution", evaluations, "evaluations"):
+        conditional_df = save_conditional_failure_distribution(distribution_complexity, output_csv_conditional, output_json_conditional)
+    if cube:
+        with profiler.stage("count cube", evaluations, "evaluations"):
+            cube_file = cube_from_columns(model_counts, columns, [str(file_path)]).save(output_directory / CUBE_FILE_NAME)
+            print(f"Count cube saved at: {cube_file}")
+    if intervals is not None:
+        with profiler.stage("intervals", evaluations, "evaluations"):
+            save_failure_intervals(model_counts, distributions, intervals, output_directory)
+    if charts:
+        with profiler.stage("charts"):
+            save_conditional_failure_chart(conditional_df, output_chart)
 
     print(f"\nAll output files are saved in: {output_directory}")
+    report_path = profiler.write_report(output_directory, script="benchmark_model_analysis", input=str(file_path), input_bytes=input_bytes)
+    if report_path:
+        print(f"Profile report saved at: {report_path}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_from_args(args)
+
+    # Ask for input file path
+    file_path = args.file_path or input("Enter the full path of the input JSON file: ").strip()
+    
+    # Ensure the file exists
+    if not os.path.isfile(file_path):
+        print("Error: The specified file does not exist.")
+        return
+    
+    # Define the output directory (same location as input file)
+    output_directory = Path(file_path).parent / "benchmarking_data"
+
+    try:
+        intervals = interval_settings_from_args(args)
+        run_analysis(file_path, output_directory, workers=args.workers, incremental=args.incremental, use_cache=args.cache, charts=args.charts, profiler=profiler_from_args(args), intervals=intervals, cube=args.cube)
+    except ValueError as e:
+        print(f"Error: {e}")
 
 
 if __name__ == "__main__":
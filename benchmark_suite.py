@@ -0,0 +1,298 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import time
+from datetime import datetime, timezone
+
+import benchmark_model_analysis
+import filter_language
+import json_to_model_analysis
+import model_json_analysis
+import pgn_evals_analysis
+
+# Record counts the suite runs at unless told otherwise; 1M and 10M are opt-in.
+DEFAULT_SIZES = ("10k", "100k")
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+# A stage counts as regressed when its throughput drops by more than this
+# fraction relative to the last recorded run of the same stage and size.
+DEFAULT_TOLERANCE = 0.10
+
+HISTORY_FILE_NAME = "benchmark_history.json"
+
+SUBJECTS = ["Math", "math ", "Physics", "Chemistry Lab", "History", "Biology", "Computer Science"]
+COMPLEXITIES = ["Easy", "Medium", "Hard", " hard"]
+MODELS = ["model-a", "model-b", "model-c", "model-d"]
+PROMPT_TYPES = ["Reasoning", "Coding", "Math", "Creative Writing", "Summarization"]
+ERROR_TYPES = ["n/a", "logic", "format", "hallucination", "instruction following"]
+TOPICS = ["chess", "algebra", "geometry", "history", "physics", ""]
+RESPONSES = ["hello world", "plain english answer", "mixé text", "这是中文", "The answer is 42."]
+
+
+def parse_size(text):
+    """Parse a record count such as 10000, 10k or 1M."""
+    text = text.strip().lower()
+    if text[-1:] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def generate_benchmark_export(count, seed=0):
+    """Yield benchmark export entries with modelConfigs, modelEvaluations and promptEvaluations."""
+    rng = random.Random(seed)
+    for i in range(count):
+        models = rng.sample(MODELS, k=rng.randint(1, 3))
+        evaluations = [
+            {"modelId": model, "model failure": rng.choice(["Yes", "No", " no"])}
+            for model in models
+            for _ in range(rng.randint(0, 2))
+        ]
+        prompts = [{"subject": rng.choice(SUBJECTS), "complexity": rng.choice(COMPLEXITIES)} for _ in range(rng.randint(1, 2))]
+        yield {
+            "conversationId": f"c{i}",
+            "modelConfigs": [{"modelId": model} for model in models],
+            "modelEvaluations": evaluations,
+            "promptEvaluations": prompts if rng.random() < 0.8 else prompts[0],
+        }
+
+
+def generate_falcon_conversations(count, seed=0):
+    """Yield A/B conversations with two modelEvaluations, as read by json_to_model_analysis."""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "conversationId": f"c{i}",
+            "promptEvaluations": {"prompt type": rng.choice(PROMPT_TYPES)},
+            "modelEvaluations": [
+                {"model break": rng.choice(["True", "False"]), "error type": rng.choice(ERROR_TYPES)}
+                for _ in range(rng.choice([1, 2, 2, 2]))
+            ],
+        }
+
+
+def generate_pgn_records(count, seed=0):
+    """Yield (id, record) pairs of a PGN-style export keyed by id."""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield f"id{i}", {
+            "prompt_type": rng.choice(PROMPT_TYPES + [""]),
+            "model_break_scenario": rng.choice(["Yes", "no", "", None]),
+            "error_type": rng.choice(ERROR_TYPES[1:] + [""]),
+            "complexity": rng.choice(["easy", "medium", "hard", ""]),
+            "topic": rng.choice(TOPICS),
+        }
+
+
+def generate_filter_conversations(count, seed=0):
+    """Yield conversations with modelResponses, as read by filter_language."""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "conversationId": f"c{i}",
+            "userPrompt": f"prompt {i}",
+            "finalAnswer": "answer",
+            "modelResponses": [{"modelResponse": rng.choice(RESPONSES)} for _ in range(2)],
+            "modelEvaluations": [{"model break": rng.choice(["True", "False"])} for _ in range(rng.randint(1, 3))],
+        }
+
+
+def write_records(records, file_path, keyed=False, jsonl=False):
+    """
+    Stream records to disk as a JSON array (or, with keyed, a JSON object of
+    (key, record) pairs) or as JSONL, without holding them all in memory.
+    """
+    with open(file_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        if jsonl:
+            for record in records:
+                f.write(json.dumps(record[1] if keyed else record, ensure_ascii=False) + "\n")
+            return
+        f.write("{" if keyed else "[")
+        for index, record in enumerate(records):
+            if index:
+                f.write(",")
+            if keyed:
+                f.write(json.dumps(record[0]) + ":" + json.dumps(record[1], ensure_ascii=False))
+            else:
+                f.write(json.dumps(record, ensure_ascii=False))
+        f.write("}" if keyed else "]")
+
+
+# For each input schema: its generator, whether records are keyed by id (a JSON
+# object rather than a list), and the stages timed on a generated file. Every
+# stage is called as stage(file_path, output_dir).
+SCHEMAS = {
+    "benchmark": {
+        "generate": generate_benchmark_export,
+        "keyed": False,
+        "stages": {
+            "aggregate": lambda path, out: benchmark_model_analysis.aggregate_file(path),
+            "full run (no charts)": lambda path, out: benchmark_model_analysis.run_analysis(path, out, charts=False),
+        },
+    },
+    "falcon": {
+        "generate": generate_falcon_conversations,
+        "keyed": False,
+        "stages": {
+            "analyze": lambda path, out: json_to_model_analysis.analyze_file(path),
+            "full run": lambda path, out: json_to_model_analysis.run_analysis(path, out),
+        },
+    },
+    "pgn": {
+        "generate": generate_pgn_records,
+        "keyed": True,
+        "stages": {
+            "pgn distributions": lambda path, out: pgn_evals_analysis.analyze_file(path),
+            "pgn full run": lambda path, out: pgn_evals_analysis.run_analysis(path, out),
+            "model_json encode": lambda path, out: model_json_analysis.load_analysis_columns(path),
+            "model_json full run (no charts)": lambda path, out: model_json_analysis.run_analysis(path, out, charts=False),
+        },
+    },
+    "filter": {
+        "generate": generate_filter_conversations,
+        "keyed": False,
+        "stages": {
+            "filter": lambda path, out: filter_language.filter_conversations(path, output_dir=out),
+        },
+    },
+}
+
+
+def input_file(data_dir, schema, count, seed, jsonl):
+    """
+    Return the generated input for (schema, count, seed), generating it on the
+    first use. Returns (path, seconds spent generating, 0 if reused).
+    """
+    spec = SCHEMAS[schema]
+    # The keyed PGN export is a JSON object; model_json_analysis cannot read it as JSONL.
+    extension = ".jsonl" if jsonl and not spec["keyed"] else ".json"
+    file_path = os.path.join(data_dir, f"{schema}-{count}-s{seed}{extension}")
+    if os.path.isfile(file_path):
+        return file_path, 0.0
+    os.makedirs(data_dir, exist_ok=True)
+    start_time = time.perf_counter()
+    temp_path = file_path + ".tmp"
+    write_records(spec["generate"](count, seed), temp_path, keyed=spec["keyed"], jsonl=extension == ".jsonl")
+    os.replace(temp_path, file_path)
+    return file_path, time.perf_counter() - start_time
+
+
+def time_stage(stage, file_path, output_dir):
+    """Run one stage with its console output suppressed; returns wall-clock seconds."""
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start_time = time.perf_counter()
+        stage(file_path, output_dir)
+        return time.perf_counter() - start_time
+
+
+def run_suite(schemas, sizes, data_dir, seed=0, jsonl=False, repeat=1):
+    """
+    Time every stage of the selected schemas at every size and return one result
+    dict per (schema, stage, size), keeping the best of `repeat` runs.
+    """
+    results = []
+    for count in sizes:
+        for schema in schemas:
+            file_path, generate_seconds = input_file(data_dir, schema, count, seed, jsonl)
+            if generate_seconds:
+                print(f"Generated {count:,} {schema} records in {generate_seconds:.1f}s: {file_path}")
+            output_dir = os.path.join(data_dir, "outputs", f"{schema}-{count}")
+            for stage_name, stage in SCHEMAS[schema]["stages"].items():
+                seconds = min(time_stage(stage, file_path, output_dir) for _ in range(repeat))
+                result = {
+                    "schema": schema,
+                    "stage": stage_name,
+                    "records": count,
+                    "format": os.path.splitext(file_path)[1][1:],
+                    "input_bytes": os.path.getsize(file_path),
+                    "seconds": round(seconds, 4),
+                    "records_per_s": round(count / seconds, 1) if seconds > 0 else None,
+                }
+                results.append(result)
+                print(f"{schema:<10} {stage_name:<32} {count:>11,} {seconds:>9.3f}s {result['records_per_s'] or 0:>14,.0f} rec/s")
+            shutil.rmtree(output_dir, ignore_errors=True)
+    return results
+
+
+def load_history(history_file):
+    if not os.path.isfile(history_file):
+        return []
+    with open(history_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_history(history_file, history):
+    temp_file = history_file + ".tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=4)
+    os.replace(temp_file, history_file)
+
+
+def find_regressions(results, history, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare each result with the latest earlier run of the same schema, stage,
+    size and input format. Returns [(result, previous records_per_s)] for those slower by more than tolerance.
+    """
+    previous = {}
+    for run in history:
+        for result in run["results"]:
+            previous[(result["schema"], result["stage"], result["records"], result.get("format"))] = result["records_per_s"]
+
+    regressions = []
+    for result in results:
+        baseline = previous.get((result["schema"], result["stage"], result["records"], result["format"]))
+        if baseline and result["records_per_s"] and result["records_per_s"] < baseline * (1 - tolerance):
+            regressions.append((result, baseline))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time every analysis stage on synthetic inputs of each schema and track regressions.")
+    parser.add_argument("--schemas", nargs="+", choices=list(SCHEMAS), default=list(SCHEMAS), help="Input schemas to benchmark.")
+    parser.add_argument("--sizes", nargs="+", default=list(DEFAULT_SIZES), help="Record counts, e.g. 10k 100k 1M 10M.")
+    parser.add_argument("--data-dir", default="benchmark_data", help="Where generated inputs are kept and reused between runs.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data generators.")
+    parser.add_argument("--jsonl", action="store_true", help="Generate JSONL inputs instead of JSON arrays (the keyed PGN export stays JSON).")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage; the fastest is kept.")
+    parser.add_argument("--history", default=HISTORY_FILE_NAME, help="JSON file the results are appended to and compared against.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed throughput drop before a stage counts as regressed.")
+    parser.add_argument("--no-record", action="store_true", help="Compare against the history without appending this run to it.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [parse_size(size) for size in args.sizes]
+    # pandas is imported lazily by the analyses; load it up front so its import
+    # time is not charged to whichever stage happens to run first.
+    import pandas  # noqa: F401
+    results = run_suite(args.schemas, sizes, args.data_dir, seed=args.seed, jsonl=args.jsonl, repeat=args.repeat)
+
+    history = load_history(args.history)
+    regressions = find_regressions(results, history, args.tolerance)
+    for result, baseline in regressions:
+        print(
+            f"REGRESSION {result['schema']} / {result['stage']} at {result['records']:,} records: "
+            f"{result['records_per_s']:,.0f} rec/s vs {baseline:,.0f} rec/s before"
+        )
+
+    if not args.no_record:
+        history.append({
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        })
+        save_history(args.history, history)
+        print(f"Results appended to: {args.history}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
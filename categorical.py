@@ -0,0 +1,108 @@
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+# A finished categorical column: a NumPy array of integer codes plus the
+# vocabulary list that maps each code back to its label.
+CodedColumn = namedtuple("CodedColumn", ["codes", "vocabulary"])
+
+
+class CategoricalColumn:
+    """
+    Builder for a column of labels stored as integer codes into a first-seen
+    vocabulary. Rows are appended one at a time during ingest; counting is then
+    done on the finished code arrays with NumPy instead of per-record dict increments.
+    """
+
+    def __init__(self, vocabulary=()):
+        self.vocabulary = []
+        self._index = {}
+        self._codes = array("i")
+        # Bound straight to the array so the ingest loop pays no extra call.
+        self.append_code = self._codes.append
+        for label in vocabulary:
+            self.encode(label)
+
+    def __len__(self):
+        return len(self._codes)
+
+    def encode(self, label):
+        """
+        Return the code for a label, adding it to the vocabulary if it is new.
+        """
+        code = self._index.get(label)
+        if code is None:
+            code = self._index[label] = len(self.vocabulary)
+            self.vocabulary.append(label)
+        return code
+
+    def append(self, label):
+        code = self._index.get(label)
+        if code is None:
+            code = self.encode(label)
+        self._codes.append(code)
+
+    def codes(self):
+        """
+        Return the row codes as a NumPy integer array.
+        """
+        return np.frombuffer(self._codes, dtype=np.intc).astype(np.intp)
+
+    def finish(self):
+        return CodedColumn(self.codes(), self.vocabulary)
+
+
+def count_table(columns, sizes):
+    """
+    Count rows in every cell of the cross product of code arrays.
+    Returns an integer array of shape `sizes`, one axis per column.
+    """
+    sizes = tuple(sizes)
+    if not len(columns[0]):
+        return np.zeros(sizes, dtype=np.int64)
+    flat = np.ravel_multi_index(columns, sizes)
+    return np.bincount(flat, minlength=int(np.prod(sizes))).reshape(sizes)
+
+
+def first_seen_cells(columns, sizes):
+    """
+    Return the occupied cells of the cross product of code arrays as a tuple of
+    coordinate arrays, ordered by the row where each cell first appears.
+    Building dicts in this order reproduces per-record insertion order.
+    """
+    sizes = tuple(sizes)
+    if not len(columns[0]):
+        return tuple(np.empty(0, dtype=np.intp) for _ in sizes)
+    flat = np.ravel_multi_index(columns, sizes)
+    cells, first = np.unique(flat, return_index=True)
+    return np.unravel_index(cells[np.argsort(first, kind="stable")], sizes)
+
+
+def label_mask(column, predicate=bool):
+    """
+    Boolean row mask selecting rows of a CodedColumn whose label satisfies `predicate`.
+    The predicate runs once per vocabulary entry, not once per row.
+    """
+    keep = np.array([predicate(label) for label in column.vocabulary], dtype=bool)
+    return keep[column.codes]
+
+
+def crosstab_dict(row_column, col_column, mask=None):
+    """
+    Count rows of two CodedColumns per (row label, column label) pair as
+    {row_label: {col_label: count}}, with both levels in first-seen order.
+    `mask` optionally selects the rows counted.
+    """
+    rows = row_column.codes
+    cols = col_column.codes
+    if mask is not None:
+        rows = rows[mask]
+        cols = cols[mask]
+    sizes = (len(row_column.vocabulary), len(col_column.vocabulary))
+    counts = count_table((rows, cols), sizes)
+
+    table = {}
+    for row, col in zip(*first_seen_cells((rows, cols), sizes)):
+        table.setdefault(row_column.vocabulary[row], {})[col_column.vocabulary[col]] = int(counts[row, col])
+    return table
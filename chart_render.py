@@ -0,0 +1,48 @@
+import math
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# One chart to draw: a module-level render function (so it can be sent to a
+# worker process) and the arguments it is called with. Render functions save
+# their figure, close it, and return the path written.
+ChartJob = namedtuple("ChartJob", ["render", "args"])
+
+
+def use_headless_backend():
+    """
+    Switch matplotlib to the non-interactive Agg backend, so nothing rendered
+    afterwards can open a window or block in plt.show().
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def render_jobs(jobs, workers=1):
+    """
+    Render chart jobs and return their output paths in job order.
+    With more than one worker the jobs are spread over a process pool whose
+    workers all render on the Agg backend.
+    """
+    jobs = list(jobs)
+    if workers <= 1 or len(jobs) <= 1:
+        return [job.render(*job.args) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=use_headless_backend) as pool:
+        futures = [pool.submit(job.render, *job.args) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def series_jobs(render, items, workers=1):
+    """
+    Split a series of chart items into at most `workers` jobs. Each job calls
+    render(items) on its share, so one figure can be reused across the share.
+    """
+    items = list(items)
+    parts = max(1, min(workers, len(items)))
+    return [ChartJob(render, (items[part::parts],)) for part in range(parts)]
+
+
+def grid_shape(count):
+    """(rows, columns) of the most nearly square grid holding count panels."""
+    columns = max(1, math.ceil(math.sqrt(count)))
+    return max(1, math.ceil(count / columns)), columns
@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from categorical import CategoricalColumn, count_table
+from outputs import add_output_arguments, configure_from_args, write_csv, write_json
+
+# Bump when the layout of saved cubes changes so old files are rejected.
+CUBE_VERSION = 1
+
+# Row index standing in for "never seen" in the first-seen array.
+NEVER_SEEN = np.iinfo(np.int64).max
+
+
+class CountCube:
+    """
+    Counts of every combination of labels along named axes (model, subject,
+    complexity, prompt type, failure for benchmark exports) as one dense NumPy
+    array, plus the first ingest row of each cell so tables built from it keep
+    the first-seen ordering of the analysis outputs. Any marginal or conditional
+    table is a slice and a sum over axes of the array, without rereading exports.
+
+    model_counts holds the overall {model_id: {'yes': count, 'total': count}}
+    counts joined from the model configs, which are not part of any cell.
+    """
+
+    def __init__(self, counts, first_seen, vocabularies, model_counts=None, inputs=()):
+        self.counts = counts
+        self.first_seen = first_seen
+        self.vocabularies = dict(vocabularies)
+        self.axes = tuple(self.vocabularies)
+        self.model_counts = model_counts or {}
+        self.inputs = list(inputs)
+        # Filters arrive as text, so labels are looked up by their string form.
+        self.index = {axis: {str(label): code for code, label in enumerate(labels)} for axis, labels in self.vocabularies.items()}
+
+    @property
+    def rows(self):
+        return int(self.counts.sum())
+
+    @classmethod
+    def from_columns(cls, columns, model_counts=None, inputs=()):
+        """Build a cube from {axis: CodedColumn} of equal length, axes in the given order."""
+        vocabularies = {axis: column.vocabulary for axis, column in columns.items()}
+        sizes = tuple(len(labels) for labels in vocabularies.values())
+        codes = tuple(column.codes for column in columns.values())
+        counts = count_table(codes, sizes)
+        first_seen = np.full(sizes, NEVER_SEEN, dtype=np.int64)
+        if len(codes[0]):
+            cells, first_rows = np.unique(np.ravel_multi_index(codes, sizes), return_index=True)
+            first_seen.ravel()[cells] = first_rows
+        return cls(counts, first_seen, vocabularies, model_counts, inputs)
+
+    @classmethod
+    def merge(cls, cubes):
+        """
+        Add cubes with the same axes into one, in order: vocabularies are joined
+        in first-seen order and each cube's rows count as following the previous ones'.
+        """
+        cubes = list(cubes)
+        axes = cubes[0].axes
+        if any(cube.axes != axes for cube in cubes):
+            raise ValueError("Only cubes with the same axes can be merged.")
+        merged_vocabularies = {axis: CategoricalColumn() for axis in axes}
+        lookups = [
+            [np.array([merged_vocabularies[axis].encode(label) for label in cube.vocabularies[axis]], dtype=np.intp) for axis in axes]
+            for cube in cubes
+        ]
+        sizes = tuple(len(merged_vocabularies[axis].vocabulary) for axis in axes)
+        counts = np.zeros(sizes, dtype=np.int64)
+        first_seen = np.full(sizes, NEVER_SEEN, dtype=np.int64)
+        model_counts = {}
+        offset = 0
+        for cube, lookup in zip(cubes, lookups):
+            # Each lookup maps distinct labels to distinct codes, so the fancy-indexed updates never collide.
+            grid = np.ix_(*lookup)
+            counts[grid] += cube.counts
+            shifted = np.where(cube.first_seen < NEVER_SEEN, cube.first_seen + offset, NEVER_SEEN)
+            first_seen[grid] = np.minimum(first_seen[grid], shifted)
+            offset += cube.rows
+            for model_id, model_count in cube.model_counts.items():
+                total = model_counts.setdefault(model_id, {"yes": 0, "total": 0})
+                total["yes"] += model_count["yes"]
+                total["total"] += model_count["total"]
+        vocabularies = {axis: merged_vocabularies[axis].vocabulary for axis in axes}
+        inputs = [path for cube in cubes for path in cube.inputs]
+        return cls(counts, first_seen, vocabularies, model_counts, inputs)
+
+    def save(self, path):
+        """Write the cube as a compressed .npz file; returns the path written."""
+        meta = {
+            "version": CUBE_VERSION,
+            "vocabularies": self.vocabularies,
+            # Rows are stored as lists so model ids keep their JSON types.
+            "model_counts": [[model_id, c["yes"], c["total"]] for model_id, c in self.model_counts.items()],
+            "inputs": self.inputs,
+        }
+        # Write to a temporary file first so readers never see a truncated cube.
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(f, counts=self.counts, first_seen=self.first_seen, meta=np.array(json.dumps(meta)))
+        os.replace(temp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Read a cube written by save. Raises ValueError if it was written by another version."""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != CUBE_VERSION:
+                raise ValueError(f"Count cube {path} was written by another version; rebuild it.")
+            model_counts = {model_id: {"yes": yes, "total": total} for model_id, yes, total in meta["model_counts"]}
+            return cls(data["counts"], data["first_seen"], meta["vocabularies"], model_counts, meta["inputs"])
+
+    def selection(self, filters=None):
+        """
+        Index arrays, one per axis, of the labels kept by `filters`
+        ({axis: [label, ...]}, labels as text). Unknown labels match nothing.
+        """
+        filters = filters or {}
+        unknown = set(filters) - set(self.axes)
+        if unknown:
+            raise ValueError(f"Unknown axis: {', '.join(sorted(unknown))} (axes: {', '.join(self.axes)})")
+        selected = []
+        for axis in self.axes:
+            if axis not in filters:
+                selected.append(np.arange(len(self.vocabularies[axis])))
+                continue
+            codes = [self.index[axis][str(value)] for value in dict.fromkeys(filters[axis]) if str(value) in self.index[axis]]
+            selected.append(np.array(codes, dtype=np.intp))
+        return selected
+
+    def reduce(self, keep, filters=None):
+        """
+        Sum the filtered cube over every axis not in keep.
+        Returns (counts, first_seen, labels): arrays with one dimension per kept
+        axis, in keep order, and the labels along each of those dimensions.
+        """
+        keep = tuple(keep)
+        unknown = set(keep) - set(self.axes)
+        if unknown:
+            raise ValueError(f"Unknown axis: {', '.join(sorted(unknown))} (axes: {', '.join(self.axes)})")
+        selected = self.selection(filters)
+        grid = np.ix_(*selected)
+        drop = tuple(position for position, axis in enumerate(self.axes) if axis not in keep)
+        remaining = [axis for axis in self.axes if axis in keep]
+        order = [remaining.index(axis) for axis in keep]
+        counts = self.counts[grid].sum(axis=drop).transpose(order)
+        first_seen = self.first_seen[grid].min(axis=drop, initial=NEVER_SEEN).transpose(order)
+        labels = [[self.vocabularies[axis][code] for code in selected[self.axes.index(axis)]] for axis in keep]
+        return counts, first_seen, labels
+
+    def marginal(self, keep, filters=None):
+        """
+        Counts summed over every other axis as a nested dict, one level per kept
+        axis, with the occupied cells in first-seen order.
+        """
+        counts, first_seen, labels = self.reduce(keep, filters)
+        if not labels:
+            return counts.item()
+        return _nested(counts, labels, _seen_cells(first_seen))
+
+    def conditional(self, target, given=(), filters=None):
+        """
+        P(target | given) as percentages, nested by the given axes and then the
+        target axes. Every target cell seen in the selection is listed for every
+        given cell, with 0 where it does not occur.
+        """
+        target, given = tuple(target), tuple(given)
+        if not target:
+            raise ValueError("A conditional table needs at least one target axis.")
+        counts, first_seen, labels = self.reduce(given + target, filters)
+        target_axes = tuple(range(len(given), len(given) + len(target)))
+        totals = counts.sum(axis=target_axes, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            percent = np.round(np.where(totals > 0, counts / totals * 100, 0.0), 2)
+
+        target_seen = first_seen.min(axis=tuple(range(len(given))), initial=NEVER_SEEN)
+        if given:
+            given_seen = first_seen.min(axis=target_axes, initial=NEVER_SEEN)
+            given_cells = [cell for cell in _seen_cells(given_seen) if totals[cell].item() > 0]
+        else:
+            given_cells = [()] if counts.sum() > 0 else []
+        target_cells = _seen_cells(target_seen)
+        cells = [given_cell + target_cell for given_cell in given_cells for target_cell in target_cells]
+        return _nested(percent, labels, cells)
+
+
+def _seen_cells(first_seen):
+    """Index tuples of the occupied cells of a first-seen array, in first-seen order."""
+    occupied = np.nonzero(first_seen < NEVER_SEEN)
+    order = np.argsort(first_seen[occupied], kind="stable")
+    return [tuple(int(index[position]) for index in occupied) for position in order]
+
+
+def _nested(values, labels, cells):
+    """{label: {label: ... value}} of the given cells, one level per dimension."""
+    nested = {}
+    for cell in cells:
+        level = nested
+        for dimension, position in enumerate(cell[:-1]):
+            level = level.setdefault(labels[dimension][position], {})
+        level[labels[-1][cell[-1]]] = values[cell].item()
+    return nested
+
+
+def _rows(nested, depth, prefix=()):
+    """Flatten a nested table into [label, ..., value] rows."""
+    if depth == 0:
+        yield [*prefix, nested]
+        return
+    for label, value in nested.items():
+        yield from _rows(value, depth - 1, prefix + (label,))
+
+
+def parse_filters(expressions):
+    """Turn ['failure=yes', 'subject=math,physics'] into {axis: [label, ...]}."""
+    filters = {}
+    for expression in expressions or ():
+        axis, separator, values = expression.partition("=")
+        if not separator:
+            raise ValueError(f"Filters look like axis=label[,label...], got: {expression}")
+        filters.setdefault(axis.strip(), []).extend(value for value in values.split(",") if value)
+    return filters
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Slice a saved count cube into marginal and conditional tables.")
+    parser.add_argument("cube", help="A count cube (.npz) written by benchmark_model_analysis.py --cube.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("labels", help="List the axes and their labels.")
+    marginal = subparsers.add_parser("marginal", help="Counts over the given axes, summed over the others.")
+    marginal.add_argument("axes", nargs="+", help="Axes to keep, outermost first.")
+    conditional = subparsers.add_parser("conditional", help="P(target axes | given axes) as percentages.")
+    conditional.add_argument("axes", nargs="+", help="Target axes.")
+    conditional.add_argument("--given", nargs="+", default=[], help="Axes to condition on.")
+    for subparser in (marginal, conditional):
+        subparser.add_argument("--where", action="append", metavar="AXIS=LABEL[,LABEL...]", help="Keep only these labels of an axis (repeatable).")
+        subparser.add_argument("--output", help="Write the table to this .json or .csv file instead of printing it.")
+        add_output_arguments(subparser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        cube = CountCube.load(args.cube)
+        if args.command == "labels":
+            print(json.dumps(cube.vocabularies, indent=4))
+            return 0
+        configure_from_args(args)
+        filters = parse_filters(args.where)
+        if args.command == "marginal":
+            table, header = cube.marginal(args.axes, filters), [*args.axes, "count"]
+        else:
+            table, header = cube.conditional(args.axes, args.given, filters), [*args.given, *args.axes, "percent"]
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if not args.output:
+        print(json.dumps(table, indent=4))
+    elif args.output.endswith(".csv"):
+        print(f"Table saved at: {write_csv(args.output, header, _rows(table, len(header) - 1))}")
+    else:
+        print(f"Table saved at: {write_json(table, args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
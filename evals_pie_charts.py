@@ -1,13 +1,8 @@
-import json
+import argparse
 import os
-import matplotlib.pyplot as plt
 
-# Ask for the JSON file path
-file_path = input("Enter the path to the JSON file: ").strip()
-
-# Load the JSON data
-with open(file_path, "r") as file:
-    data = json.load(file)
+from chart_render import ChartJob, grid_shape, render_jobs, series_jobs, use_headless_backend
+from outputs import read_json
 
 # Define a color palette
 colors = [
@@ -15,16 +10,7 @@ colors = [
     "#1ABC9C", "#E67E22", "#D35400", "#C0392B", "#7F8C8D"
 ]
 
-# Output folder
-output_folder = os.path.dirname(file_path)
-
-# Generate a pie chart for each category
-for category, error_types in data.items():
-    labels = list(error_types.keys())
-    values = list(error_types.values())
-
-    # Create pie chart
-    fig, ax = plt.subplots(figsize=(7, 7))
+def _draw_pie(ax, category, labels, values):
     wedges, texts, autotexts = ax.pie(
         values, labels=labels, autopct='%1.1f%%', colors=colors[:len(labels)],
         startangle=140, wedgeprops={'edgecolor': 'black'}
@@ -37,9 +23,87 @@ for category, error_types in data.items():
 
     ax.set_title(f"{category} - Error Breakdown")
 
-    # Save plot
-    output_path = os.path.join(output_folder, f"{category.replace(' ', '_')}_pie.png")
-    plt.savefig(output_path, dpi=300)
-    plt.close()
+def render_error_type_pies(items):
+    """
+    Draw (category, labels, values, output_path) pies one after another on a
+    single figure, clearing its axes between charts instead of building a new figure.
+    """
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(7, 7))
+    output_paths = []
+    for category, labels, values, output_path in items:
+        ax.clear()
+        _draw_pie(ax, category, labels, values)
+
+        # Save plot
+        fig.savefig(output_path, dpi=300)
+        print(f"Pie chart saved: {output_path}")
+        output_paths.append(output_path)
+    plt.close(fig)
+    return output_paths
+
+def render_error_type_pie_grid(items, output_path):
+    """Draw every category's pie as small multiples in one image."""
+    import matplotlib.pyplot as plt
+
+    rows, columns = grid_shape(len(items))
+    fig, axes = plt.subplots(rows, columns, figsize=(7 * columns, 7 * rows), squeeze=False)
+    for ax, (category, labels, values, _) in zip(axes.flat, items):
+        _draw_pie(ax, category, labels, values)
+    for ax in axes.flat[len(items):]:
+        ax.set_axis_off()
+    fig.tight_layout()
+    fig.savefig(output_path, dpi=150)
+    plt.close(fig)
+
+    print(f"Pie chart grid saved: {output_path}")
+    return output_path
+
+def error_type_pie_jobs(data, output_folder, workers=1, grid=False):
+    """
+    Jobs drawing one pie per category of an {category: {error_type: value}} mapping,
+    split across `workers` figures, or one small-multiples grid image when grid is True.
+    """
+    items = []
+    for category, error_types in data.items():
+        labels = list(error_types.keys())
+        values = list(error_types.values())
+        output_path = os.path.join(output_folder, f"{category.replace(' ', '_')}_pie.png")
+        items.append((category, labels, values, output_path))
+    if grid:
+        return [ChartJob(render_error_type_pie_grid, (items, os.path.join(output_folder, "error_breakdown_pies.png")))]
+    return series_jobs(render_error_type_pies, items, workers)
+
+def plot_error_type_pies(file_path, output_folder=None, workers=1, grid=False):
+    """
+    Save one error breakdown pie chart per category of an error type JSON, or a
+    single grid of them. Charts go next to the input file unless output_folder
+    is given, and are rendered across `workers` processes.
+    """
+    # Load the JSON data (a compressed .gz/.zst output is found too)
+    data = read_json(file_path)
+
+    # Output folder
+    output_folder = output_folder or os.path.dirname(file_path)
+
+    # Generate a pie chart for each category
+    return render_jobs(error_type_pie_jobs(data, output_folder, workers, grid), workers)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Error breakdown pie charts from an error type distribution JSON.")
+    parser.add_argument("file_path", nargs="?", help="Input JSON file (prompted for if omitted).")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes rendering charts.")
+    parser.add_argument("--grid", action="store_true", help="Write all pies as one small-multiples image instead of one file per category.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Ask for the JSON file path
+    file_path = args.file_path or input("Enter the path to the JSON file: ").strip()
+    # Pie charts are only ever saved, so render headless.
+    use_headless_backend()
+    plot_error_type_pies(file_path, workers=args.workers, grid=args.grid)
 
-    print(f"Pie chart saved: {output_path}")
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,48 @@
+import argparse
 import json
 import os
 import re
 import csv
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from json_stream import (
+    JSONL_CHUNK_BYTES,
+    is_jsonl,
+    iter_batches,
+    iter_json_array,
+    iter_json_element_ranges,
+    iter_json_range_records,
+    iter_jsonl_records,
+    jsonl_byte_ranges,
+)
+from profiling import StageProfiler, add_profile_arguments, profiler_from_args
+from outputs import RecordTableWriter, add_output_arguments, configure_from_args, json_dumps, open_output_replacing, output_path, settings
+
+CHINESE_PATTERN = re.compile(r'[一-鿿]')
+
+# Conversations classified at a time in one process.
+CLASSIFY_BATCH_SIZE = 2000
+# Byte-range shards of the input handed to each worker process, and their size bounds.
+SHARDS_PER_WORKER = 4
+MIN_SHARD_BYTES = 1 << 20
+MAX_SHARD_BYTES = 16 << 20
 
 def contains_chinese(text):
     """Check if the given text contains any Chinese characters."""
-    return bool(re.search(r'[一-鿿]', text))
+    # Pure-ASCII text, most of our responses, cannot match; isascii() is a cheap C-level check.
+    if text.isascii():
+        return False
+    return CHINESE_PATTERN.search(text) is not None
+
+def has_chinese_response(conversation):
+    """Check if any modelResponse in the conversation contains Chinese characters."""
+    return any(contains_chinese(resp.get("modelResponse", "")) for resp in conversation.get("modelResponses", []))
+
+def classify_batch(conversations):
+    """Return has_chinese_response for each conversation in a batch."""
+    return [has_chinese_response(conversation) for conversation in conversations]
 
 def count_model_breaks(conversations):
     """Count the number of model break instances in a given list of conversations."""
@@ -13,79 +50,214 @@ def count_model_breaks(conversations):
         1 for conversation in conversations for evaluation in conversation.get("modelEvaluations", []) if evaluation.get("model break") == "True"
     )
 
-def filter_conversations(input_file):
-    """Remove conversations where any modelResponse contains Chinese characters and save model break prompts."""
-    try:
-        # Load JSON file
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Ensure the data is a list
-        if not isinstance(data, list):
-            raise ValueError("JSON root should be a list of conversations.")
-        
-        input_count = len(data)
-        removed_conversations = []
-        filtered_data = []
-        model_break_prompts = []
-        
-        # Count total model break instances in input data
-        total_model_breaks_input = count_model_breaks(data)
-        
-        # Process conversations
-        for conversation in data:
-            model_responses = conversation.get("modelResponses", [])
-            if any(contains_chinese(resp.get("modelResponse", "")) for resp in model_responses):
-                removed_conversations.append(conversation)
-            else:
-                filtered_data.append(conversation)
-        
-        output_count = len(filtered_data)
-        
-        # Count total model break instances in filtered data and removed conversations
-        total_model_breaks_filtered = count_model_breaks(filtered_data)
-        total_model_breaks_removed = count_model_breaks(removed_conversations)
-        
-        # Extract model break prompts from removed conversations
-        for conversation in removed_conversations:
-            user_prompt = conversation.get("userPrompt", "")
-            final_answer = conversation.get("finalAnswer", "")
-            model_evaluations = conversation.get("modelEvaluations", [])
-            
-            for evaluation in model_evaluations:
-                if evaluation.get("model break") == "True":
-                    model_break_prompts.append([conversation.get("conversationId", "Unknown"), user_prompt, final_answer])
-        
-        model_break_count = len(model_break_prompts)
-        
-        # Determine output file paths
-        output_file = os.path.join(os.path.dirname(input_file), "filtered_batch.json")
-        csv_file = os.path.join(os.path.dirname(input_file), "model_break_prompts.csv")
-        
-        # Save filtered data
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(filtered_data, f, ensure_ascii=False, indent=4)
-        
-        # Save model break prompts to CSV
-        with open(csv_file, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(["Conversation ID", "User Prompt", "Final Answer"])
-            writer.writerows(model_break_prompts)
+def serialize_conversation(conversation, jsonl, compact=False):
+    """The text ConversationWriter writes for one conversation, without separators."""
+    if jsonl:
+        return json_dumps(conversation) if compact else json.dumps(conversation, ensure_ascii=False)
+    if compact:
+        return json_dumps(conversation)
+    # Each element of an indented array is its own indented dump, shifted one level in.
+    return json.dumps(conversation, ensure_ascii=False, indent=4).replace("\n", "\n    ")
+
+def filter_batch(conversations, jsonl, compact=False, keep_records=False):
+    """
+    Classify a batch of conversations and do the rest of filter_conversations'
+    per-conversation work on it: kept conversations are serialized for the
+    output and removed ones give their model break CSV rows. Returns the texts,
+    rows and counters, which are small to send back from a worker; the kept
+    conversations themselves are only returned with keep_records.
+    """
+    conversations = list(conversations)
+    start_time = time.perf_counter()
+    flags = classify_batch(conversations)
+    result = {
+        "kept": [],
+        "records": [],
+        "rows": [],
+        "conversations": len(conversations),
+        "responses": 0,
+        "breaks_kept": 0,
+        "breaks_removed": 0,
+        "detect_seconds": time.perf_counter() - start_time,
+    }
+    for conversation, has_chinese in zip(conversations, flags):
+        result["responses"] += len(conversation.get("modelResponses", []))
+        model_breaks = count_model_breaks([conversation])
+        if has_chinese:
+            result["breaks_removed"] += model_breaks
+            # Extract model break prompts from removed conversations
+            row = [conversation.get("conversationId", "Unknown"), conversation.get("userPrompt", ""), conversation.get("finalAnswer", "")]
+            result["rows"].extend([row] * model_breaks)
+        else:
+            result["breaks_kept"] += model_breaks
+            result["kept"].append(serialize_conversation(conversation, jsonl, compact))
+            if keep_records:
+                result["records"].append(conversation)
+    return result
+
+def filter_range(input_file, start, end, jsonl, compact=False, keep_records=False):
+    """Parse one byte-range shard of the input and run filter_batch on it, in a worker process."""
+    conversations = iter_jsonl_records(input_file, start, end) if jsonl else iter_json_range_records(input_file, start, end)
+    return filter_batch(conversations, jsonl, compact, keep_records)
+
+def iter_filtered(input_file, jsonl, compact=False, keep_records=False, workers=1):
+    """
+    Yield filter_batch results for the whole input in input order. With workers > 1,
+    the input is split into byte-range shards (at line breaks for JSONL, between
+    elements for a JSON array) that each worker parses, classifies and serializes
+    itself; a bounded number of shards is in flight.
+    """
+    if workers <= 1:
+        # Stream conversations from disk; iter_json_array raises if the root is not a list.
+        conversations = iter_jsonl_records(input_file) if jsonl else iter_json_array(input_file)
+        for batch in iter_batches(conversations, CLASSIFY_BATCH_SIZE):
+            yield filter_batch(batch, jsonl, compact, keep_records)
+        return
+    
+    size = os.path.getsize(input_file)
+    chunk_bytes = min(MAX_SHARD_BYTES, max(MIN_SHARD_BYTES, -(-size // (workers * SHARDS_PER_WORKER))))
+    ranges = jsonl_byte_ranges(input_file, chunk_bytes) if jsonl else iter_json_element_ranges(input_file, chunk_bytes, "[")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(filter_range, input_file, start, end, jsonl, compact, keep_records))
+            if len(pending) >= workers * SHARDS_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+class ConversationWriter:
+    """
+    Write conversations one at a time as a JSON array matching json.dump(..., indent=4), or as JSONL.
+    With compact, the array (or each JSONL line) is written without whitespace.
+    """
+    
+    def __init__(self, f, jsonl, compact=False):
+        self.f = f
+        self.jsonl = jsonl
+        self.compact = compact
+        self.count = 0
+    
+    def write(self, conversation):
+        self.write_text(serialize_conversation(conversation, self.jsonl, self.compact))
+    
+    def write_text(self, text):
+        """Write a conversation already serialized with serialize_conversation."""
+        if self.jsonl:
+            self.f.write(text + "\n")
+        elif self.compact:
+            self.f.write(("[" if self.count == 0 else ",") + text)
+        else:
+            self.f.write(("[\n    " if self.count == 0 else ",\n    ") + text)
+        self.count += 1
+    
+    def close(self):
+        if self.jsonl:
+            return
+        if self.compact:
+            self.f.write("]" if self.count else "[]")
+        else:
+            self.f.write("\n]" if self.count else "[]")
+
+def filter_conversations(input_file, workers=1, output_dir=None, profiler=None):
+    """
+    Remove conversations where any modelResponse contains Chinese characters and save model break prompts.
+    Outputs go next to the input file unless output_dir is given. With an enabled
+    StageProfiler, a profile report is written next to the outputs. Raises if the
+    input cannot be read or would be overwritten by the outputs.
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    input_count = 0
+    response_count = 0
+    total_model_breaks_filtered = 0
+    total_model_breaks_removed = 0
+    model_break_count = 0
+    detect_seconds = 0.0
+    
+    # Determine output file paths
+    jsonl_input = is_jsonl(input_file)
+    output_name = "filtered_batch.jsonl" if jsonl_input else "filtered_batch.json"
+    if output_dir is None:
+        output_dir = os.path.dirname(input_file)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+    output_file = os.path.join(output_dir, output_name)
+    csv_file = os.path.join(output_dir, "model_break_prompts.csv")
+    input_path = os.path.realpath(input_file)
+    if input_path in (os.path.realpath(output_path(output_file)), os.path.realpath(output_path(csv_file))):
+        raise ValueError(f"The input {input_file} would be overwritten by the outputs; choose another output directory.")
+    
+    # Classify each conversation once, update every break counter in the same pass and
+    # write kept conversations and model break rows as we go, so only the current
+    # batch (or the shards in flight with workers) is held in memory.
+    # Detection and writing are interleaved in one streaming pass, so they are one stage.
+    # The outputs only replace earlier ones once the whole input has been processed.
+    with profiler.stage("parse, detect and write", unit="conversations") as stage, \
+            open_output_replacing(output_file) as out, open_output_replacing(csv_file, newline='') as csv_out:
+        stage["bytes"] = os.path.getsize(input_file)
+        compact = settings().compact
+        conversation_writer = ConversationWriter(out, jsonl_input, compact)
+        # The kept conversations also go to a Parquet/Arrow table when one is configured.
+        table_writer = RecordTableWriter(output_file) if settings().columnar else None
+        csv_writer = csv.writer(csv_out)
+        csv_writer.writerow(["Conversation ID", "User Prompt", "Final Answer"])
         
-        print(f"Filtered data saved to: {output_file}")
-        print(f"Model break prompts saved to: {csv_file}")
-        print(f"Number of conversations in input file: {input_count}")
-        print(f"Number of conversations in output file: {output_count}")
-        print(f"Total model break scenarios in input JSON: {total_model_breaks_input}")
-        print(f"Total model break scenarios in filtered JSON: {total_model_breaks_filtered}")
-        print(f"Total model break scenarios in removed conversations: {total_model_breaks_removed}")
-        print(f"Total model break scenarios saved in CSV: {model_break_count}")
-    except Exception as e:
-        print(f"Error processing file: {e}")
+        start_time = time.perf_counter()
+        for batch in iter_filtered(input_file, jsonl_input, compact, table_writer is not None, workers):
+            input_count += batch["conversations"]
+            response_count += batch["responses"]
+            detect_seconds += batch["detect_seconds"]
+            total_model_breaks_removed += batch["breaks_removed"]
+            total_model_breaks_filtered += batch["breaks_kept"]
+            csv_writer.writerows(batch["rows"])
+            model_break_count += len(batch["rows"])
+            for text in batch["kept"]:
+                conversation_writer.write_text(text)
+            for conversation in batch["records"]:
+                table_writer.write(conversation)
+        conversation_writer.close()
+        table_path = table_writer.close() if table_writer else None
+        elapsed = time.perf_counter() - start_time
+        stage["records"] = input_count
+    
+    output_count = conversation_writer.count
+    total_model_breaks_input = total_model_breaks_filtered + total_model_breaks_removed
+    
+    print(f"Filtered data saved to: {output_path(output_file)}")
+    print(f"Model break prompts saved to: {output_path(csv_file)}")
+    if table_path:
+        print(f"Filtered data table saved to: {table_path}")
+    print(f"Number of conversations in input file: {input_count}")
+    print(f"Number of conversations in output file: {output_count}")
+    print(f"Total model break scenarios in input JSON: {total_model_breaks_input}")
+    print(f"Total model break scenarios in filtered JSON: {total_model_breaks_filtered}")
+    print(f"Total model break scenarios in removed conversations: {total_model_breaks_removed}")
+    print(f"Total model break scenarios saved in CSV: {model_break_count}")
+    rate = response_count / elapsed if elapsed > 0 else 0
+    print(f"End-to-end throughput (parse, detect and write): {response_count} responses in {elapsed:.2f}s ({rate:,.0f} responses/s)")
+    # Detection time is summed over the batches, across workers when there are several.
+    rate = response_count / detect_seconds if detect_seconds > 0 else 0
+    print(f"Language detection throughput: {response_count} responses in {detect_seconds:.2f}s of detection ({rate:,.0f} responses/s)")
+    report_path = profiler.write_report(output_dir, script="filter_language", input=str(input_file), input_bytes=stage["bytes"], responses=response_count)
+    if report_path:
+        print(f"Profile report saved to: {report_path}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Remove conversations with Chinese model responses and export model break prompts.")
+    parser.add_argument("file_path", nargs="?", help="Input JSON or JSONL file (prompted for if omitted).")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes used for language detection.")
+    add_output_arguments(parser)
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    input_path = input("Enter the JSON file path: ").strip()
-    if os.path.exists(input_path) and input_path.endswith(".json"):
-        filter_conversations(input_path)
+    args = parse_args()
+    configure_from_args(args)
+    input_path = args.file_path or input("Enter the JSON file path: ").strip()
+    if os.path.exists(input_path) and input_path.endswith((".json", ".jsonl", ".ndjson")):
+        try:
+            filter_conversations(input_path, workers=args.workers, profiler=profiler_from_args(args))
+        except Exception as e:
+            print(f"Error processing file: {e}")
     else:
         print("Invalid file path. Please provide a valid JSON file.")
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Where parsed inputs are cached and how large the cache may grow before the
+# least recently used entries are evicted. Both can be overridden per host.
+DEFAULT_CACHE_DIR = Path(os.environ.get("MLANALYTICS_CACHE_DIR", Path.home() / ".cache" / "mlanalytics"))
+DEFAULT_MAX_BYTES = int(os.environ.get("MLANALYTICS_CACHE_MAX_BYTES", 2 << 30))
+
+# Bump when the layout of cache entries changes so old entries are ignored.
+CACHE_VERSION = 1
+
+FINGERPRINT_INDEX = "fingerprints.json"
+META_FILE = "meta.json"
+
+
+def _content_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_index(cache_dir):
+    index_path = Path(cache_dir) / FINGERPRINT_INDEX
+    if not index_path.is_file():
+        return {}
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def _save_index(cache_dir, index):
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    # Each writer gets its own temporary file, so concurrent runs cannot clobber each other's before the replace.
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=cache_dir, prefix=f"{FINGERPRINT_INDEX}.", suffix=".tmp", delete=False) as f:
+        json.dump(index, f)
+    os.replace(f.name, Path(cache_dir) / FINGERPRINT_INDEX)
+
+
+def file_fingerprint(file_path, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Return {'size', 'mtime_ns', 'sha256'} for a file.
+    The content hash is reused from the last run when size and mtime are unchanged,
+    so unchanged inputs are not reread just to be fingerprinted.
+    """
+    stat = os.stat(file_path)
+    path_key = str(Path(file_path).resolve())
+    index = _load_index(cache_dir)
+
+    known = index.get(path_key)
+    if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+        return known
+
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": _content_hash(file_path)}
+    index[path_key] = fingerprint
+    _save_index(cache_dir, index)
+    return fingerprint
+
+
+def _entry_dir(cache_dir, kind, fingerprint):
+    return Path(cache_dir) / f"{kind}-v{CACHE_VERSION}-{fingerprint['sha256'][:32]}"
+
+
+def _entry_hash(entry):
+    return entry.name.rsplit("-", 1)[-1]
+
+
+def _entry_bytes(entry):
+    try:
+        return sum(path.stat().st_size for path in entry.iterdir())
+    except FileNotFoundError:
+        # Evicted by a concurrent run.
+        return 0
+
+
+def _last_used(entry):
+    try:
+        return (entry / META_FILE).stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def evict(cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Delete least recently used entries until the cache fits in max_bytes, and
+    drop the fingerprints of the inputs they were built from.
+    """
+    cache_dir = Path(cache_dir)
+    if not cache_dir.is_dir():
+        return
+    # Staging directories of stores in progress have a '.' in their name and are left alone.
+    entries = [entry for entry in cache_dir.iterdir() if "." not in entry.name and (entry / META_FILE).is_file()]
+    # meta.json is touched on every hit, so its mtime is the entry's last use.
+    entries.sort(key=_last_used)
+    sizes = {entry: _entry_bytes(entry) for entry in entries}
+    total = sum(sizes.values())
+    evicted = set()
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= sizes[entry]
+        evicted.add(_entry_hash(entry))
+    if not evicted:
+        return
+
+    # Forget the fingerprints of inputs whose arrays are gone, unless another kind of entry still uses them.
+    evicted -= {_entry_hash(entry) for entry in entries if entry.is_dir()}
+    index = _load_index(cache_dir)
+    kept = {path_key: fingerprint for path_key, fingerprint in index.items() if fingerprint["sha256"][:32] not in evicted}
+    if len(kept) != len(index):
+        _save_index(cache_dir, kept)
+
+
+def load_cached(file_path, kind, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Return (arrays, meta) cached for file_path under `kind`, or None on a miss.
+    Arrays are memory-mapped read-only rather than loaded.
+    """
+    fingerprint = file_fingerprint(file_path, cache_dir)
+    entry = _entry_dir(cache_dir, kind, fingerprint)
+    meta_path = entry / META_FILE
+    if not meta_path.is_file():
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        stored = json.load(f)
+    if stored["size"] != fingerprint["size"] or stored["sha256"] != fingerprint["sha256"]:
+        return None
+    arrays = {name: np.load(entry / f"{name}.npy", mmap_mode="r") for name in stored["arrays"]}
+    os.utime(meta_path)
+    return arrays, stored["meta"]
+
+
+def store_cached(file_path, kind, arrays, meta, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Cache NumPy arrays and JSON-serialisable metadata for file_path under `kind`,
+    then evict old entries so the cache stays within max_bytes.
+    """
+    fingerprint = file_fingerprint(file_path, cache_dir)
+    entry = _entry_dir(cache_dir, kind, fingerprint)
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    # Every writer stages into its own directory, so concurrent stores of the same input never share one.
+    staging = Path(tempfile.mkdtemp(dir=cache_dir, prefix=entry.name + "."))
+    try:
+        for name, array in arrays.items():
+            np.save(staging / f"{name}.npy", np.ascontiguousarray(array))
+        with open(staging / META_FILE, "w", encoding="utf-8") as f:
+            json.dump({**fingerprint, "arrays": list(arrays), "meta": meta}, f)
+        try:
+            os.replace(staging, entry)
+        except OSError:
+            # Another process published this entry first; it holds the same content, so keep it.
+            if not (entry / META_FILE).is_file():
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    evict(cache_dir, max_bytes)
+
+
+def cached(file_path, kind, build, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Return (arrays, meta) for file_path, calling build(file_path) -> (arrays, meta)
+    and caching its result on a miss.
+    """
+    hit = load_cached(file_path, kind, cache_dir)
+    if hit is not None:
+        return hit
+    arrays, meta = build(file_path)
+    store_cached(file_path, kind, arrays, meta, cache_dir, max_bytes)
+    return arrays, meta
@@ -0,0 +1,246 @@
+from collections import namedtuple
+from math import lgamma
+from statistics import NormalDist
+
+import numpy as np
+
+from outputs import write_csv, write_json
+
+# Confidence level, number of bootstrap replicates and the seed they are drawn
+# with, shared by every interval table of a run.
+IntervalSettings = namedtuple("IntervalSettings", ["confidence", "replicates", "seed"])
+
+DEFAULT_SETTINGS = IntervalSettings(confidence=0.95, replicates=10000, seed=0)
+
+# Uniform draws held in memory at once while the bootstrap is run block by block.
+BOOTSTRAP_BLOCK = 1 << 24
+
+INTERVAL_FIELDS = ("count", "total", "percent", "wilson_low", "wilson_high", "bootstrap_low", "bootstrap_high")
+
+
+def wilson_intervals(counts, totals, confidence=0.95):
+    """
+    Wilson score intervals for the proportions counts / totals, as (low, high)
+    arrays of proportions. Cells with a zero total get NaN.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    totals = np.asarray(totals, dtype=np.float64)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = counts / totals
+        denominator = 1 + z * z / totals
+        center = (p + z * z / (2 * totals)) / denominator
+        half_width = z / denominator * np.sqrt(p * (1 - p) / totals + z * z / (4 * totals * totals))
+    return center - half_width, center + half_width
+
+
+def _binomial_cdf_table(n, p, below=None):
+    """
+    The binomial CDFs of every (n, p) pair laid end to end, over the support
+    window that holds all but a negligible tail of the mass (mean +- 10 sd + 20).
+    Windows of pairs where `below` (a k per pair) falls under the window start
+    at 0 instead, so the CDF is exact that far into the lower tail.
+    Returns the CDFs, each segment's offset and the k its window starts at.
+    Probabilities are built in log space so large n do not underflow.
+    """
+    spread = 10 * np.sqrt(n * p * (1 - p)) + 20
+    first = np.maximum(np.floor(n * p - spread), 0).astype(np.int64)
+    if below is not None:
+        first = np.where(below < first, 0, first)
+    last = np.minimum(np.ceil(n * p + spread), n).astype(np.int64)
+    sizes = last - first + 1
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    segment = np.repeat(np.arange(len(n)), sizes)
+    k = first[segment] + np.arange(offsets[-1]) - offsets[segment]
+    seg_n = n[segment].astype(np.float64)
+    # Degenerate probabilities put all mass on 0 or n; clipping keeps the logs finite.
+    seg_p = np.clip(p[segment], 1e-300, 1 - 1e-16)
+
+    # log C(n, k): exact at each window start, then a running sum of log((n - k + 1) / k).
+    log_choose_first = np.array([lgamma(a + 1) - lgamma(b + 1) - lgamma(a - b + 1) for a, b in zip(n.tolist(), first.tolist())])
+    steps = np.log(np.maximum(seg_n - k + 1, 1)) - np.log(np.maximum(k, 1))
+    steps[offsets[:-1]] = 0.0
+    cumulative = np.cumsum(steps)
+    log_choose = log_choose_first[segment] + cumulative - np.repeat(cumulative[offsets[:-1]], sizes)
+    pmf = np.exp(log_choose + k * np.log(seg_p) + (seg_n - k) * np.log1p(-seg_p))
+    pmf[(p[segment] == 0) & (k > 0)] = 0.0
+    pmf[(p[segment] == 1) & (k < seg_n)] = 0.0
+
+    # Summed per segment: one running sum across segments would wipe out tail
+    # probabilities far below the segments summed before them.
+    cdf = np.concatenate([np.cumsum(part) for part in np.split(pmf, offsets[1:-1])])
+    cdf[offsets[1:] - 1] = 1.0
+    return cdf, offsets, first
+
+
+def _binomial_quantiles(n, p, *levels):
+    """
+    The smallest k with P(Binomial(n, p) <= k) >= u, for matching arrays n, p and
+    u, for each array u in levels; the CDFs are tabulated once for all of them.
+    """
+    cdf, offsets, first = _binomial_cdf_table(n, p)
+    # Shifting each segment by its index keeps the concatenated CDFs sorted.
+    shifted = cdf + np.repeat(np.arange(len(n)), np.diff(offsets))
+    return [
+        np.minimum(first + np.searchsorted(shifted, u + np.arange(len(n)), side="left") - offsets[:-1], n)
+        for u in levels
+    ]
+
+
+def binomial_cdf(k, n, p):
+    """
+    P(Binomial(n, p) <= k) for matching arrays k, n and p, accurate deep into
+    the lower tail (for p-values). Values of k above the tabulated window get 1.
+    """
+    k = np.asarray(k, dtype=np.int64)
+    n = np.asarray(n, dtype=np.int64)
+    p = np.broadcast_to(np.asarray(p, dtype=np.float64), n.shape)
+    if not n.size:
+        return np.empty(n.shape)
+    flat_k = k.ravel()
+    cdf, offsets, first = _binomial_cdf_table(n.ravel(), p.ravel(), below=flat_k)
+    index = np.clip(offsets[:-1] + flat_k - first, offsets[:-1], offsets[1:] - 1)
+    values = np.where(flat_k < 0, 0.0, cdf[index])
+    return np.where(flat_k >= n.ravel(), 1.0, values).reshape(n.shape)
+
+
+def bootstrap_intervals(counts, confidence=0.95, replicates=10000, seed=0):
+    """
+    Percentile bootstrap intervals for each category's share of its cell, from a
+    (cells, categories) table of counts, as (low, high) arrays of proportions.
+
+    Every cell is resampled as Multinomial(total, counts / total). A category's
+    share in that resample is Binomial(total, share), and a percentile interval
+    only depends on that marginal, so each category is drawn by inverting the
+    binomial CDF at `replicates` uniform draws. Because the inverse CDF is
+    monotone, the percentiles are picked among the uniforms (np.partition)
+    and only those are mapped through the CDF. Cells with a zero total get NaN.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    if counts.ndim != 2:
+        raise ValueError("counts must be a (cells, categories) table")
+    # With two categories the second share is one minus the first in every
+    # resample, so only the first is drawn and its interval is mirrored.
+    drawn = counts[:, :1] if counts.shape[1] == 2 else counts
+    n = np.repeat(counts.sum(axis=1), drawn.shape[1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = np.where(n > 0, drawn.ravel() / n, 0.0)
+
+    # Inverted-CDF percentile ranks (0-based) among the sorted replicates.
+    alpha = (1 - confidence) / 2
+    low_rank = max(int(np.ceil(alpha * replicates)) - 1, 0)
+    high_rank = min(int(np.ceil((1 - alpha) * replicates)) - 1, replicates - 1)
+
+    rng = np.random.default_rng(seed)
+    u_low = np.empty(len(n))
+    u_high = np.empty(len(n))
+    block = max(1, BOOTSTRAP_BLOCK // replicates)
+    for start in range(0, len(n), block):
+        draws = rng.random((min(block, len(n) - start), replicates))
+        draws.partition((low_rank, high_rank), axis=1)
+        u_low[start:start + block] = draws[:, low_rank]
+        u_high[start:start + block] = draws[:, high_rank]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        low, high = (quantile / n for quantile in _binomial_quantiles(n, p, u_low, u_high))
+    low, high = low.reshape(drawn.shape), high.reshape(drawn.shape)
+    if drawn.shape != counts.shape:
+        low, high = np.hstack([low, 1 - high]), np.hstack([high, 1 - low])
+    return low, high
+
+
+def _percent(values):
+    return [None if np.isnan(value) else round(float(value) * 100, 2) for value in values]
+
+
+def count_intervals(counts, settings=DEFAULT_SETTINGS):
+    """
+    Point estimates with Wilson and bootstrap intervals for a (cells, categories)
+    table of counts. Returns one list per cell of {field: value} per category,
+    with percentages rounded to two decimals (None where the cell is empty).
+    """
+    counts = np.asarray(counts, dtype=np.int64).reshape(len(counts), -1)
+    totals = np.broadcast_to(counts.sum(axis=1, keepdims=True), counts.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent = counts / totals
+    wilson_low, wilson_high = wilson_intervals(counts, totals, settings.confidence)
+    bootstrap_low, bootstrap_high = bootstrap_intervals(counts, settings.confidence, settings.replicates, settings.seed)
+
+    columns = [
+        counts.ravel().tolist(),
+        totals.ravel().tolist(),
+        *(_percent(values.ravel()) for values in (percent, wilson_low, wilson_high, bootstrap_low, bootstrap_high)),
+    ]
+    entries = [dict(zip(INTERVAL_FIELDS, values)) for values in zip(*columns)]
+    width = counts.shape[1]
+    return [entries[row * width:(row + 1) * width] for row in range(len(counts))]
+
+
+def category_intervals(table, settings=DEFAULT_SETTINGS, categories=None):
+    """
+    Intervals for each category's share of its cell in a {cell: {category: count}}
+    table, as {cell: {category: entry}}. Categories default to every one seen, in
+    first-seen order; a cell missing a category counts it as 0.
+    """
+    if categories is None:
+        categories = list(dict.fromkeys(category for row in table.values() for category in row))
+    cells = list(table)
+    if not cells or not categories:
+        return {cell: {} for cell in cells}
+    counts = [[table[cell].get(category, 0) for category in categories] for cell in cells]
+    return {
+        cell: dict(zip(categories, entries))
+        for cell, entries in zip(cells, count_intervals(counts, settings))
+    }
+
+
+def failure_intervals(failures_and_totals, settings=DEFAULT_SETTINGS):
+    """
+    Intervals for failure rates from {cell: (failures, total)}, as {cell: entry}.
+    """
+    cells = list(failures_and_totals)
+    if not cells:
+        return {}
+    counts = [[failures, total - failures] for failures, total in failures_and_totals.values()]
+    return {cell: entries[0] for cell, entries in zip(cells, count_intervals(counts, settings))}
+
+
+def write_interval_table(nested, json_path, csv_path, outer_name, inner_name):
+    """
+    Write {outer: {inner: entry}} intervals as JSON, and as a CSV with one row
+    per (outer, inner) pair. Returns the paths written.
+    """
+    rows = (
+        [outer, inner, *(entry[field] for field in INTERVAL_FIELDS)]
+        for outer, inner_entries in nested.items()
+        for inner, entry in inner_entries.items()
+    )
+    csv_path = write_csv(csv_path, [outer_name, inner_name, *INTERVAL_FIELDS], rows)
+    return write_json(nested, json_path), csv_path
+
+
+def add_interval_arguments(parser):
+    parser.add_argument(
+        "--intervals",
+        action="store_true",
+        help="Also write Wilson and bootstrap confidence intervals for every published percentage.",
+    )
+    parser.add_argument("--confidence", type=float, default=DEFAULT_SETTINGS.confidence, help="Confidence level of the intervals.")
+    parser.add_argument(
+        "--bootstrap-replicates",
+        type=int,
+        default=DEFAULT_SETTINGS.replicates,
+        help="Multinomial resamples drawn per cell for the bootstrap intervals.",
+    )
+    parser.add_argument("--bootstrap-seed", type=int, default=DEFAULT_SETTINGS.seed, help="Seed of the bootstrap resampling.")
+
+
+def interval_settings_from_args(args):
+    """The IntervalSettings requested on the command line, or None without --intervals."""
+    if not args.intervals:
+        return None
+    if not 0 < args.confidence < 1:
+        raise ValueError("--confidence must be between 0 and 1")
+    if args.bootstrap_replicates < 1:
+        raise ValueError("--bootstrap-replicates must be at least 1")
+    return IntervalSettings(args.confidence, args.bootstrap_replicates, args.bootstrap_seed)
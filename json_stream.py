@@ -0,0 +1,343 @@
+import io
+import json
+import os
+from itertools import islice
+
+import numpy as np
+
+# File extensions treated as newline-delimited JSON (one record per line).
+JSONL_EXTENSIONS = (".jsonl", ".ndjson")
+
+# Bytes of a JSONL file handed to each independently parsed chunk.
+JSONL_CHUNK_BYTES = 64 << 20
+
+# Characters read from disk per refill. A record larger than this is handled by
+# growing the read size, so only the current record is ever held in memory.
+CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = " \t\n\r"
+
+# Bytes of a JSON file scanned at a time by iter_json_element_ranges.
+SCAN_BLOCK_BYTES = 16 << 20
+
+# Bytes that matter when looking for element boundaries, translated to: 1 opens
+# a level, -1 (255) closes one, 2 separates elements and 3 is a quote.
+_STRUCTURE = bytearray(256)
+_STRUCTURE[ord("[")] = _STRUCTURE[ord("{")] = 1
+_STRUCTURE[ord("]")] = _STRUCTURE[ord("}")] = 255
+_STRUCTURE[ord(",")] = 2
+_STRUCTURE[ord('"')] = 3
+_STRUCTURE = bytes(_STRUCTURE)
+
+# Characters that can only follow a decoded value if it is a number cut short.
+_NUMBER_CONTINUATIONS = ".eE+-"
+
+
+class _StreamBuffer:
+    """
+    Text buffer over an open file that decodes one JSON value at a time.
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # Drop consumed text before growing the buffer so it stays about one record long.
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.f.read(max(self.chunk_size, len(self.buf)))
+        if not chunk:
+            self.eof = True
+        self.buf += chunk
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character, or '' at end of file.
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ""
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            found = self.peek() or "end of file"
+            raise ValueError(f"Malformed JSON: expected '{char}', found '{found}'.")
+        self.pos += 1
+
+    def decode(self, decoder):
+        """
+        Decode the next complete JSON value, reading more of the file as needed.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # A number that runs to the end of the buffer, or stops at a '.', exponent or
+            # sign that the buffer cuts short, may continue in the next chunk.
+            if not self.eof and (end == len(self.buf) or self.buf[end] in _NUMBER_CONTINUATIONS):
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+
+def _root_error(expected):
+    root = {"[": "a list", "{": "an object"}
+    return f"JSON root should be {' or '.join(root[c] for c in expected)}."
+
+
+def _iter_container(file_path, expected, chunk_size=CHUNK_SIZE):
+    """
+    Yield (key, value) pairs from a top-level JSON array or object.
+    Array elements are yielded with their index as the key.
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        yield from _iter_stream(f, expected, chunk_size)
+
+
+def _iter_stream(f, expected, chunk_size=CHUNK_SIZE):
+    decoder = json.JSONDecoder()
+    stream = _StreamBuffer(f, chunk_size)
+    opener = stream.peek()
+    if not opener or opener not in expected:
+        raise ValueError(_root_error(expected))
+    stream.expect(opener)
+    closer = "]" if opener == "[" else "}"
+
+    index = 0
+    if stream.peek() == closer:
+        stream.expect(closer)
+        return
+    while True:
+        if opener == "{":
+            key = stream.decode(decoder)
+            stream.expect(":")
+        else:
+            key = index
+        yield key, stream.decode(decoder)
+        index += 1
+
+        if stream.peek() == ",":
+            stream.expect(",")
+            continue
+        stream.expect(closer)
+        break
+
+    if stream.peek():
+        raise ValueError("Malformed JSON: extra data after the top-level value.")
+
+
+def iter_json_array(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Yield the elements of a top-level JSON array one at a time.
+    Raises ValueError if the root is not a list.
+    """
+    for _, value in _iter_container(file_path, "[", chunk_size):
+        yield value
+
+
+def iter_json_object(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Yield (key, value) pairs of a top-level JSON object one at a time.
+    Raises ValueError if the root is not an object.
+    """
+    yield from _iter_container(file_path, "{", chunk_size)
+
+
+def iter_json_records(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Yield the records of an export one at a time: the elements of a top-level
+    array, or the values of a top-level object keyed by record id.
+    """
+    for _, value in _iter_container(file_path, "[{", chunk_size):
+        yield value
+
+
+def iter_json_element_ranges(file_path, chunk_bytes=JSONL_CHUNK_BYTES, expected="[{"):
+    """
+    Yield (start, end) byte ranges of roughly chunk_bytes each that split a
+    top-level JSON array or object between its elements (or key: value members),
+    so each range can be parsed on its own by iter_json_range_records.
+    The file is scanned block by block with NumPy rather than parsed: quotes not
+    escaped by an odd run of backslashes toggle strings, and the brackets and
+    commas outside strings give the nesting depth. Ranges are yielded as the scan
+    goes, so work on the first ones can start before the whole file is read.
+    expected holds the allowed root openers, as for iter_json_array and friends.
+    """
+    start = None
+    depth = 0
+    in_string = False
+    trailing_backslashes = 0
+    offset = 0
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(SCAN_BLOCK_BYTES)
+            if not block:
+                break
+            if start is not None and depth == 0:
+                if block.strip():
+                    raise ValueError("Malformed JSON: extra data after the top-level value.")
+                continue
+            data = np.frombuffer(block, dtype=np.uint8)
+            translated = np.frombuffer(block.translate(_STRUCTURE), dtype=np.int8)
+            positions = np.flatnonzero(translated)
+            kinds = translated[positions]
+
+            # A quote is escaped when an odd run of backslashes, possibly carried
+            # over from the previous block, ends right before it.
+            quotes = np.flatnonzero(kinds == 3)
+            escaped = np.zeros(len(quotes), dtype=bool)
+            before = positions[quotes] - 1
+            pending = np.flatnonzero(before >= 0)
+            pending = pending[data[before[pending]] == 92]
+            before = before[pending]
+            while len(pending):
+                escaped[pending] ^= True
+                before -= 1
+                at_start = before < 0
+                if trailing_backslashes % 2:
+                    escaped[pending[at_start]] ^= True
+                keep = ~at_start
+                keep[keep] = data[before[keep]] == 92
+                pending, before = pending[keep], before[keep]
+            if len(quotes) and positions[quotes[0]] == 0 and trailing_backslashes % 2:
+                escaped[0] = True
+            kinds[quotes[escaped]] = 0
+            run = len(block) - len(block.rstrip(b"\\"))
+            trailing_backslashes = run + trailing_backslashes if run == len(block) else run
+
+            # Structural bytes outside strings: an even number of quotes precede them.
+            quote_count = np.cumsum(kinds == 3) + in_string
+            if len(quote_count):
+                in_string = bool(quote_count[-1] % 2)
+            outside = (kinds != 0) & (kinds != 3) & (quote_count % 2 == 0)
+            structural = positions[outside]
+            kinds = kinds[outside]
+
+            if start is None:
+                if not len(structural) or kinds[0] != 1 or block[: structural[0]].strip():
+                    if block.strip():
+                        raise ValueError(_root_error(expected))
+                    offset += len(block)
+                    continue
+                if chr(block[structural[0]]) not in expected:
+                    raise ValueError(_root_error(expected))
+                start = offset + int(structural[0]) + 1
+                structural, kinds = structural[1:], kinds[1:]
+                depth = 1
+            depths = depth + np.cumsum(np.where(kinds == 2, 0, kinds), dtype=np.int64)
+            closed = np.flatnonzero(depths == 0)
+            if len(closed):
+                structural, kinds, depths = (a[: closed[0] + 1] for a in (structural, kinds, depths))
+
+            separators = offset + structural[(kinds == 2) & (depths == 1)]
+            while True:
+                index = np.searchsorted(separators, start + chunk_bytes)
+                if index == len(separators):
+                    break
+                yield start, int(separators[index])
+                start = int(separators[index]) + 1
+
+            if len(closed):
+                if block[structural[-1] + 1 :].strip():
+                    raise ValueError("Malformed JSON: extra data after the top-level value.")
+                yield start, offset + int(structural[-1])
+            depth = int(depths[-1]) if len(depths) else depth
+            offset += len(block)
+
+    if start is None or depth != 0:
+        raise ValueError("Malformed JSON: the top-level value is not closed.")
+
+
+def iter_json_range_records(file_path, start, end):
+    """
+    Yield the records of one range from iter_json_element_ranges: array
+    elements, or the values of an object's members.
+    """
+    with open(file_path, "rb") as f:
+        head = f.read(min(start, CHUNK_SIZE)).lstrip()
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+    opener = head[:1].decode()
+    closer = "]" if opener == "[" else "}"
+    if not text.strip():
+        # Only the range of an empty root may be empty; anywhere else there was
+        # a trailing comma.
+        if head.strip() != opener.encode():
+            raise ValueError("Malformed JSON: expected a value after ','.")
+        return
+    for _, value in _iter_stream(io.StringIO(opener + text + closer), opener):
+        yield value
+
+
+def is_jsonl(file_path):
+    """
+    Return True if the file is newline-delimited JSON, judged by its extension.
+    """
+    return str(file_path).lower().endswith(JSONL_EXTENSIONS)
+
+
+def jsonl_byte_ranges(file_path, chunk_bytes=JSONL_CHUNK_BYTES):
+    """
+    Split a JSONL file into (start, end) byte ranges of roughly chunk_bytes each.
+    Ranges need not fall on line boundaries: iter_jsonl_records assigns every
+    line to the range its first byte falls in.
+    """
+    size = os.path.getsize(file_path)
+    return [(start, min(start + chunk_bytes, size)) for start in range(0, size, chunk_bytes)]
+
+
+def iter_jsonl_records(file_path, start=0, end=None):
+    """
+    Yield one record per non-blank line of a JSONL file.
+    With start/end, only lines beginning inside [start, end) are read, so a file
+    split by jsonl_byte_ranges can be parsed chunk by chunk without overlap.
+    """
+    with open(file_path, "rb") as f:
+        if start > 0:
+            # Skip the tail of a line that began in the previous range.
+            f.seek(start - 1)
+            f.readline()
+        while end is None or f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_records(file_path):
+    """
+    Yield the records of an export one at a time, reading JSONL line by line
+    and anything else as a top-level JSON array or object.
+    """
+    if is_jsonl(file_path):
+        return iter_jsonl_records(file_path)
+    return iter_json_records(file_path)
+
+
+def iter_batches(records, batch_size):
+    """
+    Group a record stream into lists of up to batch_size records.
+    """
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
@@ -1,8 +1,24 @@
+import argparse
 import os
 import json
-import pandas as pd
+from array import array
 from collections import defaultdict
 
+import numpy as np
+
+from categorical import CategoricalColumn
+from intervals import add_interval_arguments, binomial_cdf, category_intervals, interval_settings_from_args, write_interval_table
+from json_stream import is_jsonl, iter_json_records, iter_jsonl_records, jsonl_byte_ranges
+from outputs import add_output_arguments, configure_from_args, write_csv, write_frame_csv, write_json
+from profiling import StageProfiler, add_profile_arguments, profiler_from_args
+
+# Outcome of one model's evaluation of one conversation in the N-model outcome matrix.
+# Faulty evaluations (a break with error type 'n/a') count as not evaluated.
+NOT_EVALUATED, SUCCESS, FAILURE = -1, 0, 1
+
+# Label of the row that sums every prompt type in the N-model tables.
+ALL_PROMPT_TYPES = "All"
+
 def load_json(file_path):
     """Load JSON data from a given file path."""
     with open(file_path, 'r', encoding='utf-8') as f:
@@ -43,6 +59,172 @@ def analyze_data(data):
     
     return model_stats, prompt_type_failures, error_type_counts, faulty_conversation_ids, prompt_type_counts
 
+def merge_analysis(total, partial):
+    """Add one analyze_data result into another, in place, and return it."""
+    model_stats, prompt_type_failures, error_type_counts, faulty_conversation_ids, prompt_type_counts = total
+    p_model_stats, p_prompt_type_failures, p_error_type_counts, p_faulty_conversation_ids, p_prompt_type_counts = partial
+    
+    for model_key, stats in p_model_stats.items():
+        for outcome, count in stats.items():
+            model_stats[model_key][outcome] += count
+    for prompt_type, failures in p_prompt_type_failures.items():
+        for model_key, count in failures.items():
+            prompt_type_failures[prompt_type][model_key] += count
+    for model_key, counts in p_error_type_counts.items():
+        for error_type, count in counts.items():
+            error_type_counts[model_key][error_type] += count
+    faulty_conversation_ids.update(p_faulty_conversation_ids)
+    for prompt_type, count in p_prompt_type_counts.items():
+        prompt_type_counts[prompt_type] += count
+    return total
+
+def analyze_file(file_path, model_outcomes=None):
+    """
+    Run analyze_data over a JSON file, or over a JSONL file chunk by chunk.
+    A ModelOutcomes passed in is filled from the same pass over the conversations.
+    """
+    def records(conversations):
+        if model_outcomes is None:
+            return conversations
+        return model_outcomes.collect(conversations)
+    
+    if not is_jsonl(file_path):
+        return analyze_data(records(iter_json_records(file_path)))
+    
+    total = analyze_data([])
+    for start, end in jsonl_byte_ranges(file_path):
+        merge_analysis(total, analyze_data(records(iter_jsonl_records(file_path, start, end))))
+    return total
+
+def model_label(index):
+    """Label of the model at a position of modelEvaluations: A, B, ... Z, then M27, M28, ..."""
+    return chr(ord('A') + index) if index < 26 else f"M{index + 1}"
+
+class ModelOutcomes:
+    """
+    Builder for the N-model outcome matrix: every model's outcome for every
+    conversation, with models identified by their position in modelEvaluations.
+    Outcomes are appended as compact codes while streaming and only laid out as
+    a (conversations, models) array once the number of models is known.
+    """
+
+    def __init__(self):
+        self.prompt_types = CategoricalColumn()
+        self._outcomes = array('b')
+        self._lengths = array('i')
+
+    def add(self, conversation):
+        prompt_evaluations = conversation.get("promptEvaluations", {})
+        self.prompt_types.append(prompt_evaluations.get("prompt type", "Unknown"))
+        evaluations = conversation.get("modelEvaluations", [])
+        for eval_entry in evaluations:
+            if eval_entry.get("model break", "False") != "True":
+                self._outcomes.append(SUCCESS)
+            elif eval_entry.get("error type", "Unknown") == "n/a":
+                self._outcomes.append(NOT_EVALUATED)
+            else:
+                self._outcomes.append(FAILURE)
+        self._lengths.append(len(evaluations))
+
+    def collect(self, conversations):
+        """Pass conversations through unchanged, adding each one on the way."""
+        for conversation in conversations:
+            self.add(conversation)
+            yield conversation
+
+    def finish(self):
+        """Return the prompt type CodedColumn and the (conversations, models) outcome matrix."""
+        lengths = np.frombuffer(self._lengths, dtype=np.intc).astype(np.intp)
+        models = int(lengths.max()) if len(lengths) else 0
+        matrix = np.full((len(lengths), models), NOT_EVALUATED, dtype=np.int8)
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        columns = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        matrix[rows, columns] = np.frombuffer(self._outcomes, dtype=np.int8)
+        return self.prompt_types.finish(), matrix
+
+def compare_models(prompt_types, matrix):
+    """
+    Per-model and pairwise counts for every prompt type plus an 'All' row.
+    Returns (row labels, per-model arrays of shape (rows, models), pairwise arrays
+    of shape (rows, models, models)); pairwise[name][p, i, j] counts the
+    conversations of row p that both models i and j evaluated.
+    """
+    failed = (matrix == FAILURE).astype(np.float64)
+    passed = (matrix == SUCCESS).astype(np.float64)
+    labels = list(prompt_types.vocabulary) + [ALL_PROMPT_TYPES]
+    masks = [prompt_types.codes == code for code in range(len(prompt_types.vocabulary))]
+    masks.append(np.ones(len(matrix), dtype=bool))
+    
+    per_model = {"failures": [], "successes": []}
+    pairwise = {"both_failed": [], "only_first_failed": [], "neither_failed": []}
+    for mask in masks:
+        # Each table is one matrix product over the conversations of the row.
+        row_failed, row_passed = failed[mask], passed[mask]
+        per_model["failures"].append(row_failed.sum(axis=0))
+        per_model["successes"].append(row_passed.sum(axis=0))
+        pairwise["both_failed"].append(row_failed.T @ row_failed)
+        pairwise["only_first_failed"].append(row_failed.T @ row_passed)
+        pairwise["neither_failed"].append(row_passed.T @ row_passed)
+    
+    models = matrix.shape[1]
+    per_model = {name: np.array(rows, dtype=np.int64).reshape(len(labels), models) for name, rows in per_model.items()}
+    pairwise = {name: np.array(rows, dtype=np.int64).reshape(len(labels), models, models) for name, rows in pairwise.items()}
+    pairwise["only_second_failed"] = pairwise["only_first_failed"].transpose(0, 2, 1)
+    return labels, per_model, pairwise
+
+def mcnemar_tests(only_first, only_second):
+    """
+    McNemar tests for arrays of discordant pair counts, all at once.
+    Returns the continuity-corrected chi-square statistics (NaN without
+    discordant pairs) and exact two-sided p-values (1 without discordant pairs).
+    """
+    discordant = only_first + only_second
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistic = np.where(discordant > 0, np.maximum(np.abs(only_first - only_second) - 1.0, 0.0) ** 2 / discordant, np.nan)
+    p_value = np.minimum(1.0, 2 * binomial_cdf(np.minimum(only_first, only_second), discordant, 0.5))
+    return statistic, p_value
+
+def _significant(value, digits):
+    # Significant digits rather than decimals, so tiny p-values do not round to 0.
+    return None if np.isnan(value) else float(f"{value:.{digits}g}")
+
+def save_model_comparison(prompt_types, matrix, output_dir):
+    """
+    Save the N-model tables: every model's failure counts per prompt type, and
+    for every model pair the paired outcome counts with a McNemar test.
+    """
+    labels, per_model, pairwise = compare_models(prompt_types, matrix)
+    models = [model_label(index) for index in range(matrix.shape[1])]
+    statistic, p_value = mcnemar_tests(pairwise["only_first_failed"], pairwise["only_second_failed"])
+    
+    model_counts = {}
+    model_rows = []
+    for p, prompt_type in enumerate(labels):
+        model_counts[prompt_type] = {}
+        for i, model in enumerate(models):
+            failures = int(per_model["failures"][p, i])
+            evaluated = failures + int(per_model["successes"][p, i])
+            percent = round(failures / evaluated * 100, 2) if evaluated else 0
+            model_counts[prompt_type][model] = {"evaluated": evaluated, "failures": failures, "failure_percent": percent}
+            model_rows.append([prompt_type, model, evaluated, failures, percent])
+    write_json(model_counts, os.path.join(output_dir, "model_failure_counts.json"))
+    write_csv(os.path.join(output_dir, "model_failure_counts.csv"), ["prompt_type", "model", "evaluated", "failures", "failure_percent"], model_rows)
+    
+    fields = ["both_failed", "only_first_failed", "only_second_failed", "neither_failed"]
+    comparisons = {}
+    comparison_rows = []
+    for p, prompt_type in enumerate(labels):
+        comparisons[prompt_type] = {}
+        for i, j in zip(*np.triu_indices(len(models), k=1)):
+            counts = {field: int(pairwise[field][p, i, j]) for field in fields}
+            test = {"mcnemar_statistic": _significant(statistic[p, i, j], 6), "p_value": _significant(p_value[p, i, j], 4)}
+            comparisons[prompt_type][f"{models[i]} vs {models[j]}"] = {"paired": sum(counts.values()), **counts, **test}
+            comparison_rows.append([prompt_type, models[i], models[j], sum(counts.values()), *counts.values(), *test.values()])
+    write_json(comparisons, os.path.join(output_dir, "pairwise_model_comparison.json"))
+    header = ["prompt_type", "first_model", "second_model", "paired", *fields, "mcnemar_statistic", "p_value"]
+    write_csv(os.path.join(output_dir, "pairwise_model_comparison.csv"), header, comparison_rows)
+    print(f"Compared {len(models)} models pairwise across {len(labels) - 1} prompt types")
+
 def compute_probabilities(model_stats, prompt_type_failures, error_type_counts):
     """Compute probability distributions."""
     total_A = sum(model_stats['A'].values())
@@ -71,17 +253,19 @@ def compute_probabilities(model_stats, prompt_type_failures, error_type_counts):
 
 def save_results(results, prompt_type_counts, prompt_type_failures, output_dir):
     """Save results as CSV and JSON files."""
+    # Deferred so that importing this module (e.g. from the batch driver) stays cheap.
+    import pandas as pd
+    
     os.makedirs(output_dir, exist_ok=True)
     
     for name, data in results.items():
         json_path = os.path.join(output_dir, f"{name}.json")
         csv_path = os.path.join(output_dir, f"{name}.csv")
         
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        write_json(data, json_path)
         
         df = pd.DataFrame.from_dict(data, orient='index')
-        df.to_csv(csv_path)
+        write_frame_csv(df, csv_path)
     
     prob_prompt_type_with_counts = results["prob_prompt_type"].copy()
     for prompt, counts in prompt_type_counts.items():
@@ -90,29 +274,89 @@ def save_results(results, prompt_type_counts, prompt_type_failures, output_dir):
             prob_prompt_type_with_counts[prompt]["failure_count"] = prompt_type_failures[prompt]["A"] + prompt_type_failures[prompt]["B"]
     
     json_path = os.path.join(output_dir, "prob_prompt_type_with_counts.json")
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(prob_prompt_type_with_counts, f, indent=4)
+    write_json(prob_prompt_type_with_counts, json_path)
+
+def save_intervals(model_stats, prompt_type_failures, error_type_counts, settings, output_dir):
+    """
+    Save Wilson and bootstrap confidence intervals for every percentage of the
+    prob_model, prob_prompt_type and prob_error_type tables, next to them.
+    """
+    tables = {
+        "prob_model": (model_stats, "model", "outcome"),
+        "prob_prompt_type": (prompt_type_failures, "prompt_type", "model"),
+        "prob_error_type": (error_type_counts, "model", "error_type"),
+    }
+    for name, (counts, outer_name, inner_name) in tables.items():
+        write_interval_table(
+            category_intervals(counts, settings),
+            os.path.join(output_dir, f"{name}_intervals.json"),
+            os.path.join(output_dir, f"{name}_intervals.csv"),
+            outer_name,
+            inner_name,
+        )
 
-def main():
-    file_path = input("Enter the path to the JSON file: ")
+def run_analysis(file_path, output_dir, profiler=None, intervals=None, all_models=False):
+    """
+    Analyze one export and write every output into output_dir.
+    With intervals (an IntervalSettings), confidence intervals for every
+    percentage are written too. With all_models, every model in each
+    conversation is also compared with every other, from the same pass over
+    the data. With an enabled StageProfiler, a profile report is written there as well.
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    input_bytes = os.path.getsize(file_path)
+    # Conversations are streamed from disk rather than loaded as one document.
+    with profiler.stage("parse and analyze", unit="conversations") as stage:
+        stage["bytes"] = input_bytes
+        model_outcomes = ModelOutcomes() if all_models else None
+        model_stats, prompt_type_failures, error_type_counts, faulty_conversation_ids, prompt_type_counts = analyze_file(file_path, model_outcomes)
+        conversations = sum(prompt_type_counts.values())
+        stage["records"] = conversations
+    with profiler.stage("probabilities", conversations, "conversations"):
+        results = compute_probabilities(model_stats, prompt_type_failures, error_type_counts)
+    
+    with profiler.stage("write outputs", conversations, "conversations"):
+        # Save faulty conversation IDs separately
+        os.makedirs(output_dir, exist_ok=True)
+        faulty_ids_path = write_json(list(faulty_conversation_ids), os.path.join(output_dir, "faulty_conversation_ids.json"))
+        
+        print(f"Faulty conversation IDs saved in {faulty_ids_path}")
+        save_results(results, prompt_type_counts, prompt_type_failures, output_dir)
+    if intervals is not None:
+        with profiler.stage("intervals", conversations, "conversations"):
+            save_intervals(model_stats, prompt_type_failures, error_type_counts, intervals, output_dir)
+    if model_outcomes is not None:
+        with profiler.stage("model comparison", conversations, "conversations"):
+            save_model_comparison(*model_outcomes.finish(), output_dir)
+    print(f"Results saved in {output_dir}")
+    report_path = profiler.write_report(output_dir, script="json_to_model_analysis", input=str(file_path), input_bytes=input_bytes)
+    if report_path:
+        print(f"Profile report saved in {report_path}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Per-model failure analysis of a conversation export.")
+    parser.add_argument("file_path", nargs="?", help="Input JSON or JSONL file (prompted for if omitted).")
+    parser.add_argument(
+        "--all-models",
+        action="store_true",
+        help="Also compare every model in modelEvaluations (not just the first two), with pairwise McNemar tests.",
+    )
+    add_output_arguments(parser)
+    add_interval_arguments(parser)
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_from_args(args)
+    intervals = interval_settings_from_args(args)
+    file_path = args.file_path or input("Enter the path to the JSON file: ")
     if not os.path.exists(file_path):
         print("File does not exist.")
         return
     
     output_dir = os.path.join(os.path.dirname(file_path), "falcon_analysis")
-    data = load_json(file_path)
-    model_stats, prompt_type_failures, error_type_counts, faulty_conversation_ids, prompt_type_counts = analyze_data(data)
-    results = compute_probabilities(model_stats, prompt_type_failures, error_type_counts)
-    
-    # Save faulty conversation IDs separately
-    faulty_ids_path = os.path.join(output_dir, "faulty_conversation_ids.json")
-    os.makedirs(output_dir, exist_ok=True)
-    with open(faulty_ids_path, 'w', encoding='utf-8') as f:
-        json.dump(list(faulty_conversation_ids), f, indent=4)
-    
-    print(f"Faulty conversation IDs saved in {faulty_ids_path}")
-    save_results(results, prompt_type_counts, prompt_type_failures, output_dir)
-    print(f"Results saved in {output_dir}")
+    run_analysis(file_path, output_dir, profiler=profiler_from_args(args), intervals=intervals, all_models=args.all_models)
 
 if __name__ == "__main__":
     main()
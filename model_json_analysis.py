@@ -1,29 +1,96 @@
+import argparse
 import json
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import re
+import math
+import numpy as np
+
+from categorical import CategoricalColumn, CodedColumn, count_table, label_mask
+from chart_render import ChartJob, grid_shape, render_jobs, series_jobs
+from input_cache import cached
+from json_stream import iter_json_object
+from outputs import add_output_arguments, configure_from_args, write_frame_csv, write_json
+from profiling import StageProfiler, add_profile_arguments, profiler_from_args
+
+# pandas and matplotlib are imported inside the functions that use them, so a
+# run without charts never loads a plotting backend and startup stays cheap.
+
+# Fields read by the distributions below; everything else in a record is dropped at load time.
+ANALYSIS_FIELDS = ("model_break_scenario", "error_type", "complexity", "prompt_type")
 
 def load_json(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
     return data
 
-def compute_probabilities(data, variable, group_by):
-    df = pd.DataFrame.from_dict(data, orient='index')
-    df = df[df[group_by].notna() & (df[group_by] != "")]  # Remove empty group_by entries
-    probability_df = df.groupby(group_by)[variable].value_counts(normalize=True).unstack().fillna(0)
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def encode_analysis_columns(records, fields=ANALYSIS_FIELDS):
+    """Encode the analysis fields of each record as coded columns, with missing values coded as None."""
+    columns = {field: CategoricalColumn() for field in fields}
+    for record in records:
+        for field, column in columns.items():
+            value = record.get(field)
+            column.append(None if _is_missing(value) else value)
+    return {field: column.finish() for field, column in columns.items()}
+
+def load_analysis_columns(file_path, use_cache=False):
+    """Stream a dict-of-records export into coded analysis columns, via the input cache if requested."""
+    def build(path):
+        columns = encode_analysis_columns(record for _, record in iter_json_object(path))
+        arrays = {field: column.codes.astype(np.int32) for field, column in columns.items()}
+        return arrays, {field: column.vocabulary for field, column in columns.items()}
+    
+    if not use_cache:
+        return encode_analysis_columns(record for _, record in iter_json_object(file_path))
+    arrays, vocabularies = cached(file_path, "model-json", build)
+    return {field: CodedColumn(codes, vocabularies[field]) for field, codes in arrays.items()}
+
+def compute_probabilities_from_columns(columns, variable, group_by):
+    """Percentage of each `variable` value within each `group_by` value, as a crosstab of coded columns."""
+    import pandas as pd
+    
+    groups = columns[group_by]
+    values = columns[variable]
+    # Remove empty group_by entries and missing variable values
+    mask = label_mask(groups, lambda group: group is not None and group != "") & label_mask(values, lambda value: value is not None)
+    counts = count_table((groups.codes[mask], values.codes[mask]), (len(groups.vocabulary), len(values.vocabulary)))
+    
+    # Match pandas groupby/unstack ordering: sorted group rows and sorted value columns
+    group_order = sorted(np.flatnonzero(counts.sum(axis=1)), key=groups.vocabulary.__getitem__)
+    value_order = sorted(np.flatnonzero(counts.sum(axis=0)), key=values.vocabulary.__getitem__)
+    counts = counts[np.ix_(group_order, value_order)]
+    probabilities = counts / counts.sum(axis=1, keepdims=True)
+    
+    probability_df = pd.DataFrame(
+        probabilities,
+        index=pd.Index([groups.vocabulary[i] for i in group_order], name=group_by),
+        columns=pd.Index([values.vocabulary[i] for i in value_order], name=variable),
+    )
     probability_df.rename(columns={'': 'Model Success'}, inplace=True)
     probability_df = (probability_df * 100).round(2)  # Convert to percentages and round to 2 decimal places
     return probability_df
 
+def probability_table(columns, variable, group_by, tables):
+    """
+    Memoized compute_probabilities_from_columns: `tables` maps (variable, group_by)
+    to a computed table, so each crosstab of one input is built only once.
+    """
+    key = (variable, group_by)
+    if key not in tables:
+        tables[key] = compute_probabilities_from_columns(columns, variable, group_by)
+    return tables[key]
+
+def compute_probabilities(data, variable, group_by):
+    columns = encode_analysis_columns(data.values(), (variable, group_by))
+    return compute_probabilities_from_columns(columns, variable, group_by)
+
 def save_csv_json(probability_df, output_dir, filename):
     csv_path = os.path.join(output_dir, f"{filename}.csv")
     json_path = os.path.join(output_dir, f"{filename}.json")
-    probability_df.to_csv(csv_path, index=True)
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(probability_df.to_dict(orient='index'), f, indent=4)
+    csv_path = write_frame_csv(probability_df, csv_path, index=True)
+    json_path = write_json(probability_df.to_dict(orient='index'), json_path)
     print(f"Saved CSV: {csv_path}")
     print(f"Saved JSON: {json_path}")
 
@@ -31,42 +98,110 @@ def sanitize_filename(name):
     name = name.strip().replace("\n", "").replace(" ", "_")
     return re.sub(r'[\/:*?"<>|]', '_', name)
 
-def plot_bar_chart(probability_df, output_dir, variable, group_by):
-    plt.figure(figsize=(16, 9))  # Large resolution for full-screen clarity
-    probability_df.plot(kind='bar', stacked=True, colormap='tab10', edgecolor='black')
-    plt.xlabel(group_by, fontsize=14)
-    plt.ylabel("Probability (%)", fontsize=14)
-    plt.title(f"{variable} Probability Distribution by {group_by}", fontsize=16)
-    plt.legend(title="Categories", bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=12)
-    plt.xticks(rotation=45, ha='right', fontsize=12)
-    plt.yticks(fontsize=12)
-    plt.tight_layout()
-    output_file = os.path.join(output_dir, f"{variable}_by_{group_by}.png")
-    plt.savefig(output_file, bbox_inches='tight')
-    plt.close()
+def render_bar_chart(probability_df, variable, group_by, output_file):
+    import matplotlib.pyplot as plt
+    
+    fig, ax = plt.subplots(figsize=(16, 9))  # Large resolution for full-screen clarity
+    probability_df.plot(kind='bar', stacked=True, colormap='tab10', edgecolor='black', ax=ax)
+    ax.set_xlabel(group_by, fontsize=14)
+    ax.set_ylabel("Probability (%)", fontsize=14)
+    ax.set_title(f"{variable} Probability Distribution by {group_by}", fontsize=16)
+    ax.legend(title="Categories", bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=12)
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right', fontsize=12)
+    plt.setp(ax.get_yticklabels(), fontsize=12)
+    fig.tight_layout()
+    fig.savefig(output_file, bbox_inches='tight')
+    plt.close(fig)
     print(f"Saved bar chart: {output_file}")
+    return output_file
+
+def _draw_pie(ax, values, category, fontsize=14):
+    values.plot(kind='pie', ax=ax, autopct='%1.1f%%', startangle=140, cmap='tab10')
+    ax.set_ylabel('')
+    ax.set_title(f"Error Type Distribution for {category}", fontsize=fontsize)
+
+def render_pie_charts(items):
+    """
+    Draw (values, category, output_file) pies one after another on a single
+    figure, clearing its axes between charts instead of building a new figure.
+    """
+    import matplotlib.pyplot as plt
+    
+    fig, ax = plt.subplots(figsize=(10, 10))  # Large size for clarity
+    output_files = []
+    for values, category, output_file in items:
+        ax.clear()
+        _draw_pie(ax, values, category)
+        fig.savefig(output_file, bbox_inches='tight')
+        print(f"Saved pie chart: {output_file}")
+        output_files.append(output_file)
+    plt.close(fig)
+    return output_files
 
-def plot_pie_chart(probability_df, output_dir, group_by):
+def render_pie_grid(items, output_file):
+    """Draw all (values, category, _) pies as small multiples in one image."""
+    import matplotlib.pyplot as plt
+    
+    rows, columns = grid_shape(len(items))
+    fig, axes = plt.subplots(rows, columns, figsize=(5 * columns, 5 * rows), squeeze=False)
+    for ax, (values, category, _) in zip(axes.flat, items):
+        _draw_pie(ax, values, category, fontsize=10)
+    for ax in axes.flat[len(items):]:
+        ax.set_axis_off()
+    fig.tight_layout()
+    fig.savefig(output_file, bbox_inches='tight')
+    plt.close(fig)
+    print(f"Saved pie chart grid: {output_file}")
+    return output_file
+
+def bar_chart_job(probability_df, output_dir, variable, group_by):
+    output_file = os.path.join(output_dir, f"{variable}_by_{group_by}.png")
+    return ChartJob(render_bar_chart, (probability_df, variable, group_by, output_file))
+
+def pie_chart_items(probability_df, output_dir):
+    """(non-zero shares, category, output file) for each row of probability_df."""
+    items = []
     for category in probability_df.index:
         sanitized_category = sanitize_filename(category)
-        plt.figure(figsize=(10, 10))  # Large size for clarity
-        probability_df.loc[category][probability_df.loc[category] > 0].plot(kind='pie', 
-            autopct='%1.1f%%', startangle=140, cmap='tab10')
-        plt.ylabel('')
-        plt.title(f"Error Type Distribution for {category}", fontsize=14)
+        row = probability_df.loc[category]
         output_file = os.path.join(output_dir, f"error_type_pie_{sanitized_category}.png")
-        plt.savefig(output_file, bbox_inches='tight')
-        plt.close()
-        print(f"Saved pie chart: {output_file}")
+        items.append((row[row > 0], category, output_file))
+    return items
 
-def main():
-    file_path = input("Enter the JSON file path: ").strip()
-    if not os.path.exists(file_path):
-        print("Invalid file path.")
-        return
-    
-    data = load_json(file_path)
-    output_dir = os.path.dirname(file_path)
+def pie_chart_jobs(probability_df, output_dir, group_by, workers=1, grid=False):
+    """
+    Jobs drawing one pie per row of probability_df, split across `workers`
+    figures, or a single small-multiples grid image when grid is True.
+    """
+    items = pie_chart_items(probability_df, output_dir)
+    if grid:
+        output_file = os.path.join(output_dir, f"error_type_pies_by_{group_by}.png")
+        return [ChartJob(render_pie_grid, (items, output_file))]
+    return series_jobs(render_pie_charts, items, workers)
+
+def plot_bar_chart(probability_df, output_dir, variable, group_by):
+    return render_jobs([bar_chart_job(probability_df, output_dir, variable, group_by)])[0]
+
+def plot_pie_chart(probability_df, output_dir, group_by, workers=1, grid=False):
+    return render_jobs(pie_chart_jobs(probability_df, output_dir, group_by, workers, grid), workers)
+
+def run_analysis(file_path, output_dir, use_cache=False, charts=True, chart_workers=1, pie_grid=False, profiler=None):
+    """
+    Write the probability tables (and, unless charts is False, the charts) for one export into output_dir.
+    Charts are rendered after the tables, across chart_workers processes; pie_grid
+    draws the per-prompt-type pies as one small-multiples image. With an enabled
+    StageProfiler, a profile report is written to output_dir too.
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    input_bytes = os.path.getsize(file_path)
+    # An input named without a directory writes its outputs to the current one.
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with profiler.stage("parse and encode") as stage:
+        stage["bytes"] = input_bytes
+        columns = load_analysis_columns(file_path, use_cache=use_cache)
+        records = len(next(iter(columns.values())).codes)
+        stage["records"] = records
     
     # Generate required probability distributions
     required_categories = [
@@ -75,14 +210,48 @@ def main():
         ("error_type", "prompt_type")
     ]
     
-    for variable, category in required_categories:
-        probability_df = compute_probabilities(data, variable, category)
-        save_csv_json(probability_df, output_dir, f"{variable}_by_{category}")
-        plot_bar_chart(probability_df, output_dir, variable, category)
+    # The coded columns are built once per input; each crosstab is then computed once.
+    tables = {}
+    with profiler.stage("probability tables", records):
+        for variable, category in required_categories:
+            probability_table(columns, variable, category, tables)
+    
+    with profiler.stage("write tables", records):
+        for variable, category in required_categories:
+            save_csv_json(tables[variable, category], output_dir, f"{variable}_by_{category}")
+    
+    if charts:
+        with profiler.stage("charts"):
+            chart_jobs = [bar_chart_job(tables[variable, category], output_dir, variable, category) for variable, category in required_categories]
+            # Generate pie charts only for error_type_by_prompt_type
+            error_prob_df = probability_table(columns, "error_type", "prompt_type", tables)
+            chart_jobs.extend(pie_chart_jobs(error_prob_df, output_dir, "prompt_type", chart_workers, pie_grid))
+            render_jobs(chart_jobs, chart_workers)
+    
+    report_path = profiler.write_report(output_dir, script="model_json_analysis", input=str(file_path), input_bytes=input_bytes)
+    if report_path:
+        print(f"Saved profile report: {report_path}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Probability distributions and charts for a dict-of-records evaluation export.")
+    parser.add_argument("file_path", nargs="?", help="Input JSON file (prompted for if omitted).")
+    parser.add_argument("--cache", action="store_true", help="Read the coded columns from the on-disk input cache (building it on a miss).")
+    parser.add_argument("--no-charts", dest="charts", action="store_false", help="Write the CSV/JSON tables only, without loading matplotlib.")
+    parser.add_argument("--chart-workers", type=int, default=1, help="Number of processes rendering charts (headless Agg backend).")
+    parser.add_argument("--pie-grid", action="store_true", help="Draw the per-prompt-type pies as one small-multiples image instead of one file each.")
+    add_output_arguments(parser)
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_from_args(args)
+    file_path = args.file_path or input("Enter the JSON file path: ").strip()
+    if not os.path.exists(file_path):
+        print("Invalid file path.")
+        return
     
-    # Generate pie charts only for error_type_by_prompt_type
-    error_prob_df = compute_probabilities(data, "error_type", "prompt_type")
-    plot_pie_chart(error_prob_df, output_dir, "prompt_type")
+    run_analysis(file_path, os.path.dirname(file_path), use_cache=args.cache, charts=args.charts, chart_workers=args.chart_workers, pie_grid=args.pie_grid, profiler=profiler_from_args(args))
 
 if __name__ == "__main__":
     main()
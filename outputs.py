@@ -0,0 +1,298 @@
+import csv
+import gzip
+import json
+import os
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+# orjson is optional; when installed it encodes compact JSON several times faster.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# How JSON outputs are formatted, whether outputs are compressed, and whether
+# tables also get a columnar twin (Parquet or Arrow IPC). Defaults can be set per
+# host; every script's --compact-json / --compress / --columnar flags override them.
+OutputSettings = namedtuple("OutputSettings", ["compact", "compression", "columnar"])
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+COLUMNAR_SUFFIXES = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# Records buffered per row group / record batch of a columnar record table.
+RECORD_BATCH_SIZE = 10000
+
+# Bytes buffered per output file before a write reaches the disk.
+WRITE_BUFFER = 1 << 20
+
+GZIP_LEVEL = 6
+
+_settings = OutputSettings(
+    compact=os.environ.get("MLANALYTICS_COMPACT_JSON", "") not in ("", "0"),
+    compression=os.environ.get("MLANALYTICS_COMPRESSION") or None,
+    columnar=os.environ.get("MLANALYTICS_COLUMNAR") or None,
+)
+
+
+def settings():
+    return _settings
+
+
+def configure(compact=False, compression=None, columnar=None):
+    """
+    Set how outputs are written from now on: compact JSON instead of indent=4,
+    compression ('gzip', 'zstd' or None), which adds .gz/.zst to file names, and
+    columnar ('parquet', 'arrow' or None), which writes every table a second time
+    in that format.
+    """
+    global _settings
+    if compression not in (None, *COMPRESSION_SUFFIXES):
+        raise ValueError(f"Unknown compression: {compression}")
+    if columnar not in (None, *COLUMNAR_SUFFIXES):
+        raise ValueError(f"Unknown columnar format: {columnar}")
+    # Fail before any output is written if an optional dependency is missing.
+    if compression == "zstd":
+        _zstd_open()
+    if columnar:
+        _pyarrow()
+    _settings = OutputSettings(compact, compression, columnar)
+
+
+def add_output_arguments(parser):
+    parser.add_argument("--compact-json", action="store_true", default=_settings.compact, help="Write JSON outputs without indentation.")
+    parser.add_argument(
+        "--compress",
+        choices=sorted(COMPRESSION_SUFFIXES),
+        default=_settings.compression,
+        help="Compress every JSON/CSV output (adds .gz or .zst to the file names).",
+    )
+    parser.add_argument(
+        "--columnar",
+        choices=sorted(COLUMNAR_SUFFIXES),
+        default=_settings.columnar,
+        help="Also write every table and the filtered conversations as Parquet or Arrow IPC (needs pyarrow).",
+    )
+
+
+def configure_from_args(args):
+    configure(args.compact_json, args.compress, args.columnar)
+
+
+def output_path(path):
+    """The path an output for `path` is actually written to under the current settings."""
+    suffix = COMPRESSION_SUFFIXES.get(_settings.compression, "")
+    return type(path)(f"{path}{suffix}") if suffix else path
+
+
+def _zstd_open():
+    """The zstd open() of the standard library (3.14+) or of the zstandard package."""
+    try:
+        from compression import zstd
+        return zstd.open
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression needs Python 3.14+ or the zstandard package.") from None
+    return zstandard.open
+
+
+def _open_zstd(path, mode, newline):
+    return _zstd_open()(path, mode, encoding="utf-8", newline=newline)
+
+
+def open_output(path, newline=None):
+    """Open an output file for text writing, compressed and buffered per the current settings."""
+    return _open_text(output_path(path), newline)
+
+
+@contextmanager
+def open_output_replacing(path, newline=None):
+    """
+    Like open_output, but written to a temporary file next to the output that
+    replaces it only once the body completes, so a failed run leaves the
+    previous output intact.
+    """
+    target = output_path(path)
+    # A unique name keeps concurrent runs apart; the file gets the usual permissions, unlike mkstemp's.
+    temp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+    try:
+        with _open_text(temp_path, newline) as f:
+            yield f
+        os.replace(temp_path, target)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _open_text(path, newline):
+    if _settings.compression == "gzip":
+        return gzip.open(path, "wt", compresslevel=GZIP_LEVEL, encoding="utf-8", newline=newline)
+    if _settings.compression == "zstd":
+        return _open_zstd(path, "wt", newline)
+    return open(path, "w", encoding="utf-8", newline=newline, buffering=WRITE_BUFFER)
+
+
+def open_input(path, newline=None):
+    """
+    Open a file written by open_output for reading, whichever compression it was
+    written with: `path` itself, else its .gz or .zst variant.
+    """
+    if os.path.exists(path):
+        return open(path, "r", encoding="utf-8", newline=newline)
+    if os.path.exists(f"{path}.gz"):
+        return gzip.open(f"{path}.gz", "rt", encoding="utf-8", newline=newline)
+    if os.path.exists(f"{path}.zst"):
+        return _open_zstd(f"{path}.zst", "rt", newline)
+    raise FileNotFoundError(f"No such output: {path}")
+
+
+def json_dumps(obj):
+    """Encode obj as compact JSON text, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def dump_json(obj, f):
+    if _settings.compact:
+        f.write(json_dumps(obj))
+    else:
+        json.dump(obj, f, indent=4)
+
+
+def write_json(obj, path):
+    """Write obj as a JSON output file; returns the path written."""
+    with open_output(path) as f:
+        dump_json(obj, f)
+    return output_path(path)
+
+
+def read_json(path):
+    with open_input(path) as f:
+        return json.load(f)
+
+
+def write_csv(path, header, rows):
+    """
+    Write a header and rows as a CSV output file; returns the path written.
+    With a columnar format configured, the rows are also written next to it in that format.
+    """
+    if _settings.columnar:
+        rows = list(rows)
+    with open_output(path, newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    if _settings.columnar:
+        columns = {name: [row[i] for row in rows] for i, name in enumerate(header)}
+        write_arrow_table(_pyarrow().table(columns), path)
+    return output_path(path)
+
+
+def write_frame_csv(df, path, **kwargs):
+    """
+    Write a DataFrame as a CSV output file; returns the path written.
+    With a columnar format configured, the same table (index as its first
+    column) is also written next to it in that format.
+    """
+    with open_output(path, newline="") as f:
+        df.to_csv(f, **kwargs)
+    if _settings.columnar:
+        frame = df.reset_index() if kwargs.get("index", True) else df
+        frame = frame.set_axis([str(column) for column in frame.columns], axis=1)
+        write_arrow_table(_pyarrow().Table.from_pandas(frame, preserve_index=False), path)
+    return output_path(path)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ValueError("Columnar outputs need the pyarrow package.") from None
+    return pyarrow
+
+
+def columnar_path(path):
+    """`path` with its extension replaced by that of the configured columnar format."""
+    base, _ = os.path.splitext(str(path))
+    return type(path)(base + COLUMNAR_SUFFIXES[_settings.columnar])
+
+
+def write_arrow_table(table, path):
+    """
+    Write a pyarrow Table in the configured columnar format next to `path`;
+    returns the path written. Arrow IPC files are left uncompressed so readers
+    can memory-map them.
+    """
+    target = columnar_path(path)
+    if _settings.columnar == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, target)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, target, compression="uncompressed")
+    return target
+
+
+def _column_value(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json_dumps(value)
+
+
+class RecordTableWriter:
+    """
+    Stream dict records into a columnar file next to `path`, in batches.
+    Columns are the top-level keys of the first batch, all stored as strings:
+    text values as-is and anything else (numbers, lists, objects) as JSON text.
+    Keys first seen after the first batch go into an `_extra` JSON column.
+    """
+
+    def __init__(self, path, batch_size=RECORD_BATCH_SIZE):
+        self.path = columnar_path(path)
+        self.batch_size = batch_size
+        self.columns = None
+        self.pending = []
+        self.writer = None
+        self.sink = None
+        self.count = 0
+
+    def write(self, record):
+        self.pending.append(record)
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+
+    def _open(self, pa):
+        self.columns = list(dict.fromkeys(key for record in self.pending for key in record))
+        schema = pa.schema([(str(column), pa.string()) for column in self.columns] + [("_extra", pa.string())])
+        if _settings.columnar == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(self.path, schema)
+        else:
+            self.sink = pa.OSFile(str(self.path), "wb")
+            self.writer = pa.ipc.new_file(self.sink, schema)
+        return schema
+
+    def _flush(self):
+        if not self.pending and self.writer is not None:
+            return
+        pa = _pyarrow()
+        schema = self._open(pa) if self.writer is None else self.writer.schema
+        known = set(self.columns)
+        arrays = [pa.array([_column_value(record.get(column)) for record in self.pending], pa.string()) for column in self.columns]
+        extras = [{key: value for key, value in record.items() if key not in known} for record in self.pending]
+        arrays.append(pa.array([json_dumps(extra) if extra else None for extra in extras], pa.string()))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        self.count += len(self.pending)
+        self.pending = []
+
+    def close(self):
+        """Flush the last batch and finish the file; returns the path written."""
+        self._flush()
+        self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+        return self.path
@@ -1,17 +1,15 @@
-import json
-import csv
+import argparse
 import os
-from collections import defaultdict
 
-# Prompt the user for the input JSON file path.
-input_path = input("Enter the full path of the input JSON file: ").strip()
+import numpy as np
 
-# Use the folder of the input file to store output files.
-output_folder = os.path.dirname(input_path)
+from categorical import CategoricalColumn, crosstab_dict, label_mask
+from json_stream import is_jsonl, iter_jsonl_records, iter_records, jsonl_byte_ranges
+from outputs import add_output_arguments, configure_from_args, write_csv, write_json
+from profiling import StageProfiler, add_profile_arguments, profiler_from_args
 
-# Load the JSON data from the input file using UTF-8 encoding.
-with open(input_path, 'r', encoding='utf-8') as f:
-    data = json.load(f)
+# Outcomes counted by the distributions; any other model_break_scenario is skipped.
+OUTCOMES = ["model_failure", "model_success"]
 
 # Helper function to rename model_break_scenario values.
 def rename_model_break(val):
@@ -23,170 +21,230 @@ def rename_model_break(val):
     else:
         return val
 
-# -------------------------------
-# 1. Probability distribution of prompt_type vs model_break_scenario
-#    Ignore entries where prompt_type is an empty string.
-prompt_type_break = defaultdict(lambda: {"count": 0, "model_failure": 0, "model_success": 0})
-
-for entry in data.values():
-    ptype = entry.get("prompt_type", "").strip()
-    # Skip empty prompt types.
-    if not ptype:
-        continue
-    mb = rename_model_break(entry.get("model_break_scenario"))
-    if mb not in ["model_failure", "model_success"]:
-        continue
-    prompt_type_break[ptype]["count"] += 1
-    prompt_type_break[ptype][mb] += 1
-
-# Calculate percentages for each prompt_type.
-prompt_type_break_prob = {}
-for ptype, counts in prompt_type_break.items():
-    total = counts["count"]
-    prompt_type_break_prob[ptype] = {
-        "count": total,
-        "model_failure": round((counts["model_failure"] / total) * 100, 2),
-        "model_success": round((counts["model_success"] / total) * 100, 2)
+def count_distributions(records):
+    """
+    Count all five distributions in one pass over the records.
+    The fields used are encoded as integer-coded categorical columns and each
+    distribution is a vectorized crosstab over those codes. Returns raw counts:
+    {'prompt_type', 'error_type', 'complexity', 'topic', 'overall'}.
+    """
+    prompt_type_column = CategoricalColumn()
+    raw_prompt_type_column = CategoricalColumn()
+    error_type_column = CategoricalColumn()
+    complexity_column = CategoricalColumn()
+    topic_column = CategoricalColumn()
+    outcome_column = CategoricalColumn(OUTCOMES + [None])
+
+    for entry in records:
+        prompt_type_column.append(entry.get("prompt_type", "").strip())
+        raw_prompt_type_column.append(entry.get("prompt_type"))
+        error_type_column.append(entry.get("error_type", "").strip())
+        complexity_column.append(entry.get("complexity", "").strip())
+        topic_column.append(entry.get("topic", "").strip())
+        mb = rename_model_break(entry.get("model_break_scenario"))
+        outcome_column.append(mb if mb in OUTCOMES else None)
+
+    prompt_type_column, raw_prompt_type_column, error_type_column, complexity_column, topic_column, outcome_column = (
+        column.finish()
+        for column in (prompt_type_column, raw_prompt_type_column, error_type_column, complexity_column, topic_column, outcome_column)
+    )
+    has_outcome = outcome_column.codes < len(OUTCOMES)
+
+    # 1. prompt_type vs model_break_scenario, ignoring empty prompt types.
+    prompt_type_break = {}
+    for ptype, outcome_counts in crosstab_dict(prompt_type_column, outcome_column, label_mask(prompt_type_column) & has_outcome).items():
+        prompt_type_break[ptype] = {"count": sum(outcome_counts.values())}
+        for mb in OUTCOMES:
+            prompt_type_break[ptype][mb] = outcome_counts.get(mb, 0)
+
+    # 2. error_type vs prompt_type, ignoring missing prompt_type or blank error_type.
+    error_type_vs_prompt = crosstab_dict(raw_prompt_type_column, error_type_column, label_mask(raw_prompt_type_column) & label_mask(error_type_column))
+
+    # 3. complexity vs model_break_scenario, ignoring blank complexity.
+    complexity_break = {}
+    for complexity, outcome_counts in crosstab_dict(complexity_column, outcome_column, label_mask(complexity_column) & has_outcome).items():
+        complexity_break[complexity] = {"total": sum(outcome_counts.values())}
+        for mb in OUTCOMES:
+            complexity_break[complexity][mb] = outcome_counts.get(mb, 0)
+
+    # 4. topic grouped by the renamed model break outcome, ignoring blank topics.
+    topic_break = {mb: {} for mb in OUTCOMES}
+    topic_break.update(crosstab_dict(outcome_column, topic_column, label_mask(topic_column) & has_outcome))
+
+    # 5. overall model_break outcomes.
+    outcome_totals = np.bincount(outcome_column.codes[has_outcome], minlength=len(OUTCOMES))
+    overall_counts = {mb: int(outcome_totals[code]) for code, mb in enumerate(OUTCOMES)}
+    overall_counts["total_count"] = int(outcome_totals.sum())
+
+    return {
+        "prompt_type": prompt_type_break,
+        "error_type": error_type_vs_prompt,
+        "complexity": complexity_break,
+        "topic": topic_break,
+        "overall": overall_counts,
     }
 
-# Write to JSON and CSV for distribution 1.
-json_out1 = os.path.join(output_folder, 'model_break_scenario_by_prompt_type.json')
-csv_out1 = os.path.join(output_folder, 'model_break_scenario_by_prompt_type.csv')
-with open(json_out1, 'w', encoding='utf-8') as f:
-    json.dump(prompt_type_break_prob, f, indent=4)
-with open(csv_out1, 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow(["prompt_type", "count", "model_failure (%)", "model_success (%)"])
-    for ptype, stats in prompt_type_break_prob.items():
-        writer.writerow([ptype, stats["count"], stats["model_failure"], stats["model_success"]])
-
-# -------------------------------
-# 2. Probability distribution of error_type vs prompt_type (ignore blank error_type)
-error_type_vs_prompt = defaultdict(lambda: defaultdict(int))
-prompt_error_counts = defaultdict(int)
-
-for entry in data.values():
-    ptype = entry.get("prompt_type")
-    err_type = entry.get("error_type", "").strip()
-    if not ptype or not err_type:
-        continue  # ignore if prompt_type missing or error_type is blank
-    error_type_vs_prompt[ptype][err_type] += 1
-    prompt_error_counts[ptype] += 1
-
-error_type_vs_prompt_prob = {}
-for ptype, error_counts in error_type_vs_prompt.items():
-    total = prompt_error_counts[ptype]
-    error_type_vs_prompt_prob[ptype] = {
-        err: round((count / total) * 100, 2) for err, count in error_counts.items()
-    }
+def merge_counts(total, partial):
+    """Add one count_distributions result into another, in place; keys keep first-seen order."""
+    for key, value in partial.items():
+        if isinstance(value, dict):
+            merge_counts(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+def compute_distributions(counts):
+    """Turn count_distributions output into the five probability distributions (percentages)."""
+    # Calculate percentages for each prompt_type.
+    prompt_type_break_prob = {}
+    for ptype, ptype_counts in counts["prompt_type"].items():
+        total = ptype_counts["count"]
+        prompt_type_break_prob[ptype] = {
+            "count": total,
+            "model_failure": round((ptype_counts["model_failure"] / total) * 100, 2),
+            "model_success": round((ptype_counts["model_success"] / total) * 100, 2)
+        }
 
-# Write to JSON and CSV for distribution 2.
-json_out2 = os.path.join(output_folder, 'probability_error_type_vs_prompt_type.json')
-csv_out2 = os.path.join(output_folder, 'probability_error_type_vs_prompt_type.csv')
-with open(json_out2, 'w', encoding='utf-8') as f:
-    json.dump(error_type_vs_prompt_prob, f, indent=4)
-with open(csv_out2, 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow(["prompt_type", "error_type", "probability (%)"])
-    for ptype, error_probs in error_type_vs_prompt_prob.items():
-        for err, prob in error_probs.items():
-            writer.writerow([ptype, err, prob])
-
-# -------------------------------
-# 3. Probability distribution of complexity vs model_break_scenario.
-#    Only consider entries where complexity is not blank.
-complexity_break = defaultdict(lambda: {"total": 0, "model_failure": 0, "model_success": 0})
-
-for entry in data.values():
-    complexity = entry.get("complexity", "").strip()
-    if not complexity:
-        continue
-    mb = rename_model_break(entry.get("model_break_scenario"))
-    if mb not in ["model_failure", "model_success"]:
-        continue
-    complexity_break[complexity]["total"] += 1
-    complexity_break[complexity][mb] += 1
-
-complexity_break_prob = {}
-for comp, counts in complexity_break.items():
-    total = counts["total"]
-    complexity_break_prob[comp] = {
-        "model_failure": round((counts["model_failure"] / total) * 100, 2),
-        "model_success": round((counts["model_success"] / total) * 100, 2)
-    }
+    error_type_vs_prompt_prob = {}
+    for ptype, error_counts in counts["error_type"].items():
+        total = sum(error_counts.values())
+        error_type_vs_prompt_prob[ptype] = {
+            err: round((count / total) * 100, 2) for err, count in error_counts.items()
+        }
 
-# Write to JSON and CSV for distribution 3.
-json_out3 = os.path.join(output_folder, 'probability_complexity_vs_model_break.json')
-csv_out3 = os.path.join(output_folder, 'probability_complexity_vs_model_break.csv')
-with open(json_out3, 'w', encoding='utf-8') as f:
-    json.dump(complexity_break_prob, f, indent=4)
-with open(csv_out3, 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow(["complexity", "model_failure (%)", "model_success (%)"])
-    for comp, stats in complexity_break_prob.items():
-        writer.writerow([comp, stats["model_failure"], stats["model_success"]])
-
-# -------------------------------
-# 4. Probability distribution of topic vs model_break_scenario.
-#    Group by the renamed model break outcome and compute topic probabilities.
-topic_break = {"model_failure": defaultdict(int), "model_success": defaultdict(int)}
-topic_total = {"model_failure": 0, "model_success": 0}
-
-for entry in data.values():
-    topic = entry.get("topic", "").strip()
-    mb = rename_model_break(entry.get("model_break_scenario"))
-    if not topic or mb not in ["model_failure", "model_success"]:
-        continue
-    topic_break[mb][topic] += 1
-    topic_total[mb] += 1
-
-topic_break_prob = {"model_failure": {}, "model_success": {}}
-for mb in ["model_failure", "model_success"]:
-    total = topic_total[mb]
-    for topic, count in topic_break[mb].items():
-        topic_break_prob[mb][topic] = round((count / total) * 100, 2)
-
-# Write to JSON and CSV for distribution 4.
-json_out4 = os.path.join(output_folder, 'probability_topic_vs_model_break.json')
-csv_out4 = os.path.join(output_folder, 'probability_topic_vs_model_break.csv')
-with open(json_out4, 'w', encoding='utf-8') as f:
-    json.dump(topic_break_prob, f, indent=4)
-with open(csv_out4, 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow(["model_break", "topic", "probability (%)"])
-    for mb, topics in topic_break_prob.items():
-        for topic, prob in topics.items():
-            writer.writerow([mb, topic, prob])
-
-# -------------------------------
-# 5. Overall probability distribution for model_break outcomes.
-#    Compute total counts and percentages for model_failure and model_success.
-overall_counts = {"model_failure": 0, "model_success": 0, "total_count": 0}
-
-for entry in data.values():
-    mb = rename_model_break(entry.get("model_break_scenario"))
-    if mb not in ["model_failure", "model_success"]:
-        continue
-    overall_counts[mb] += 1
-    overall_counts["total_count"] += 1
-
-overall_distribution = {}
-if overall_counts["total_count"] > 0:
-    overall_distribution = {
-        "total_count": overall_counts["total_count"],
-        "model_failure": {
-            "count": overall_counts["model_failure"],
-            "percentage": round((overall_counts["model_failure"] / overall_counts["total_count"]) * 100, 2)
-        },
-        "model_success": {
-            "count": overall_counts["model_success"],
-            "percentage": round((overall_counts["model_success"] / overall_counts["total_count"]) * 100, 2)
+    complexity_break_prob = {}
+    for comp, comp_counts in counts["complexity"].items():
+        total = comp_counts["total"]
+        complexity_break_prob[comp] = {
+            "model_failure": round((comp_counts["model_failure"] / total) * 100, 2),
+            "model_success": round((comp_counts["model_success"] / total) * 100, 2)
+        }
+
+    topic_break_prob = {"model_failure": {}, "model_success": {}}
+    for mb in ["model_failure", "model_success"]:
+        total = sum(counts["topic"][mb].values())
+        for topic, count in counts["topic"][mb].items():
+            topic_break_prob[mb][topic] = round((count / total) * 100, 2)
+
+    # Compute total counts and percentages for model_failure and model_success.
+    overall_counts = counts["overall"]
+    overall_distribution = {}
+    if overall_counts["total_count"] > 0:
+        overall_distribution = {
+            "total_count": overall_counts["total_count"],
+            "model_failure": {
+                "count": overall_counts["model_failure"],
+                "percentage": round((overall_counts["model_failure"] / overall_counts["total_count"]) * 100, 2)
+            },
+            "model_success": {
+                "count": overall_counts["model_success"],
+                "percentage": round((overall_counts["model_success"] / overall_counts["total_count"]) * 100, 2)
+            }
         }
-    }
 
-# Write overall distribution to JSON.
-json_out5 = os.path.join(output_folder, 'overall_model_break_distribution.json')
-with open(json_out5, 'w', encoding='utf-8') as f:
-    json.dump(overall_distribution, f, indent=4)
+    return {
+        "prompt_type": prompt_type_break_prob,
+        "error_type": error_type_vs_prompt_prob,
+        "complexity": complexity_break_prob,
+        "topic": topic_break_prob,
+        "overall": overall_distribution,
+    }
 
-print("Files generated successfully in folder:", output_folder)
+def analyze_records(records):
+    """Compute all five probability distributions from an iterable of records in one pass."""
+    return compute_distributions(count_distributions(records))
+
+def analyze_file(input_path):
+    """
+    Compute all five probability distributions for a JSON or JSONL file.
+    JSONL files are counted in byte-range chunks and the counts merged.
+    """
+    if not is_jsonl(input_path):
+        return analyze_records(iter_records(input_path))
+
+    counts = count_distributions([])
+    for start, end in jsonl_byte_ranges(input_path):
+        merge_counts(counts, count_distributions(iter_jsonl_records(input_path, start, end)))
+    return compute_distributions(counts)
+
+def save_distributions(distributions, output_folder):
+    """Write the five distributions to JSON and CSV files in output_folder."""
+    # Write to JSON and CSV for distribution 1.
+    prompt_type_break_prob = distributions["prompt_type"]
+    write_json(prompt_type_break_prob, os.path.join(output_folder, 'model_break_scenario_by_prompt_type.json'))
+    write_csv(
+        os.path.join(output_folder, 'model_break_scenario_by_prompt_type.csv'),
+        ["prompt_type", "count", "model_failure (%)", "model_success (%)"],
+        ([ptype, stats["count"], stats["model_failure"], stats["model_success"]] for ptype, stats in prompt_type_break_prob.items()),
+    )
+
+    # Write to JSON and CSV for distribution 2.
+    error_type_vs_prompt_prob = distributions["error_type"]
+    write_json(error_type_vs_prompt_prob, os.path.join(output_folder, 'probability_error_type_vs_prompt_type.json'))
+    write_csv(
+        os.path.join(output_folder, 'probability_error_type_vs_prompt_type.csv'),
+        ["prompt_type", "error_type", "probability (%)"],
+        ([ptype, err, prob] for ptype, error_probs in error_type_vs_prompt_prob.items() for err, prob in error_probs.items()),
+    )
+
+    # Write to JSON and CSV for distribution 3.
+    complexity_break_prob = distributions["complexity"]
+    write_json(complexity_break_prob, os.path.join(output_folder, 'probability_complexity_vs_model_break.json'))
+    write_csv(
+        os.path.join(output_folder, 'probability_complexity_vs_model_break.csv'),
+        ["complexity", "model_failure (%)", "model_success (%)"],
+        ([comp, stats["model_failure"], stats["model_success"]] for comp, stats in complexity_break_prob.items()),
+    )
+
+    # Write to JSON and CSV for distribution 4.
+    topic_break_prob = distributions["topic"]
+    write_json(topic_break_prob, os.path.join(output_folder, 'probability_topic_vs_model_break.json'))
+    write_csv(
+        os.path.join(output_folder, 'probability_topic_vs_model_break.csv'),
+        ["model_break", "topic", "probability (%)"],
+        ([mb, topic, prob] for mb, topics in topic_break_prob.items() for topic, prob in topics.items()),
+    )
+
+    # Write overall distribution to JSON.
+    write_json(distributions["overall"], os.path.join(output_folder, 'overall_model_break_distribution.json'))
+
+def run_analysis(input_path, output_folder, profiler=None):
+    """
+    Compute the five distributions for one file and write them into output_folder.
+    With an enabled StageProfiler, a profile report is written there too.
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    input_bytes = os.path.getsize(input_path)
+    # An input named without a directory writes its outputs to the current one.
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+    # Records are counted as those with a model break outcome, the rows the distributions cover.
+    with profiler.stage("parse and count", unit="records with an outcome") as stage:
+        stage["bytes"] = input_bytes
+        distributions = analyze_file(input_path)
+        stage["records"] = distributions["overall"].get("total_count", 0)
+    with profiler.stage("write outputs", stage["records"], stage["unit"]):
+        save_distributions(distributions, output_folder)
+    print("Files generated successfully in folder:", output_folder)
+    report_path = profiler.write_report(output_folder, script="pgn_evals_analysis", input=str(input_path), input_bytes=input_bytes)
+    if report_path:
+        print("Profile report saved at:", report_path)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Model break probability distributions for a PGN evaluation export.")
+    parser.add_argument("file_path", nargs="?", help="Input JSON or JSONL file (prompted for if omitted).")
+    add_output_arguments(parser)
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_from_args(args)
+    # Prompt the user for the input JSON file path.
+    input_path = args.file_path or input("Enter the full path of the input JSON file: ").strip()
+
+    # Use the folder of the input file to store output files.
+    run_analysis(input_path, os.path.dirname(input_path), profiler=profiler_from_args(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,93 +1,97 @@
-import json
+import argparse
 import os
-import matplotlib.pyplot as plt
 import numpy as np
 
-# Ask for the JSON file path
-file_path = input("Enter the path to the JSON file: ").strip()
-
-# Load the JSON data
-with open(file_path, "r") as file:
-    data = json.load(file)
-
-# Extract relevant information
-categories = list(data.keys())  # X-axis labels
-success_rates = [data[cat]["model_success"] for cat in categories]
-failure_rates = [data[cat]["model_failure"] for cat in categories]
+from chart_render import ChartJob, render_jobs, use_headless_backend
+from outputs import read_json
 
 # Define colors
 success_color = "#2ECC71"  # Bright green
 failure_color = "#E74C3C"  # Bright red
 
-# Bar chart setup
-x = np.arange(len(categories))
-width = 0.6  # Bar width
-
-fig, ax = plt.subplots(figsize=(10, 6))
-
-# Plot stacked bars
-ax.bar(x, failure_rates, width, label="Model Failure", color=failure_color)
-ax.bar(x, success_rates, width, bottom=failure_rates, label="Model Success", color=success_color)
-
-# Formatting
-ax.set_xlabel("Prompt Type")
-ax.set_ylabel("Percentage")
-ax.set_title("Model Success and Failure by Prompt Type")
-ax.set_xticks(x)
-ax.set_xticklabels(categories, rotation=45, ha="right")
-ax.legend()
-
-# Save plot in the same folder as the input file
-output_path = os.path.join(os.path.dirname(file_path), "model_break_scenario_by_prompt_type.png")
-plt.tight_layout()
-plt.savefig(output_path, dpi=300)
-plt.show()
-
-print(f"Plot saved to: {output_path}")
-
-import json
-import os
-import matplotlib.pyplot as plt
-import numpy as np
-
-# Ask for the JSON file path
-file_path = input("Enter the path to the JSON file: ").strip()
-
-# Load the JSON data
-with open(file_path, "r") as file:
-    data = json.load(file)
-
-# Extract relevant information
-categories = list(data.keys())  # X-axis labels
-success_rates = [data[cat]["model_success"] for cat in categories]
-failure_rates = [data[cat]["model_failure"] for cat in categories]
-
-# Define colors
-success_color = "#2ECC71"  # Bright green
-failure_color = "#E74C3C"  # Bright red
-
-# Bar chart setup
-x = np.arange(len(categories))
-width = 0.6  # Bar width
-
-fig, ax = plt.subplots(figsize=(8, 5))
-
-# Plot stacked bars
-ax.bar(x, failure_rates, width, label="Model Failure", color=failure_color)
-ax.bar(x, success_rates, width, bottom=failure_rates, label="Model Success", color=success_color)
-
-# Formatting
-ax.set_xlabel("Difficulty Level")
-ax.set_ylabel("Percentage")
-ax.set_title("Model Success and Failure by Difficulty Level")
-ax.set_xticks(x)
-ax.set_xticklabels(categories, rotation=0, ha="center")
-ax.legend()
-
-# Save plot in the same folder as the input file
-output_path = os.path.join(os.path.dirname(file_path), "probability_complexity_vs_model_break.png")
-plt.tight_layout()
-plt.savefig(output_path, dpi=300)
-plt.show()
-
-print(f"Plot saved to: {output_path}")
+def plot_stacked_bars(file_path, output_path, figsize, xlabel, title, rotation, ha, show=False):
+    """
+    Plot model failure/success percentages from a distribution JSON as stacked bars.
+    plt.show() is only called when show is True (interactive use).
+    """
+    import matplotlib.pyplot as plt
+
+    # Load the JSON data (a compressed .gz/.zst output is found too)
+    data = read_json(file_path)
+
+    # Extract relevant information
+    categories = list(data.keys())  # X-axis labels
+    success_rates = [data[cat]["model_success"] for cat in categories]
+    failure_rates = [data[cat]["model_failure"] for cat in categories]
+
+    # Bar chart setup
+    x = np.arange(len(categories))
+    width = 0.6  # Bar width
+
+    fig, ax = plt.subplots(figsize=figsize)
+
+    # Plot stacked bars
+    ax.bar(x, failure_rates, width, label="Model Failure", color=failure_color)
+    ax.bar(x, success_rates, width, bottom=failure_rates, label="Model Success", color=success_color)
+
+    # Formatting
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel("Percentage")
+    ax.set_title(title)
+    ax.set_xticks(x)
+    ax.set_xticklabels(categories, rotation=rotation, ha=ha)
+    ax.legend()
+
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300)
+    if show:
+        plt.show()
+    plt.close(fig)
+
+    print(f"Plot saved to: {output_path}")
+    return output_path
+
+def prompt_type_chart_job(file_path, output_dir=None):
+    """Stacked bars for model_break_scenario_by_prompt_type.json; saved next to the input by default."""
+    output_dir = output_dir or os.path.dirname(file_path)
+    output_path = os.path.join(output_dir, "model_break_scenario_by_prompt_type.png")
+    return ChartJob(plot_stacked_bars, (file_path, output_path, (10, 6), "Prompt Type", "Model Success and Failure by Prompt Type", 45, "right"))
+
+def complexity_chart_job(file_path, output_dir=None):
+    """Stacked bars for probability_complexity_vs_model_break.json; saved next to the input by default."""
+    output_dir = output_dir or os.path.dirname(file_path)
+    output_path = os.path.join(output_dir, "probability_complexity_vs_model_break.png")
+    return ChartJob(plot_stacked_bars, (file_path, output_path, (8, 5), "Difficulty Level", "Model Success and Failure by Difficulty Level", 0, "center"))
+
+def plot_prompt_type_chart(file_path, output_dir=None, show=False):
+    job = prompt_type_chart_job(file_path, output_dir)
+    return job.render(*job.args, show=show)
+
+def plot_complexity_chart(file_path, output_dir=None, show=False):
+    job = complexity_chart_job(file_path, output_dir)
+    return job.render(*job.args, show=show)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stacked model success/failure bar charts by prompt type and by difficulty level.")
+    parser.add_argument("prompt_type_json", nargs="?", help="model_break_scenario_by_prompt_type.json (prompted for if omitted).")
+    parser.add_argument("complexity_json", nargs="?", help="probability_complexity_vs_model_break.json (prompted for if omitted).")
+    parser.add_argument("--no-show", dest="show", action="store_false", help="Only save the charts, rendering headless in parallel; never open a window.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Ask for the JSON file path
+    prompt_type_json = args.prompt_type_json or input("Enter the path to the JSON file: ").strip()
+    if args.show:
+        plot_prompt_type_chart(prompt_type_json, show=True)
+
+    complexity_json = args.complexity_json or input("Enter the path to the JSON file: ").strip()
+    if args.show:
+        plot_complexity_chart(complexity_json, show=True)
+        return
+
+    use_headless_backend()
+    render_jobs([prompt_type_chart_job(prompt_type_json), complexity_chart_job(complexity_json)], workers=2)
+
+if __name__ == "__main__":
+    main()
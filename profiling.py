@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# resource is Unix-only; on other platforms the RSS figures are reported as null.
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPORT_FILE_NAME = "profile_report.json"
+
+
+def peak_rss_bytes():
+    """High-water mark of this process's resident memory, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageProfiler:
+    """
+    Record wall time, throughput and memory for the named stages of a run.
+    A disabled profiler costs one context manager per stage and records nothing,
+    so entry points can time their stages unconditionally.
+    """
+
+    def __init__(self, enabled=True, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.stages = []
+        self.started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.start_time = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, records=None, unit="records"):
+        """
+        Time the body as one stage. The yielded dict is the stage's entry, so the
+        body can fill in "records" (or "bytes") once it knows how many it processed.
+        """
+        entry = {"stage": name, "records": records, "unit": unit}
+        if not self.enabled:
+            yield entry
+            return
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            seconds = time.perf_counter() - start_time
+            entry["seconds"] = round(seconds, 4)
+            if entry["records"] is not None:
+                entry["records_per_s"] = round(entry["records"] / seconds, 1) if seconds > 0 else None
+            if entry.get("bytes") is not None:
+                entry["mb_per_s"] = round(entry["bytes"] / seconds / 1e6, 2) if seconds > 0 else None
+            if self.trace_memory:
+                entry["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+            entry["peak_rss_bytes"] = peak_rss_bytes()
+            self.stages.append(entry)
+
+    def report(self, **details):
+        """The run's stages plus `details` (script, input, ...) as a JSON-serialisable dict."""
+        return {
+            **details,
+            "started": self.started,
+            "total_seconds": round(time.perf_counter() - self.start_time, 4),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "tracemalloc": self.trace_memory,
+            "stages": self.stages,
+        }
+
+    def write_report(self, output_dir, **details):
+        """Write the report as profile_report.json in output_dir; returns its path, or None if disabled."""
+        if not self.enabled:
+            return None
+        report_path = os.path.join(output_dir, REPORT_FILE_NAME)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(**details), f, indent=4)
+        return report_path
+
+
+def add_profile_arguments(parser):
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Write per-stage wall time, throughput and peak memory to {REPORT_FILE_NAME} next to the outputs.",
+    )
+    parser.add_argument(
+        "--profile-tracemalloc",
+        action="store_true",
+        help="With --profile, also record each stage's peak Python allocations (slows the run down).",
+    )
+
+
+def profiler_from_args(args):
+    return StageProfiler(args.profile or args.profile_tracemalloc, args.profile_tracemalloc)
@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from benchmark_model_analysis import CUBE_SPECS, build_count_cube, failure_percentages_from_counts, normalize_label
+from count_cube import CountCube
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Requests larger than this are rejected before they are parsed.
+MAX_REQUEST_BYTES = 64 * 1024
+
+# Axes a query can filter on; the cube's failure axis is summed or kept by the endpoints.
+FILTER_AXES = ("model", *CUBE_SPECS)
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+def load_counts(file_paths, use_cache=False):
+    """
+    One CountCube over every input, in the order given: saved cubes (.npz) are
+    loaded as they are and exports are ingested.
+    """
+    cubes = [
+        CountCube.load(file_path) if str(file_path).endswith(".npz") else build_count_cube([file_path], use_cache=use_cache)
+        for file_path in file_paths
+    ]
+    return CountCube.merge(cubes)
+
+
+def failure_rate(cube, filters):
+    """Failure counts and percentage over the (evaluation, prompt) pairs matching the filters."""
+    counts, _, (labels,) = cube.reduce(("failure",), filters)
+    by_label = dict(zip(labels, counts.tolist()))
+    yes, no = by_label.get("yes", 0), by_label.get("no", 0)
+    total = yes + no
+    return {"yes": yes, "no": no, "total": total, "failure_percent": round(yes / total * 100, 2) if total else 0}
+
+
+def distribution(cube, by, filters):
+    """
+    {model_id: {label: {'yes': n, 'no': n}}} of the matching pairs grouped by the
+    `by` axis, with models and labels in first-seen order like distribution_from_columns.
+    """
+    return {
+        model_id: {label: {"yes": counts.get("yes", 0), "no": counts.get("no", 0)} for label, counts in labels.items()}
+        for model_id, labels in cube.marginal(("model", by, "failure"), filters).items()
+    }
+
+
+def failure_distribution(cube, by, filters):
+    """The distribution grouped by the `by` axis, in the shape save_failure_distribution_to_json writes."""
+    nested = {}
+    for model_id, labels in distribution(cube, by, filters).items():
+        nested[model_id] = {
+            "model failure": {label: counts.get("yes", 0) for label, counts in labels.items()},
+            "model success": {label: counts.get("no", 0) for label, counts in labels.items()},
+        }
+    return nested
+
+
+def conditional_distribution(cube, by, filters):
+    """
+    P(label | failure) per model as percentages, in the shape
+    save_conditional_failure_distribution writes (labels sorted).
+    """
+    counts = distribution(cube, by, filters)
+    labels = sorted({label for model_labels in counts.values() for label in model_labels})
+    conditional = {}
+    for model_id, model_labels in counts.items():
+        failures = [model_labels.get(label, {}).get("yes", 0) for label in labels]
+        total_failures = sum(failures)
+        conditional[model_id] = {
+            label: round(count / total_failures * 100, 2) if total_failures > 0 else 0
+            for label, count in zip(labels, failures)
+        }
+    return conditional
+
+
+def query_filters(params):
+    """
+    The axis filters of a query string: repeated or comma-separated model, subject,
+    complexity and prompt_type values, normalized like the analysis labels.
+    """
+    filters = {}
+    for axis in FILTER_AXES:
+        if axis in params:
+            values = [value for values in params[axis] for value in values.split(",") if value]
+            filters[axis] = values if axis == "model" else [normalize_label(value) for value in values]
+    return filters
+
+
+def group_by_axis(params, default):
+    by = params.get("by", [default])[-1]
+    if by not in CUBE_SPECS:
+        raise ValueError(f"'by' must be one of: {', '.join(CUBE_SPECS)}")
+    return by
+
+
+def handle_request(cube, method, target):
+    """
+    Answer one request against the loaded count cube. Returns (status, payload).
+
+    GET /                      inputs, row count and the endpoints
+    GET /labels                every model, subject, complexity and prompt type label
+    GET /failure-percentages   overall failure percentage per model (failure_percentages.json)
+    GET /failure-rate          failure rate of the pairs matching the filters
+    GET /distribution?by=      yes/no counts per model and subject, complexity or prompt_type (model_failure_distribution.json)
+    GET /conditional?by=       P(complexity, subject or prompt_type | failure) per model (conditional_failure_distribution.json)
+
+    Filters: model=, subject=, complexity=, prompt_type= (repeat a parameter or separate values with commas).
+    """
+    if method not in ("GET", "HEAD"):
+        return 405, {"error": f"Method {method} is not allowed"}
+    url = urlsplit(target)
+    params = parse_qs(url.query)
+    path = url.path.rstrip("/") or "/"
+    try:
+        if path == "/":
+            return 200, {
+                "inputs": cube.inputs,
+                "rows": cube.rows,
+                "endpoints": ["/labels", "/failure-percentages", "/failure-rate", "/distribution", "/conditional"],
+                "filters": list(FILTER_AXES),
+            }
+        if path == "/labels":
+            return 200, {axis: cube.vocabularies[axis] for axis in FILTER_AXES}
+        if path == "/failure-percentages":
+            return 200, failure_percentages_from_counts(cube.model_counts)
+        if path == "/failure-rate":
+            return 200, failure_rate(cube, query_filters(params))
+        if path == "/distribution":
+            return 200, failure_distribution(cube, group_by_axis(params, "subject"), query_filters(params))
+        if path == "/conditional":
+            return 200, conditional_distribution(cube, group_by_axis(params, "complexity"), query_filters(params))
+    except ValueError as e:
+        return 400, {"error": str(e)}
+    return 404, {"error": f"No such endpoint: {path}"}
+
+
+async def read_request(reader):
+    """Read one request head; returns (method, target, headers) or None at end of stream."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("iso-8859-1").split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    # Request bodies are not used by any endpoint; drain them to keep the connection in sync.
+    length = int(headers.get("content-length", 0) or 0)
+    if length:
+        await reader.readexactly(length)
+    return method, target, headers
+
+
+def encode_response(status, payload, keep_alive, head_only=False):
+    body = json.dumps(payload, indent=4).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    ).encode("ascii")
+    return head if head_only else head + body
+
+
+async def handle_connection(cube, reader, writer):
+    """Serve requests on one connection until the client closes it or asks to."""
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except asyncio.LimitOverrunError:
+                writer.write(encode_response(413, {"error": "Request too large"}, keep_alive=False))
+                break
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            except ValueError:
+                writer.write(encode_response(400, {"error": "Malformed request"}, keep_alive=False))
+                break
+            method, target, headers = request
+            keep_alive = headers.get("connection", "").lower() != "close"
+            start_time = time.perf_counter()
+            status, payload = handle_request(cube, method, target)
+            writer.write(encode_response(status, payload, keep_alive, head_only=method == "HEAD"))
+            await writer.drain()
+            print(f"{method} {target} {status} {(time.perf_counter() - start_time) * 1000:.1f}ms")
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+
+async def serve(cube, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(cube, reader, writer), host, port, limit=MAX_REQUEST_BYTES
+    )
+    address = server.sockets[0].getsockname()
+    print(f"Serving {cube.rows} evaluation rows from {len(cube.inputs)} export(s) on http://{address[0]}:{address[1]}/")
+    async with server:
+        await server.serve_forever()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Answer failure distribution queries over benchmark exports from memory, over HTTP on localhost.")
+    parser.add_argument("file_paths", nargs="+", help="Benchmark exports (JSON or JSONL) or saved count cubes (.npz) to load.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on (localhost only by default).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument("--cache", action="store_true", help="Read the parsed, coded form of each export from the on-disk input cache.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    missing = [path for path in args.file_paths if not os.path.isfile(path)]
+    if missing:
+        print(f"Error: no such file: {', '.join(missing)}")
+        return 1
+
+    start_time = time.perf_counter()
+    try:
+        cube = load_counts(args.file_paths, use_cache=args.cache)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Loaded {len(args.file_paths)} input(s) in {time.perf_counter() - start_time:.2f}s")
+    try:
+        asyncio.run(serve(cube, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
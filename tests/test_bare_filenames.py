@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from benchmark_suite import generate_pgn_records, write_records
+
+REPO = Path(__file__).resolve().parents[1]
+
+
+@pytest.mark.parametrize(
+    "script, outputs",
+    [
+        ("pgn_evals_analysis.py", ["overall_model_break_distribution.json"]),
+        ("model_json_analysis.py", ["model_break_scenario_by_complexity.csv", "error_type_by_prompt_type.json"]),
+    ],
+)
+def test_bare_filename_writes_next_to_input(tmp_path, script, outputs):
+    """Run from the input's own directory with a bare file name, as the scripts were used before the batch driver."""
+    write_records(generate_pgn_records(200), tmp_path / "data.json", keyed=True)
+    env = {**os.environ, "MPLBACKEND": "Agg"}
+    result = subprocess.run(
+        [sys.executable, str(REPO / script), "data.json"], cwd=tmp_path, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    for name in outputs:
+        assert (tmp_path / name).is_file(), f"{name} missing; stdout: {result.stdout}"
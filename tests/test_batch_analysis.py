@@ -0,0 +1,12 @@
+import json
+
+import batch_analysis
+
+
+def test_filter_errors_count_as_batch_errors(tmp_path, capsys):
+    """filter_language rejects a keyed-object export; the batch must report it and exit non-zero."""
+    export = tmp_path / "keyed.json"
+    export.write_text(json.dumps({"a": {"modelResponses": []}}), encoding="utf-8")
+    status = batch_analysis.main([str(export), "--analyses", "filter", "--workers", "1", "--output-dir", str(tmp_path / "out")])
+    assert status == 1
+    assert "1 with errors" in capsys.readouterr().out
@@ -0,0 +1,17 @@
+import pytest
+
+import benchmark_model_analysis
+from benchmark_model_analysis import aggregate_file
+from benchmark_suite import generate_benchmark_export, write_records
+
+
+@pytest.mark.parametrize("keyed, jsonl", [(False, False), (True, False), (False, True)])
+def test_parallel_shards_match_one_scan(tmp_path, monkeypatch, keyed, jsonl):
+    """Workers parse their own shards of JSON and JSONL exports; merged in file order, the tables equal one scan."""
+    path = tmp_path / ("export.jsonl" if jsonl else "export.json")
+    records = generate_benchmark_export(2000)
+    if keyed:
+        records = ((entry["conversationId"], entry) for entry in records)
+    write_records(records, path, keyed=keyed, jsonl=jsonl)
+    monkeypatch.setattr(benchmark_model_analysis, "MIN_SHARD_BYTES", 64 << 10)
+    assert aggregate_file(path, workers=3) == aggregate_file(path)
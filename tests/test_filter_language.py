@@ -0,0 +1,27 @@
+import pytest
+
+import filter_language
+import outputs
+from benchmark_suite import generate_filter_conversations, write_records
+from filter_language import filter_conversations
+
+
+@pytest.mark.parametrize("jsonl", [False, True])
+@pytest.mark.parametrize("compact", [False, True])
+def test_parallel_shards_write_the_same_outputs(tmp_path, monkeypatch, jsonl, compact):
+    """Workers parse, classify and serialize their own shards; the outputs must match one process byte for byte."""
+    path = tmp_path / ("input.jsonl" if jsonl else "input.json")
+    write_records(generate_filter_conversations(3000), path, jsonl=jsonl)
+    monkeypatch.setattr(outputs, "_settings", outputs.OutputSettings(compact, None, None))
+    monkeypatch.setattr(filter_language, "MIN_SHARD_BYTES", 16 << 10)
+    filter_conversations(path, workers=1, output_dir=tmp_path / "serial")
+    filter_conversations(path, workers=3, output_dir=tmp_path / "parallel")
+    for serial in (tmp_path / "serial").iterdir():
+        assert (tmp_path / "parallel" / serial.name).read_bytes() == serial.read_bytes()
+
+
+def test_parallel_shards_reject_an_object_root(tmp_path):
+    path = tmp_path / "input.json"
+    path.write_text("{\"a\": {}}", encoding="utf-8")
+    with pytest.raises(ValueError):
+        filter_conversations(path, workers=2, output_dir=tmp_path / "out")
@@ -0,0 +1,22 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from input_cache import load_cached, store_cached
+
+
+def store_and_load(file_path, cache_dir, run):
+    store_cached(file_path, "test", {"codes": np.arange(100_000)}, {"run": run}, cache_dir=cache_dir)
+    arrays, _ = load_cached(file_path, "test", cache_dir=cache_dir)
+    return int(arrays["codes"].sum())
+
+
+def test_concurrent_stores_of_one_input(tmp_path):
+    """Batch workers caching the same input at once must neither crash nor leave staging directories behind."""
+    file_path = tmp_path / "export.json"
+    file_path.write_text("[]", encoding="utf-8")
+    cache_dir = tmp_path / "cache"
+    with ProcessPoolExecutor(max_workers=8) as pool:
+        sums = list(pool.map(store_and_load, [file_path] * 12, [cache_dir] * 12, range(12)))
+    assert sums == [sum(range(100_000))] * 12
+    assert sorted(path.name for path in cache_dir.iterdir() if path.is_dir()) == [next(cache_dir.glob("test-*")).name]
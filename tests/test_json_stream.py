@@ -0,0 +1,85 @@
+import json
+import random
+
+import pytest
+
+import json_stream
+from json_stream import iter_json_array, iter_json_element_ranges, iter_json_object, iter_json_range_records
+
+
+def random_value(rng, depth=0):
+    """A random JSON value, heavy on numbers with fractions, exponents and signs."""
+    kind = rng.randrange(8 if depth < 3 else 5)
+    if kind == 0:
+        return rng.randint(-10**6, 10**6)
+    if kind == 1:
+        return round(rng.uniform(-1000, 1000), rng.randint(0, 6))
+    if kind == 2:
+        return float(f"{rng.uniform(-10, 10):.3f}e{rng.randint(-30, 30)}")
+    if kind == 3:
+        return rng.choice(["", "a", "é中", "line\nbreak", "quote \" and \\ backslash", "},{", "\\\\\"],[", "\\", True, False, None])
+    if kind == 4:
+        return rng.choice([0, -0.5, 1e300, -2e-300])
+    if kind == 5:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {f"k{index}": random_value(rng, depth + 1) for index in range(rng.randint(0, 4))}
+
+
+def dump(value, rng):
+    """JSON text of value, with random whitespace and exponent styles so tokens fall on every boundary."""
+    text = json.dumps(value, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1]))
+    return text.replace("e+", rng.choice(["e+", "E+", "e"]))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_chunk_boundaries_match_json_loads(tmp_path, seed):
+    rng = random.Random(seed)
+    elements = [random_value(rng) for _ in range(rng.randint(0, 30))]
+    path = tmp_path / "array.json"
+    path.write_text(dump(elements, rng), encoding="utf-8")
+    expected = json.loads(path.read_text(encoding="utf-8"))
+    for chunk_size in range(1, 24):
+        assert list(iter_json_array(path, chunk_size=chunk_size)) == expected
+
+    keyed = {f"id{index}": value for index, value in enumerate(elements)}
+    path.write_text(dump(keyed, rng), encoding="utf-8")
+    expected = json.loads(path.read_text(encoding="utf-8"))
+    for chunk_size in range(1, 24):
+        assert dict(iter_json_object(path, chunk_size=chunk_size)) == expected
+
+
+@pytest.mark.parametrize("text", ["[12.5, 3]", "[-1e5,2E-3]", "[1.5e+10]", "[0, -0.25]"])
+def test_numbers_split_after_dot_exponent_or_sign(tmp_path, text):
+    path = tmp_path / "numbers.json"
+    path.write_text(text, encoding="utf-8")
+    for chunk_size in range(1, len(text) + 1):
+        assert list(iter_json_array(path, chunk_size=chunk_size)) == json.loads(text)
+
+
+def range_records(path, chunk_bytes):
+    return [record for start, end in iter_json_element_ranges(path, chunk_bytes) for record in iter_json_range_records(path, start, end)]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_element_ranges_match_json_loads(tmp_path, monkeypatch, seed):
+    """Ranges must split only between top-level elements, whatever the strings hold and wherever scan blocks end."""
+    rng = random.Random(seed)
+    elements = [random_value(rng) for _ in range(rng.randint(0, 30))]
+    keyed = {f"id{index}": value for index, value in enumerate(elements)}
+    path = tmp_path / "records.json"
+    for root in (elements, keyed):
+        path.write_text(" " * rng.randint(0, 3) + dump(root, rng) + "\n", encoding="utf-8")
+        expected = json.loads(path.read_text(encoding="utf-8"))
+        expected = list(expected.values()) if isinstance(expected, dict) else expected
+        for block_bytes in (1, 2, 3, 7, 64, 1 << 20):
+            monkeypatch.setattr(json_stream, "SCAN_BLOCK_BYTES", block_bytes)
+            for chunk_bytes in (1, 10, 100, 1 << 20):
+                assert range_records(path, chunk_bytes) == expected
+
+
+@pytest.mark.parametrize("text", ["[1, 2] 3", "[1, 2", "[1, 2,]", '"text"', "[1, 2]]", '{"a": 1,}'])
+def test_element_ranges_reject_malformed_roots(tmp_path, text):
+    path = tmp_path / "bad.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError):
+        range_records(path, 1)
@@ -0,0 +1,41 @@
+import os
+
+from benchmark_model_analysis import aggregate_records
+from benchmark_suite import generate_benchmark_export, write_records
+from watch_exports import RunningAnalysis
+
+
+def conversations(prefix, count, seed=0):
+    """Generated benchmark conversations with ids unique to prefix."""
+    return [{**entry, "conversationId": f"{prefix}{index}"} for index, entry in enumerate(generate_benchmark_export(count, seed))]
+
+
+def test_appended_lines_are_folded_in(tmp_path):
+    export = tmp_path / "export.jsonl"
+    first, second = conversations("a", 300), conversations("b", 100, seed=1)
+    write_records(first, export, jsonl=True)
+    analysis = RunningAnalysis(tmp_path / "out", charts=False)
+    assert analysis.fold([export]) == 300
+
+    with open(export, "a", encoding="utf-8") as f:
+        write_records(second, tmp_path / "more.jsonl", jsonl=True)
+        f.write((tmp_path / "more.jsonl").read_text(encoding="utf-8"))
+    assert analysis.fold([export]) == 100
+    assert analysis.counts == aggregate_records(first + second)
+
+
+def test_replaced_larger_export_is_read_from_the_start(tmp_path):
+    export = tmp_path / "export.jsonl"
+    write_records(conversations("a", 300), export, jsonl=True)
+    analysis = RunningAnalysis(tmp_path / "out", charts=False)
+    assert analysis.fold([export]) == 300
+
+    # Rotated: a different, larger file moved into place under the same name.
+    write_records(conversations("b", 1000, seed=1), tmp_path / "next.jsonl", jsonl=True)
+    os.replace(tmp_path / "next.jsonl", export)
+    assert analysis.fold([export]) == 1000
+
+    # Re-exported in place: same inode, different and larger content.
+    write_records(conversations("c", 300, seed=2) + conversations("a", 300), export, jsonl=True)
+    assert analysis.fold([export]) == 300
+    assert len(analysis.seen_keys) == 1600
@@ -0,0 +1,369 @@
+import argparse
+import copy
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+from benchmark_model_analysis import (
+    STATE_FILE_NAME,
+    aggregate_records,
+    conditional_failure_percentages,
+    failure_percentages_from_counts,
+    iter_new_records,
+    load_aggregate_state,
+    merge_failure_counts,
+    save_aggregate_state,
+    save_conditional_failure_distribution,
+    save_failure_distribution_to_csv_complexity,
+    save_failure_distribution_to_csv_subject,
+    save_failure_distribution_to_json,
+    save_failure_intervals,
+    save_failure_percentages_to_json,
+)
+from chart_render import use_headless_backend
+from intervals import add_interval_arguments, interval_settings_from_args
+from json_stream import JSONL_EXTENSIONS, is_jsonl, iter_json_records, iter_jsonl_records
+from outputs import add_output_arguments, configure_from_args
+
+# Files in the drop directory treated as exports; anything else (partial downloads, notes) is ignored.
+EXPORT_EXTENSIONS = (".json", *JSONL_EXTENSIONS)
+
+# inotify events of a file that was closed after writing or moved into the directory,
+# and of the kernel's event queue overflowing.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# Seconds a burst of deliveries is given to finish before the outputs are refreshed.
+SETTLE_SECONDS = 1.0
+
+DEFAULT_POLL_SECONDS = 5.0
+
+# Bytes at the end of the already read part of a JSONL export that are hashed to
+# tell an append from a replacement by a different, larger file.
+RESUME_CHECK_BYTES = 64 * 1024
+
+
+class DropDirectory:
+    """
+    The size and modification time of every export in a directory when it was
+    last read, to tell which exports are new or changed since.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.signatures = {}
+        # Signatures seen by the last polling scan that have not held still yet.
+        self.pending = {}
+
+    def scan(self, names=None, settle=False):
+        """
+        The exports among `names` (default: the whole directory) that are new or
+        changed since they were last returned, oldest first. With settle, an
+        export is only returned once two consecutive scans saw the same size and
+        modification time, so a file still being written is left for a later scan.
+        """
+        if names is None:
+            names = os.listdir(self.directory)
+        changed = []
+        for name in set(names):
+            if not name.lower().endswith(EXPORT_EXTENSIONS):
+                continue
+            path = self.directory / name
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if not path.is_file():
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == self.signatures.get(name):
+                self.pending.pop(name, None)
+                continue
+            if settle and self.pending.get(name) != signature:
+                self.pending[name] = signature
+                continue
+            self.pending.pop(name, None)
+            self.signatures[name] = signature
+            changed.append((signature[0], name, path))
+        return [path for _, _, path in sorted(changed)]
+
+
+def open_inotify(directory):
+    """
+    An inotify file descriptor reporting exports finished or moved into
+    directory, or None where inotify is unavailable (anything but Linux).
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def read_inotify_names(fd):
+    """
+    The file names of the pending inotify events, or None if the kernel dropped
+    events and the whole directory has to be rescanned.
+    """
+    data = os.read(fd, 64 * 1024)
+    names = []
+    offset = 0
+    while offset < len(data):
+        _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+        offset += INOTIFY_EVENT.size
+        if mask & IN_Q_OVERFLOW:
+            return None
+        name = data[offset:offset + length].rstrip(b"\0")
+        offset += length
+        if name:
+            names.append(os.fsdecode(name))
+    return names
+
+
+def iter_changes(drop, poll_seconds=DEFAULT_POLL_SECONDS, polling=False):
+    """
+    Yield the lists of exports that land in or change in the drop directory,
+    forever. inotify wakes the watch as soon as a file is written or moved in;
+    without it (or with polling) the directory is scanned every poll_seconds.
+    """
+    fd = None if polling else open_inotify(drop.directory)
+    if fd is None:
+        print(f"Polling {drop.directory} every {poll_seconds:g}s.")
+    else:
+        print(f"Watching {drop.directory} with inotify.")
+    try:
+        while True:
+            if fd is None:
+                time.sleep(poll_seconds)
+                changed = drop.scan(settle=True)
+            else:
+                select.select([fd], [], [])
+                names = read_inotify_names(fd)
+                # Gather the rest of a burst of deliveries into one refresh.
+                while names is not None and select.select([fd], [], [], SETTLE_SECONDS)[0]:
+                    more = read_inotify_names(fd)
+                    names = None if more is None else names + more
+                changed = drop.scan(names)
+            if changed:
+                yield changed
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+def _tail_digest(path, offset):
+    """Hash of the RESUME_CHECK_BYTES bytes of a file before offset."""
+    start = max(offset - RESUME_CHECK_BYTES, 0)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+
+class RunningAnalysis:
+    """
+    The benchmark count tables of every conversation read so far. New exports are
+    folded in without rereading old ones, and only the outputs whose numbers
+    changed are rewritten. The tables live in the same aggregate state as
+    benchmark_model_analysis.py --incremental, so a restarted watch (or an
+    incremental run) picks up where the last one stopped.
+    """
+
+    def __init__(self, output_directory, charts=True, intervals=None):
+        self.output_directory = Path(output_directory)
+        self.output_directory.mkdir(parents=True, exist_ok=True)
+        self.charts = charts
+        self.intervals = intervals
+        self.state_file = self.output_directory / STATE_FILE_NAME
+        self.counts, self.seen_keys = load_aggregate_state(self.state_file)
+        # (inode, bytes read, hash of their tail) of each JSONL export; appended lines are read from there on.
+        self.jsonl_offsets = {}
+        # The numbers behind the outputs on disk, or None before they are first written.
+        self.written = None
+
+    def _records(self, path):
+        """
+        The records of an export not read before, and the JSONL resume point to
+        remember once they are counted. A JSONL export that is the same file with
+        the same bytes where the last read ended is read from there on; anything
+        else (a new, shrunk, rotated or re-exported file) is read from the start,
+        and conversations counted before are dropped by key.
+        """
+        if not is_jsonl(path):
+            return iter_json_records(path), None
+        stat = os.stat(path)
+        size = stat.st_size
+        start = 0
+        known = self.jsonl_offsets.get(path)
+        if known is not None:
+            inode, offset, digest = known
+            if inode == stat.st_ino and offset <= size and _tail_digest(path, offset) == digest:
+                start = offset
+        return iter_jsonl_records(path, start, size), (stat.st_ino, size, _tail_digest(path, size))
+
+    def fold(self, paths):
+        """
+        Add the conversations of the given exports that were not counted before.
+        An export that cannot be read is reported and skipped; it is read again
+        once it changes. Returns the number of conversations added.
+        """
+        added = 0
+        for path in paths:
+            # Keys are collected per file and only kept once the whole file has been counted.
+            file_keys = set()
+            try:
+                records, resume = self._records(path)
+                partial = aggregate_records(iter_new_records(records, file_keys, self.seen_keys))
+            except (OSError, ValueError) as e:
+                print(f"Error: could not read {path}: {e}")
+                continue
+            merge_failure_counts(self.counts, partial)
+            self.seen_keys |= file_keys
+            if resume is not None:
+                self.jsonl_offsets[path] = resume
+            added += len(file_keys)
+            print(f"Added {len(file_keys)} new conversations from {path}.")
+        if added:
+            save_aggregate_state(self.state_file, self.counts, self.seen_keys)
+        return added
+
+    def tables(self):
+        """The numbers behind each group of outputs, copied so later folds do not change them."""
+        model_counts, distributions = self.counts
+        tables = {
+            "failure percentages": failure_percentages_from_counts(model_counts),
+            "subject distribution": distributions["subject"],
+            "complexity distribution": distributions["complexity"],
+            "conditional distribution": conditional_failure_percentages(distributions["complexity"]),
+        }
+        if self.intervals is not None:
+            tables["intervals"] = self.counts
+        return copy.deepcopy(tables)
+
+    def refresh(self):
+        """Rewrite the outputs whose numbers changed since they were last written; returns their group names."""
+        if not self.counts[0]:
+            return []
+        tables = self.tables()
+        changed = [name for name, table in tables.items() if self.written is None or self.written.get(name) != table]
+        for name in changed:
+            self._write(name, tables)
+        self.written = tables
+        return changed
+
+    def _write(self, name, tables):
+        output_directory = self.output_directory
+        if name == "failure percentages":
+            save_failure_percentages_to_json(tables[name], output_directory / "failure_percentages.json")
+        elif name == "subject distribution":
+            save_failure_distribution_to_json(tables[name], output_directory / "model_failure_distribution.json")
+            save_failure_distribution_to_csv_subject(
+                tables[name],
+                output_directory / "model_failure_distribution_by_subject.csv",
+                output_directory / "model_failure_distribution_by_subject.json",
+            )
+        elif name == "complexity distribution":
+            save_failure_distribution_to_csv_complexity(
+                tables[name],
+                output_directory / "model_failure_distribution_by_complexity.csv",
+                output_directory / "model_failure_distribution_by_complexity.json",
+            )
+        elif name == "conditional distribution":
+            save_conditional_failure_distribution(
+                tables["complexity distribution"],
+                output_directory / "conditional_failure_distribution.csv",
+                output_directory / "conditional_failure_distribution.json",
+                output_directory / "conditional_failure_distribution_chart.png" if self.charts else None,
+            )
+        elif name == "intervals":
+            model_counts, distributions = tables[name]
+            save_failure_intervals(model_counts, distributions, self.intervals, output_directory)
+
+    def update(self, paths):
+        """Fold in the given exports and refresh the outputs."""
+        start_time = time.perf_counter()
+        added = self.fold(paths)
+        changed = self.refresh()
+        print(
+            f"Read {len(paths)} export(s): {added} new conversations, "
+            f"rewrote {', '.join(changed) or 'no outputs'} in {time.perf_counter() - start_time:.2f}s"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Watch a drop directory for benchmark exports and keep the benchmark outputs up to date as they land."
+    )
+    parser.add_argument("directory", help="Directory the JSON/JSONL exports are delivered to.")
+    parser.add_argument("--output-dir", help="Where the outputs are written (default: benchmarking_data/ inside the directory).")
+    parser.add_argument("--poll", action="store_true", help="Scan the directory periodically instead of using inotify.")
+    parser.add_argument(
+        "--poll-interval", type=float, default=DEFAULT_POLL_SECONDS, help="Seconds between scans when polling."
+    )
+    parser.add_argument("--once", action="store_true", help="Fold in the exports already there, refresh the outputs and exit.")
+    parser.add_argument("--workers", type=int, default=1, help="Ignored: new conversations are picked out in one process.")
+    parser.add_argument(
+        "--no-charts",
+        dest="charts",
+        action="store_false",
+        help="Write the JSON/CSV outputs only, without loading matplotlib.",
+    )
+    add_output_arguments(parser)
+    add_interval_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_from_args(args)
+    if not os.path.isdir(args.directory):
+        print("Error: The specified directory does not exist.")
+        return 1
+    if args.poll_interval <= 0:
+        print("Error: --poll-interval must be positive.")
+        return 1
+    if args.workers > 1:
+        print("Warning: new conversations are picked out as they are read, in one process; --workers is ignored.")
+
+    try:
+        intervals = interval_settings_from_args(args)
+        analysis = RunningAnalysis(
+            args.output_dir or Path(args.directory) / "benchmarking_data", args.charts, intervals
+        )
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    if args.charts:
+        # The chart is redrawn for as long as the watch runs; never open a window.
+        use_headless_backend()
+
+    drop = DropDirectory(args.directory)
+    analysis.update(drop.scan())
+    if args.once:
+        return 0
+    try:
+        for paths in iter_changes(drop, args.poll_interval, polling=args.poll):
+            analysis.update(paths)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())